@@ -0,0 +1,105 @@
+"""
+Runs the benchmark suite (see benchmarks/suite.py) and writes its results
+to a JSON file.
+
+Run from the project directory:
+    python3 -m benchmarks --sizes 10k,1m --output results.json
+    python3 -m benchmarks --sizes 10k --compare results.json
+"""
+import argparse
+import json
+import os
+import tempfile
+from typing import List
+from benchmarks.suite import HANDLERS, Result, compare_results, \
+    get_metadata, parse_size, run_handler
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python3 -m benchmarks",
+        description="Benchmark the handlers and ProfilLoggerReader.")
+    parser.add_argument("--sizes", default="10k,100k",
+                        help="comma-separated numbers of entries, e.g. "
+                             "10k,1m,10m (default: %(default)s)")
+    parser.add_argument("--handlers",
+                        default=",".join(spec.name for spec in HANDLERS),
+                        help="comma-separated handler names "
+                             "(default: all)")
+    parser.add_argument("--batch-size", type=int, default=1_000)
+    parser.add_argument("--latency-samples", type=int, default=200,
+                        help="number of timed persist_log() calls")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="don't measure peak memory of queries")
+    parser.add_argument("--directory",
+                        help="directory for the written logs "
+                             "(default: a temporary one)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="results of another run to compare with")
+    return parser.parse_args()
+
+
+def print_result(result: Result):
+    details = ""
+    if "entries_per_second" in result:
+        details = f"{result['entries_per_second']:14,.0f} entries/s"
+    elif "p50_ms" in result:
+        details = (f"p50 {result['p50_ms']:8.3f} ms, "
+                   f"p99 {result['p99_ms']:8.3f} ms")
+    elif "peak_memory_bytes" in result:
+        details = f"{result['peak_memory_bytes'] / 2 ** 20:10.1f} MiB peak"
+    print(f"{result['handler']:16} {result['entries']:>11,} "
+          f"{result['benchmark']:32} {result['seconds']:10.4f} s  {details}",
+          flush=True)
+
+
+def run(arguments: argparse.Namespace, directory: str) -> List[Result]:
+    handler_names = arguments.handlers.split(",")
+    results = []
+    for number_of_entries in map(parse_size, arguments.sizes.split(",")):
+        for spec in HANDLERS:
+            if spec.name not in handler_names:
+                continue
+            if spec.max_entries and number_of_entries > spec.max_entries:
+                print(f"{spec.name:16} {number_of_entries:>11,} skipped "
+                      f"(more than {spec.max_entries:,} entries)")
+                continue
+            handler_directory = os.path.join(
+                directory, f"{spec.name}-{number_of_entries}")
+            os.makedirs(handler_directory)
+            for result in run_handler(
+                    spec, handler_directory, number_of_entries,
+                    arguments.batch_size, arguments.latency_samples,
+                    not arguments.no_memory, arguments.seed):
+                print_result(result)
+                results.append(result)
+    return results
+
+
+def main():
+    arguments = parse_arguments()
+    if arguments.directory:
+        results = run(arguments, arguments.directory)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            results = run(arguments, directory)
+    with open(arguments.output, "w") as fh:
+        json.dump({"metadata": get_metadata(), "results": results}, fh,
+                  indent=4)
+    print(f"Results written to {arguments.output}")
+
+    if arguments.compare:
+        with open(arguments.compare) as fh:
+            baseline = json.load(fh)
+        print(f"Compared with {baseline['metadata'].get('commit')} "
+              "(time ratio, > 1 - slower):")
+        for comparison in compare_results(results, baseline["results"]):
+            print(f"{comparison['handler']:16} {comparison['entries']:>11,} "
+                  f"{comparison['benchmark']:32} "
+                  f"{comparison['ratio']:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
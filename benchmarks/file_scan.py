@@ -0,0 +1,73 @@
+"""
+Time and peak memory of searching a FileHandler log, compared with
+the previous readlines() implementation, and with Bloom filters.
+
+Run from the project directory:
+    python3 -m benchmarks.file_scan
+"""
+import datetime
+import os
+import tempfile
+import time
+import tracemalloc
+from profil_logger import FileHandler, LogEntry, LogLevelValue, \
+    ProfilLoggerReader
+
+NUMBER_OF_ENTRIES = 200_000
+
+
+def write_log(file_path: str):
+    start = datetime.datetime(2025, 6, 22, 19, 20, 14)
+    FileHandler(file_path).persist_logs([
+        LogEntry(date=start + datetime.timedelta(seconds=i),
+                 level=LogLevelValue.INFO,
+                 msg=f"request {i} handled by worker {i % 7}")
+        for i in range(NUMBER_OF_ENTRIES)])
+
+
+def previous_find_by_text(file_handler: FileHandler, text: str):
+    """
+    Searching before the memory map: all lines were read and parsed.
+    """
+    with open(file_handler.filepath, "r") as fh:
+        entries = [file_handler._read_line_into_log_entry(line)
+                   for line in filter(None, fh.readlines())]
+    return [entry for entry in entries if text in entry.message]
+
+
+def report(name: str, benchmark):
+    tracemalloc.start()
+    started = time.perf_counter()
+    benchmark()
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:32} {seconds:8.3f} s {peak / 2 ** 20:10.1f} MiB peak")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, "log.txt")
+        write_log(file_path)
+        file_handler = FileHandler(file_path)
+        reader = ProfilLoggerReader(file_handler)
+        report("find_by_text (previous)",
+               lambda: previous_find_by_text(file_handler, "worker 3"))
+        report("find_by_text (current)",
+               lambda: reader.find_by_text("worker 3"))
+        report("rare text (current)",
+               lambda: reader.find_by_text("request 123457 "))
+        bloom_handler = FileHandler(file_path, bloom_filters=True)
+        bloom_handler.update_bloom_filters()
+        bloom_reader = ProfilLoggerReader(bloom_handler)
+        # the first search loads the filters
+        bloom_reader.find_by_text("request 123456 ")
+        report("rare text (bloom filters)",
+               lambda: bloom_reader.find_by_text("request 123457 "))
+        file_size = os.path.getsize(file_path)
+        with open(file_path, "rb") as fh:
+            scanned_size = sum(
+                end - start for start, end in bloom_handler._get_scan_ranges(
+                    "request 123457 ", file_size, fh.read(32)))
+        print(f"bloom filters: {scanned_size / file_size:.1%} "
+              f"of the file scanned")
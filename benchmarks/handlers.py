@@ -0,0 +1,55 @@
+"""
+Batch write and full scan throughput of the handlers.
+
+Run from the project directory:
+    python3 -m benchmarks.handlers
+"""
+import datetime
+import os
+import tempfile
+import time
+from profil_logger import BinaryHandler, CSVHandler, FileHandler, \
+    JsonHandler, LogEntry, LogLevelValue, SQLiteHandler
+
+NUMBER_OF_ENTRIES = 100_000
+BATCH_SIZE = 1_000
+
+
+def get_entries():
+    start = datetime.datetime(2025, 6, 22, 19, 20, 14)
+    return [LogEntry(date=start + datetime.timedelta(milliseconds=i),
+                     level=LogLevelValue.INFO,
+                     msg=f"request {i} handled by worker {i % 7}")
+            for i in range(NUMBER_OF_ENTRIES)]
+
+
+def report(name: str, operation: str, benchmark):
+    started = time.perf_counter()
+    benchmark()
+    seconds = time.perf_counter() - started
+    print(f"{name:16} {operation:6} "
+          f"{NUMBER_OF_ENTRIES / seconds:14,.0f} entries/s")
+
+
+def write_in_batches(log_handler, entries):
+    for start in range(0, len(entries), BATCH_SIZE):
+        log_handler.persist_logs(entries[start:start + BATCH_SIZE])
+
+
+if __name__ == "__main__":
+    entries = get_entries()
+    with tempfile.TemporaryDirectory() as directory:
+        for handler_class, file_name in [(FileHandler, "log.txt"),
+                                         (CSVHandler, "log.csv"),
+                                         (SQLiteHandler, "log.sqlite"),
+                                         (BinaryHandler, "log.bin")]:
+            log_handler = handler_class(os.path.join(directory, file_name))
+            report(handler_class.__name__, "write",
+                   lambda: write_in_batches(log_handler, entries))
+            report(handler_class.__name__, "scan",
+                   lambda: list(log_handler.iter_logs()))
+        # the json file is rewritten as a whole, so it's written at once
+        json_handler = JsonHandler(os.path.join(directory, "log.json"))
+        report("JsonHandler", "write",
+               lambda: json_handler.persist_logs(entries))
+        report("JsonHandler", "scan", lambda: list(json_handler.iter_logs()))
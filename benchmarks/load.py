@@ -0,0 +1,456 @@
+"""
+Load generator: drives ProfilLogger with concurrent producers (threads,
+processes or asyncio tasks) writing to a handler, or replays an existing
+log at its original (or a scaled) rate, and reports:
++ throughput (entries logged per second by all producers),
++ caller-side latency of logging calls (p50/p90/p99/max),
++ lost entries (logged, but not found in the log afterwards - dropped
+  by a full queue, shed by an open circuit or failed writes),
++ growth of the storage (all files in the handler's directory).
+
+Run from the project directory, e.g.:
+    python3 -m benchmarks.load --handlers FileHandler,SQLiteHandler \\
+        --mode threads --producers 8 --entries 10k
+    python3 -m benchmarks.load --mode processes --producers 4 --rate 500
+    python3 -m benchmarks.load --replay old_log.csv --speed 10
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from benchmarks.suite import HANDLERS, HandlerSpec, Result, get_metadata, \
+    parse_size
+from profil_logger import AsyncProfilLogger, ConcurrentDispatcher, \
+    LogEntry, LogLevelValue, ProfilLogger
+from profil_logger.conversion import open_log
+from profil_logger.dispatch import Dispatcher, SerialDispatcher
+from profil_logger.handlers import Handler
+from tests.fake_data import LEVEL_WEIGHTS
+
+MODES = ("threads", "processes", "asyncio")
+SIZE_DISTRIBUTIONS = ("fixed", "uniform", "exponential")
+
+_PADDING = "lorem ipsum dolor sit amet " * 4096
+
+
+class LoadPlan(NamedTuple):
+    # entries logged by each producer
+    entries: int
+    # entries per second logged by each producer (None - unlimited)
+    rate: Optional[float] = None
+    # mean length of messages
+    message_size: int = 80
+    size_distribution: str = "exponential"
+    level_weights: Dict[LogLevelValue, float] = LEVEL_WEIGHTS
+    seed: int = 0
+
+
+def parse_level_weights(level_weights: str) -> Dict[LogLevelValue, float]:
+    """
+    Parse a level mix, e.g. 'INFO=90,ERROR=10'.
+    """
+    weights = {}
+    for level_weight in level_weights.split(","):
+        level, weight = level_weight.split("=")
+        weights[LogLevelValue[level.strip().upper()]] = float(weight)
+    return weights
+
+
+def generate_messages(plan: LoadPlan,
+                      producer: int) -> Iterator[Tuple[LogLevelValue, str]]:
+    """
+    Levels and messages logged by a producer: each message starts with
+    the producer number and a sequence number, and is padded to a length
+    drawn from the size distribution.
+    """
+    rnd = random.Random(plan.seed * 1_000_003 + producer)
+    levels = list(plan.level_weights)
+    cumulative_weights = list(itertools.accumulate(
+        plan.level_weights.values()))
+    for sequence in range(plan.entries):
+        level = rnd.choices(levels, cum_weights=cumulative_weights)[0]
+        message = f"load {producer}-{sequence} "
+        if plan.size_distribution == "uniform":
+            size = rnd.randint(0, 2 * plan.message_size)
+        elif plan.size_distribution == "exponential":
+            size = int(rnd.expovariate(1 / plan.message_size)) \
+                if plan.message_size else 0
+        else:
+            size = plan.message_size
+        yield level, message + _PADDING[:max(0, size - len(message))]
+
+
+class ProducerResult(NamedTuple):
+    latencies: List[float]
+    failures: int
+    started: float
+    finished: float
+
+
+def produce(logger: ProfilLogger,
+            plan: LoadPlan,
+            producer: int) -> ProducerResult:
+    """
+    Log the entries of a producer (at the planned rate), timing each
+    logging call.
+    """
+    log_methods = {level: getattr(logger, level.name.lower())
+                   for level in LogLevelValue}
+    interval = 1 / plan.rate if plan.rate else 0.0
+    latencies = []
+    failures = 0
+    started = time.time()
+    next_call = time.perf_counter()
+    for level, message in generate_messages(plan, producer):
+        if interval:
+            delay = next_call - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            next_call += interval
+        call_started = time.perf_counter()
+        try:
+            log_methods[level](message)
+        except Exception:
+            failures += 1
+        latencies.append(time.perf_counter() - call_started)
+    return ProducerResult(latencies, failures, started, time.time())
+
+
+def create_dispatcher(dispatcher_name: str) -> Dispatcher:
+    if dispatcher_name == "concurrent":
+        return ConcurrentDispatcher()
+    return SerialDispatcher()
+
+
+def get_handler_spec(handler_name: str) -> HandlerSpec:
+    for spec in HANDLERS:
+        if spec.name == handler_name:
+            return spec
+    raise ValueError(f"Unknown handler: {handler_name}")
+
+
+def run_threads(spec: HandlerSpec,
+                directory: str,
+                producers: int,
+                plan: LoadPlan,
+                dispatcher_name: str = "serial") -> List[ProducerResult]:
+    logger = ProfilLogger([spec.create(directory)],
+                          dispatcher=create_dispatcher(dispatcher_name))
+    results: List[Optional[ProducerResult]] = [None] * producers
+    start = threading.Barrier(producers)
+
+    def run_producer(producer: int):
+        start.wait()
+        results[producer] = produce(logger, plan, producer)
+
+    threads = [threading.Thread(target=run_producer, args=(producer,))
+               for producer in range(producers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logger.close()
+    return results
+
+
+def _run_process_producer(handler_name: str,
+                          directory: str,
+                          plan: LoadPlan,
+                          producer: int,
+                          dispatcher_name: str,
+                          start: Any,
+                          results: Any):
+    # each process logs with its own logger and handler of the same log
+    logger = ProfilLogger([get_handler_spec(handler_name).create(directory)],
+                          dispatcher=create_dispatcher(dispatcher_name))
+    start.wait()
+    result = produce(logger, plan, producer)
+    logger.close()
+    results.put(result)
+
+
+def run_processes(spec: HandlerSpec,
+                  directory: str,
+                  producers: int,
+                  plan: LoadPlan,
+                  dispatcher_name: str = "serial") -> List[ProducerResult]:
+    # handlers created by the parent process (e.g. SegmentedHandler's
+    # hot file) are shared by producers
+    spec.create(directory)
+    context = multiprocessing.get_context()
+    # producers start at once, after all processes are ready
+    start = context.Barrier(producers + 1)
+    results = context.Queue()
+    processes = [context.Process(
+                     target=_run_process_producer,
+                     args=(spec.name, directory, plan, producer,
+                           dispatcher_name, start, results))
+                 for producer in range(producers)]
+    for process in processes:
+        process.start()
+    start.wait()
+    # results are taken before joining - processes with queued data
+    # don't exit until it's consumed
+    producer_results = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return producer_results
+
+
+def run_asyncio(spec: HandlerSpec,
+                directory: str,
+                producers: int,
+                plan: LoadPlan) -> List[ProducerResult]:
+    async def run() -> List[ProducerResult]:
+        logger = AsyncProfilLogger([spec.create(directory)])
+        results = await asyncio.gather(*(
+            produce_async(logger, plan, producer)
+            for producer in range(producers)))
+        await logger.aclose()
+        return list(results)
+
+    return asyncio.run(run())
+
+
+async def produce_async(logger: AsyncProfilLogger,
+                        plan: LoadPlan,
+                        producer: int) -> ProducerResult:
+    log_methods = {level: getattr(logger, level.name.lower())
+                   for level in LogLevelValue}
+    interval = 1 / plan.rate if plan.rate else 0.0
+    latencies = []
+    failures = 0
+    started = time.time()
+    next_call = time.perf_counter()
+    for level, message in generate_messages(plan, producer):
+        delay = next_call - time.perf_counter() if interval else 0.0
+        # other tasks (and the consumers writing entries) run meanwhile
+        await asyncio.sleep(max(0.0, delay))
+        next_call += interval
+        call_started = time.perf_counter()
+        try:
+            log_methods[level](message)
+        except Exception:
+            failures += 1
+        latencies.append(time.perf_counter() - call_started)
+    return ProducerResult(latencies, failures, started, time.time())
+
+
+def replay(spec: HandlerSpec,
+           directory: str,
+           source: Handler,
+           speed: float = 1.0,
+           dispatcher_name: str = "serial") -> Tuple[ProducerResult, float]:
+    """
+    Log the entries of the source log again, keeping the intervals
+    between them divided by the speed (0 - as fast as possible). Returns
+    also the largest delay behind the schedule.
+    """
+    logger = ProfilLogger([spec.create(directory)],
+                          dispatcher=create_dispatcher(dispatcher_name))
+    log_methods = {level: getattr(logger, level.name.lower())
+                   for level in LogLevelValue}
+    latencies = []
+    failures = 0
+    max_lag = 0.0
+    first_date: Optional[datetime.datetime] = None
+    started = time.time()
+    replay_start = time.perf_counter()
+    entry: LogEntry
+    for entry in source.iter_logs():
+        if speed:
+            if first_date is None:
+                first_date = entry.date
+            scheduled = replay_start \
+                + (entry.date - first_date).total_seconds() / speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+        call_started = time.perf_counter()
+        try:
+            log_methods[entry.level](entry.message)
+        except Exception:
+            failures += 1
+        latencies.append(time.perf_counter() - call_started)
+    logger.close()
+    return ProducerResult(latencies, failures, started, time.time()), \
+        max_lag
+
+
+def get_storage_size(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, file_name))
+               for path, _, file_names in os.walk(directory)
+               for file_name in file_names)
+
+
+def count_stored_entries(spec: HandlerSpec, directory: str) -> int:
+    return sum(1 for _ in spec.create(directory).iter_logs())
+
+
+def summarize(results: List[ProducerResult],
+              stored_entries: int,
+              storage_size: int) -> Result:
+    latencies = [latency for result in results
+                 for latency in result.latencies]
+    logged = len(latencies)
+    seconds = max(result.finished for result in results) \
+        - min(result.started for result in results)
+    summary = {"logged": logged,
+               "seconds": seconds,
+               "entries_per_second": logged / seconds if seconds else None,
+               "failed_calls": sum(result.failures for result in results),
+               "lost_entries": logged - stored_entries,
+               "storage_bytes": storage_size}
+    if len(latencies) >= 2:
+        percentiles = statistics.quantiles(latencies, n=100,
+                                           method="inclusive")
+        summary.update({"p50_us": percentiles[49] * 1e6,
+                        "p90_us": percentiles[89] * 1e6,
+                        "p99_us": percentiles[98] * 1e6,
+                        "max_us": max(latencies) * 1e6})
+    return summary
+
+
+def run_load(spec: HandlerSpec,
+             directory: str,
+             mode: str,
+             producers: int,
+             plan: LoadPlan,
+             dispatcher_name: str = "serial") -> Result:
+    """
+    Run producers logging to the handler (created in an empty directory)
+    and summarize the results.
+    """
+    if mode == "threads":
+        results = run_threads(spec, directory, producers, plan,
+                              dispatcher_name)
+    elif mode == "processes":
+        results = run_processes(spec, directory, producers, plan,
+                                dispatcher_name)
+    elif mode == "asyncio":
+        results = run_asyncio(spec, directory, producers, plan)
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+    return {"handler": spec.name, "mode": mode, "producers": producers,
+            "dispatcher": "async" if mode == "asyncio" else dispatcher_name,
+            **summarize(results, count_stored_entries(spec, directory),
+                        get_storage_size(directory))}
+
+
+def run_replay(spec: HandlerSpec,
+               directory: str,
+               source: Handler,
+               speed: float = 1.0,
+               dispatcher_name: str = "serial") -> Result:
+    result, max_lag = replay(spec, directory, source, speed,
+                             dispatcher_name)
+    return {"handler": spec.name, "mode": "replay", "speed": speed,
+            "dispatcher": dispatcher_name,
+            **summarize([result], count_stored_entries(spec, directory),
+                        get_storage_size(directory)),
+            "max_lag_seconds": max_lag}
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python3 -m benchmarks.load",
+        description="Load-test ProfilLogger with concurrent producers, "
+                    "or replay a log.")
+    parser.add_argument("--handlers", default="FileHandler",
+                        help="comma-separated handler names "
+                             "(default: %(default)s)")
+    parser.add_argument("--mode", choices=MODES, default="threads")
+    parser.add_argument("--producers", type=int, default=4)
+    parser.add_argument("--entries", default="10k",
+                        help="entries logged by each producer")
+    parser.add_argument("--rate", type=float,
+                        help="entries per second of each producer "
+                             "(default: unlimited)")
+    parser.add_argument("--message-size", type=int, default=80,
+                        help="mean message length")
+    parser.add_argument("--size-distribution", choices=SIZE_DISTRIBUTIONS,
+                        default="exponential")
+    parser.add_argument("--levels",
+                        help="level mix, e.g. INFO=90,ERROR=10 "
+                             "(default: mostly DEBUG and INFO)")
+    parser.add_argument("--dispatcher", choices=("serial", "concurrent"),
+                        default="serial")
+    parser.add_argument("--replay", metavar="LOG",
+                        help="replay a log (read by the handler of its "
+                             "extension) instead of generating entries")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed-up (0 - as fast as possible)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--directory",
+                        help="directory for the written logs "
+                             "(default: a temporary one)")
+    parser.add_argument("--output", help="write results to a JSON file")
+    return parser.parse_args()
+
+
+def print_result(result: Result):
+    latency = ""
+    if "p50_us" in result:
+        latency = (f"p50 {result['p50_us']:9.1f} us, "
+                   f"p99 {result['p99_us']:9.1f} us, ")
+    print(f"{result['handler']:16} {result['mode']:9} "
+          f"{result['logged']:>10,} entries "
+          f"{result['entries_per_second'] or 0:12,.0f} entries/s, "
+          f"{latency}lost {result['lost_entries']:,}, "
+          f"storage {result['storage_bytes'] / 2 ** 20:.1f} MiB",
+          flush=True)
+
+
+def run(arguments: argparse.Namespace, directory: str) -> List[Result]:
+    results = []
+    for handler_name in arguments.handlers.split(","):
+        spec = get_handler_spec(handler_name)
+        handler_directory = os.path.join(directory, handler_name)
+        os.makedirs(handler_directory)
+        if arguments.replay:
+            source = open_log(arguments.replay)
+            result = run_replay(spec, handler_directory, source,
+                                arguments.speed, arguments.dispatcher)
+        else:
+            plan = LoadPlan(
+                entries=parse_size(arguments.entries),
+                rate=arguments.rate,
+                message_size=arguments.message_size,
+                size_distribution=arguments.size_distribution,
+                level_weights=parse_level_weights(arguments.levels)
+                if arguments.levels else LEVEL_WEIGHTS,
+                seed=arguments.seed)
+            result = run_load(spec, handler_directory, arguments.mode,
+                              arguments.producers, plan,
+                              arguments.dispatcher)
+        print_result(result)
+        results.append(result)
+    return results
+
+
+def main():
+    arguments = parse_arguments()
+    if arguments.directory:
+        results = run(arguments, arguments.directory)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            results = run(arguments, directory)
+    if arguments.output:
+        with open(arguments.output, "w") as fh:
+            json.dump({"metadata": get_metadata(), "results": results}, fh,
+                      indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Benchmark suite of the handlers and ProfilLoggerReader methods.
+
+For each log size, a deterministic log (generated by
+tests.fake_data.generate_log_entries()) is written to every handler, and:
++ write throughput of batches of entries,
++ persist_log() latency (p50/p99) of single entries appended afterwards,
++ time and peak memory (traced with tracemalloc, in a separate run) of
+  reader queries
+are measured. Results are returned as dicts, which are written to a JSON
+file by the runner (see benchmarks/__main__.py) - results of different
+commits can be compared with each other.
+"""
+import datetime
+import gc
+import itertools
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, \
+    Optional, Tuple
+from profil_logger import BinaryHandler, CSVHandler, FileHandler, \
+    JsonHandler, JsonLinesHandler, LogEntry, LogLevelValue, \
+    ProfilLoggerReader, SQLiteHandler, SegmentedHandler
+from profil_logger.handlers import Handler
+from tests.fake_data import generate_log_entries
+
+Result = Dict[str, Any]
+
+
+class HandlerSpec(NamedTuple):
+    name: str
+    # creates the handler in a directory
+    create: Callable[[str], Handler]
+    # the largest benchmarked log (None - any size)
+    max_entries: Optional[int] = None
+
+
+HANDLERS = [
+    HandlerSpec("FileHandler",
+                lambda directory: FileHandler(
+                    os.path.join(directory, "log.txt"))),
+    HandlerSpec("CSVHandler",
+                lambda directory: CSVHandler(
+                    os.path.join(directory, "log.csv"))),
+    HandlerSpec("JsonLinesHandler",
+                lambda directory: JsonLinesHandler(
+                    os.path.join(directory, "log.jsonl"))),
+    # the whole file is loaded and rewritten by every write
+    HandlerSpec("JsonHandler",
+                lambda directory: JsonHandler(
+                    os.path.join(directory, "log.json")),
+                max_entries=100_000),
+    HandlerSpec("SQLiteHandler",
+                lambda directory: SQLiteHandler(
+                    os.path.join(directory, "log.sqlite"))),
+    HandlerSpec("BinaryHandler",
+                lambda directory: BinaryHandler(
+                    os.path.join(directory, "log.bin"))),
+    HandlerSpec("SegmentedHandler",
+                lambda directory: SegmentedHandler(
+                    os.path.join(directory, "segments"))),
+]
+
+
+class LogPeriod(NamedTuple):
+    first_date: datetime.datetime
+    last_date: datetime.datetime
+
+    @property
+    def middle_date(self) -> datetime.datetime:
+        return self.first_date + (self.last_date - self.first_date) / 2
+
+
+QUERIES: Dict[str, Callable[[ProfilLoggerReader, LogPeriod], Any]] = {
+    "find_by_text": lambda reader, period: reader.find_by_text(
+        "db-42 timed out"),
+    "find_by_text_newest_page": lambda reader, period: reader.find_by_text(
+        "logged in", limit=100, newest_first=True),
+    "find_by_regex": lambda reader, period: reader.find_by_regex(
+        r"handled in 99\d ms"),
+    "find_by_level": lambda reader, period: reader.find_by_level(
+        [LogLevelValue.ERROR, LogLevelValue.CRITICAL]),
+    "groupby_level": lambda reader, period: reader.groupby_level(
+        start_date=period.middle_date),
+    "groupby_month": lambda reader, period: reader.groupby_month(),
+    "count_by_level": lambda reader, period: reader.count_by_level(),
+    "count_by_month": lambda reader, period: reader.count_by_month(),
+    "count_by_bucket": lambda reader, period: reader.count_by_bucket("day"),
+}
+
+
+def parse_size(size: str) -> int:
+    """
+    Parse a number of entries, e.g. '10k' or '1m'.
+    """
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    size = size.strip().lower()
+    if size[-1:] in multipliers:
+        return int(size[:-1]) * multipliers[size[-1]]
+    return int(size)
+
+
+def get_metadata() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"],
+                                capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit,
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform()}
+
+
+def write_log(log_handler: Handler,
+              entries: Iterator[LogEntry],
+              batch_size: int) -> Tuple[Result, LogPeriod]:
+    """
+    Write entries in batches, timing only the writes. Returns also
+    the period of the written entries.
+    """
+    seconds = 0.0
+    written = 0
+    first_date = last_date = datetime.datetime.now()
+    while True:
+        batch = list(itertools.islice(entries, batch_size))
+        if not batch:
+            break
+        if not written:
+            first_date = batch[0].date
+        last_date = batch[-1].date
+        started = time.perf_counter()
+        log_handler.persist_logs(batch)
+        seconds += time.perf_counter() - started
+        written += len(batch)
+    result = {"seconds": seconds,
+              "entries_per_second": written / seconds if seconds else None}
+    return result, LogPeriod(first_date, last_date)
+
+
+def measure_latency(log_handler: Handler,
+                    entries: Iterator[LogEntry],
+                    time_budget: float = 5.0) -> Result:
+    """
+    Latency of persist_log() calls - taken until entries run out or
+    the time budget is spent (but at least twice).
+    """
+    latencies = []
+    budget_end = time.perf_counter() + time_budget
+    for entry in entries:
+        started = time.perf_counter()
+        log_handler.persist_log(entry)
+        finished = time.perf_counter()
+        latencies.append(finished - started)
+        if finished > budget_end and len(latencies) >= 2:
+            break
+    percentiles = statistics.quantiles(latencies, n=100,
+                                       method="inclusive")
+    return {"seconds": percentiles[49],
+            "p50_ms": percentiles[49] * 1000,
+            "p99_ms": percentiles[98] * 1000,
+            "samples": len(latencies)}
+
+
+def measure_query(query: Callable[[], Any], trace_memory: bool) -> Result:
+    gc.collect()
+    started = time.perf_counter()
+    result = query()
+    seconds = time.perf_counter() - started
+    measurement = {"seconds": seconds, "result_size": len(result)}
+    del result
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            query()
+            measurement["peak_memory_bytes"] = \
+                tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return measurement
+
+
+def run_handler(spec: HandlerSpec,
+                directory: str,
+                number_of_entries: int,
+                batch_size: int = 1_000,
+                latency_samples: int = 200,
+                trace_memory: bool = True,
+                seed: int = 0) -> Iterator[Result]:
+    """
+    Benchmark a handler with a log of number_of_entries entries, yielding
+    results as they are measured.
+    """
+    log_handler = spec.create(directory)
+    result_key = {"handler": spec.name, "entries": number_of_entries}
+
+    write, period = write_log(
+        log_handler, generate_log_entries(number_of_entries, seed),
+        batch_size)
+    yield {"benchmark": "write", **result_key, **write}
+    # single entries are appended after the last one
+    latency = measure_latency(log_handler, generate_log_entries(
+        latency_samples, seed + 1, period.last_date))
+    yield {"benchmark": "persist_log", **result_key, **latency}
+    if isinstance(log_handler, SegmentedHandler):
+        started = time.perf_counter()
+        log_handler.compact()
+        yield {"benchmark": "compact", **result_key,
+               "seconds": time.perf_counter() - started}
+
+    logger_reader = ProfilLoggerReader(log_handler)
+    for name, query in QUERIES.items():
+        measurement = measure_query(
+            lambda: query(logger_reader, period), trace_memory)
+        yield {"benchmark": f"query:{name}", **result_key, **measurement}
+
+
+def compare_results(results: List[Result],
+                    baseline: List[Result]) -> Iterator[Result]:
+    """
+    Pair results with baseline results of the same benchmarks, with
+    the ratio of their times (> 1 - slower than the baseline).
+    """
+    def get_key(result: Result):
+        return result["benchmark"], result["handler"], result["entries"]
+
+    baseline_results = {get_key(result): result for result in baseline}
+    for result in results:
+        baseline_result = baseline_results.get(get_key(result))
+        if baseline_result and baseline_result.get("seconds"):
+            yield {**result,
+                   "baseline_seconds": baseline_result["seconds"],
+                   "ratio": result["seconds"] / baseline_result["seconds"]}
@@ -0,0 +1,74 @@
+"""
+Throughput of timestamp parsing and formatting, compared with
+the previous implementation.
+
+Run from the project directory:
+    python3 -m benchmarks.timestamps
+"""
+import datetime
+import timeit
+from profil_logger import LogEntry, LogLevelValue
+from profil_logger.timestamps import from_epoch_us, parse_timestamps, \
+    to_epoch_us
+
+NUMBER_OF_ENTRIES = 100_000
+
+
+def previous_getitem(entry: LogEntry, key: str) -> str:
+    """
+    LogEntry.__getitem__ before the codec: every lookup formatted
+    all the fields.
+    """
+    values = [entry.date.isoformat(), entry.level.name, entry.message]
+    return dict(zip(LogEntry.keys(), values))[key]
+
+
+def get_dates():
+    start = datetime.datetime(2025, 6, 22, 19, 20, 14)
+    return [start + datetime.timedelta(microseconds=137 * i)
+            for i in range(NUMBER_OF_ENTRIES)]
+
+
+def run_format_benchmarks(dates):
+    def format_previous():
+        for date in dates:
+            entry = LogEntry(date=date, level=LogLevelValue.INFO, msg="m")
+            f"{previous_getitem(entry, 'date')} " \
+                f"{previous_getitem(entry, 'level')} " \
+                f"{previous_getitem(entry, 'message')}"
+
+    def format_current():
+        for date in dates:
+            entry = LogEntry(date=date, level=LogLevelValue.INFO, msg="m")
+            f"{entry['date']} {entry['level']} {entry['message']}"
+
+    report("write formatting (previous)", format_previous)
+    report("write formatting (current)", format_current)
+
+
+def run_parse_benchmarks(dates):
+    timestamps = [date.isoformat() for date in dates]
+
+    def parse_previous():
+        [datetime.datetime.fromisoformat(timestamp)
+         for timestamp in timestamps]
+
+    report("parsing (previous)", parse_previous)
+    report("parsing (current)", lambda: parse_timestamps(timestamps))
+
+    epoch_timestamps = [to_epoch_us(date) for date in dates]
+    report("epoch us -> datetime",
+           lambda: [from_epoch_us(value) for value in epoch_timestamps])
+    report("datetime -> epoch us",
+           lambda: [to_epoch_us(date) for date in dates])
+
+
+def report(name: str, benchmark):
+    seconds = min(timeit.repeat(benchmark, number=1, repeat=3))
+    print(f"{name:32} {NUMBER_OF_ENTRIES / seconds:14,.0f} entries/s")
+
+
+if __name__ == "__main__":
+    dates = get_dates()
+    run_format_benchmarks(dates)
+    run_parse_benchmarks(dates)
@@ -1,8 +1,18 @@
 from profil_logger.handlers import JsonHandler, CSVHandler, SQLiteHandler, \
-    FileHandler
-from profil_logger.log_entry import LogEntry, LogLevelValue
+    FileHandler, JsonLinesHandler
+from profil_logger.binary_handler import BinaryHandler
+from profil_logger.cache import CachedHandler
+from profil_logger.conversion import copy_logs
+from profil_logger.dispatch import ConcurrentDispatcher
+from profil_logger.log_entry import LogCursor, LogEntry, LogLevelValue
 from profil_logger.logger import ProfilLogger
 from profil_logger.logger_reader import ProfilLoggerReader
+from profil_logger.memory_handler import MemoryHandler
+from profil_logger.merged import MergedHandler
+from profil_logger.segments import SegmentedHandler
+from profil_logger.snapshot import SharedSnapshotHandler
+from profil_logger.tiered import TieredHandler
+from profil_logger.async_logger import AsyncHandler, AsyncProfilLogger
 
 
 __all__ = [
@@ -13,5 +23,18 @@ __all__ = [
     "CSVHandler",
     "SQLiteHandler",
     "FileHandler",
-    "LogLevelValue"
+    "JsonLinesHandler",
+    "BinaryHandler",
+    "SegmentedHandler",
+    "TieredHandler",
+    "MemoryHandler",
+    "MergedHandler",
+    "CachedHandler",
+    "SharedSnapshotHandler",
+    "copy_logs",
+    "LogLevelValue",
+    "LogCursor",
+    "ConcurrentDispatcher",
+    "AsyncProfilLogger",
+    "AsyncHandler"
 ]
@@ -0,0 +1,68 @@
+"""
+Conversion of logs from the command line, with handlers chosen by file
+extensions, e.g.:
+    python3 -m profil_logger old_log.csv log.sqlite
+    python3 -m profil_logger log.json log.jsonl --batch-size 50k
+Progress and entries copied per second are reported to stderr.
+"""
+import argparse
+import os
+import sys
+import time
+from profil_logger.conversion import HANDLERS_BY_EXTENSION, copy_logs, \
+    open_log
+
+_PROGRESS_WIDTH = 60
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python3 -m profil_logger",
+        description="Convert a log into another format (chosen by file "
+                    f"extensions: {', '.join(HANDLERS_BY_EXTENSION)}).")
+    parser.add_argument("source")
+    parser.add_argument("target",
+                        help="a log the entries are appended to (created "
+                             "if it doesn't exist)")
+    parser.add_argument("--batch-size", type=_parse_count,
+                        help="entries written at once (e.g. 50k, "
+                             "default: depends on the target)")
+    parser.add_argument("--quiet", action="store_true",
+                        help="don't report progress")
+    return parser.parse_args()
+
+
+def _parse_count(count: str) -> int:
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    suffix = count[-1:].lower()
+    if suffix in multipliers:
+        return int(count[:-1]) * multipliers[suffix]
+    return int(count)
+
+
+def _print_progress(copied: int, seconds: float):
+    print(f"\r{copied:,} entries, {copied / seconds:,.0f} entries/s"
+          .ljust(_PROGRESS_WIDTH), end="", file=sys.stderr, flush=True)
+
+
+def main():
+    arguments = parse_arguments()
+    if not os.path.exists(arguments.source):
+        sys.exit(f"No such log: {arguments.source}")
+    try:
+        source = open_log(arguments.source)
+        target = open_log(arguments.target)
+    except ValueError as error:
+        sys.exit(str(error))
+    started = time.perf_counter()
+    copied = copy_logs(source, target, arguments.batch_size,
+                       progress=None if arguments.quiet else _print_progress)
+    seconds = time.perf_counter() - started
+    if not arguments.quiet:
+        print(f"\rcopied {copied:,} entries in {seconds:.2f} s "
+              f"({copied / seconds if seconds else 0:,.0f} entries/s)"
+              .ljust(_PROGRESS_WIDTH), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from profil_logger.dispatch import Dispatcher
+from profil_logger.handlers import Handler
+from profil_logger.log_entry import LogEntry, LogLevelValue
+from profil_logger.logger import ProfilLogger
+
+
+class AsyncHandler:
+    """
+    Asyncio variant of a handler: entries are collected in a queue on
+    the event loop and written in batches by a consumer task, which runs
+    the blocking persist_logs() in a dedicated single-thread executor.
+    While a batch is being written, the next one accumulates in the queue.
+    """
+    def __init__(self,
+                 handler: Handler,
+                 batch_size: int = 256,
+                 queue_size: int = 10_000,
+                 executor: Optional[ThreadPoolExecutor] = None):
+        self.handler = handler
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix=f"{type(handler).__name__}-executor")
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._written = 0
+        self._failed = 0
+        self._dropped = 0
+
+    def submit(self, entry: LogEntry) -> asyncio.Future:
+        """
+        Enqueue an entry without blocking. The returned future is done
+        once the entry is written, or was dropped (full queue) or failed
+        to be written - see stats().
+        """
+        loop = asyncio.get_running_loop()
+        self._start_consumer()
+        future = loop.create_future()
+        try:
+            self._queue.put_nowait((entry, future))
+        except asyncio.QueueFull:
+            self._dropped += 1
+            future.set_result(None)
+        return future
+
+    async def persist_log(self, entry: LogEntry):
+        await self.submit(entry)
+
+    async def drain(self):
+        """
+        Wait until the queued entries are written.
+        """
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def aclose(self):
+        await self.drain()
+        if self._consumer is not None:
+            self._consumer.cancel()
+            try:
+                await self._consumer
+            except asyncio.CancelledError:
+                pass
+            self._consumer = None
+        if self._own_executor:
+            self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict:
+        return {"queued": self._queue.qsize() if self._queue else 0,
+                "written": self._written,
+                "failed": self._failed,
+                "dropped": self._dropped}
+
+    def _start_consumer(self):
+        if self._consumer is None or self._consumer.done():
+            self._queue = self._queue or asyncio.Queue(self.queue_size)
+            self._consumer = asyncio.get_running_loop().create_task(
+                self._consume())
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            entries = [entry for entry, _ in batch]
+            try:
+                await loop.run_in_executor(
+                    self._executor, self._persist_logs, entries)
+                self._written += len(batch)
+            except Exception:
+                self._failed += len(batch)
+            finally:
+                self._complete(batch)
+
+    def _persist_logs(self, entries: List[LogEntry]):
+        # timed in the executor thread, without waiting for the loop
+        started = time.perf_counter()
+        try:
+            self.handler.persist_logs(entries)
+        except Exception:
+            self.handler.metrics.record_failed_write()
+            raise
+        self.handler.metrics.record_write(len(entries),
+                                          time.perf_counter() - started)
+
+    def _complete(self, batch: List[Tuple[LogEntry, asyncio.Future]]):
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+            self._queue.task_done()
+
+
+class AsyncDispatcher(Dispatcher):
+    """
+    Dispatches entries to AsyncHandler wrappers of handlers, without
+    blocking the event loop.
+    """
+    def __init__(self, batch_size: int = 256, queue_size: int = 10_000):
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self._async_handlers: Dict[Handler, AsyncHandler] = {}
+
+    def dispatch(self,
+                 entry: LogEntry,
+                 handlers: Sequence[Handler]) -> asyncio.Future:
+        futures = [self._get_async_handler(log_handler).submit(entry)
+                   for log_handler in handlers]
+        if len(futures) == 1:
+            return futures[0]
+        return asyncio.gather(*futures)
+
+    async def drain(self):
+        for async_handler in list(self._async_handlers.values()):
+            await async_handler.drain()
+
+    async def aclose(self):
+        async_handlers, self._async_handlers = self._async_handlers, {}
+        for async_handler in async_handlers.values():
+            await async_handler.aclose()
+
+    def stats(self) -> Dict[Handler, Dict]:
+        return {log_handler: async_handler.stats() for log_handler,
+                async_handler in self._async_handlers.items()}
+
+    def _get_async_handler(self, log_handler: Handler) -> AsyncHandler:
+        if log_handler not in self._async_handlers:
+            self._async_handlers[log_handler] = AsyncHandler(
+                log_handler, self.batch_size, self.queue_size)
+        return self._async_handlers[log_handler]
+
+
+class AsyncProfilLogger(ProfilLogger):
+    """
+    Logger for asyncio applications: logging never blocks the event loop.
+    The level methods (which have to be called from the event loop thread)
+    return a future which can be ignored (fire-and-forget) or awaited until
+    the entry is written:
+
+        logger.info("request %s handled", request_id)
+        await logger.error("payment %s failed", payment_id)
+
+    Call 'await logger.aclose()' before the loop finishes.
+    """
+    def __init__(self,
+                 log_handlers: List[Handler],
+                 batch_size: int = 256,
+                 queue_size: int = 10_000):
+        super(AsyncProfilLogger, self).__init__(
+            log_handlers, dispatcher=AsyncDispatcher(batch_size, queue_size))
+
+    async def drain(self):
+        self._write_repetitions()
+        await self.dispatcher.drain()
+
+    async def aclose(self):
+        self._write_repetitions()
+        await self.dispatcher.aclose()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        raise NotImplementedError("use 'await logger.drain()'")
+
+    def close(self):
+        raise NotImplementedError("use 'await logger.aclose()'")
+
+    def _log(self, log_level: LogLevelValue, message: str, args=()) \
+            -> asyncio.Future:
+        return super(AsyncProfilLogger, self)._log(log_level, message, args) \
+            or self._log_nothing(message)
+
+    def _make_filtering_method(self, log_level_value: int) -> Callable:
+        count_filtered = super(AsyncProfilLogger,
+                               self)._make_filtering_method(log_level_value)
+
+        def log_filtered(message: str, *args) -> asyncio.Future:
+            count_filtered(message)
+            return self._log_nothing(message)
+        return log_filtered
+
+    def _log_nothing(self, message: str, *args) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
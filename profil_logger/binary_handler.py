@@ -0,0 +1,545 @@
+"""
+Compact binary log format.
+
+The file starts with the FILE_MAGIC signature, followed by blocks of
+records. Each block starts with a header holding the number of its
+records, their total length and the minimum/maximum timestamp in the
+block; a record is a struct-packed (timestamp, level, message length)
+header followed by the UTF-8 encoded message:
+
+    block header:  <4sIIqq  magic, record count, records length,
+                            min. timestamp, max. timestamp
+    record:        <qBI     timestamp (microseconds since the epoch),
+                            level value, message length
+                   message
+
+With dictionary encoding, a message repeated within a block is stored
+only in its first record - the following ones are just headers, with
+REFERENCE_FLAG set in the level value and the offset of the first record
+(from the start of the block records) in place of the message length.
+
+A batch of entries is appended as a single block (split into blocks
+of at most block_size records). Block headers are kept in an in-memory
+index, which is extended as the file grows - it gives access to any
+block (e.g. the one holding a cursor, or the last one) without reading
+the preceding records, and lets scans skip blocks logged outside of
+the searched period.
+
+Writers also store the block headers in a sidecar file ('<log
+file>.index'), so that new processes load the index instead of reading
+the header of every block of the log:
+
+    header:  INDEX_MAGIC, <QQ device and inode of the log file, 16 bytes
+             of a UUID of the sidecar file
+    records: <QQIqq a block (see BlockInfo), <I checksum of the log up to
+             the block end (see profil_logger.log_state)
+
+Stored blocks are used only while the log is the same file, with
+the same bytes up to the end of the last of them - blocks not stored
+(e.g. appended by an older version) are read from the log.
+"""
+import atexit
+import bisect
+import datetime
+import os
+import struct
+import threading
+import uuid
+import weakref
+from typing import BinaryIO, Collection, Dict, Iterator, List, NamedTuple, \
+    Optional, Tuple
+from profil_logger.handlers import Buffer, FileIOHandler, map_file
+from profil_logger.log_entry import LogCursor, LogEntry, LogLevelValue, \
+    MessageInterner
+from profil_logger.log_state import LogState, get_log_state, is_extended
+from profil_logger.timestamps import from_epoch_us, to_epoch_us
+
+FILE_MAGIC = b"PLOGBIN1"
+BLOCK_MAGIC = b"PLBK"
+BLOCK_HEADER = struct.Struct("<4sIIqq")
+RECORD_HEADER = struct.Struct("<qBI")
+REFERENCE_FLAG = 0x80
+INDEX_MAGIC = b"PLBINDX1"
+_INDEX_HEADER = struct.Struct("<8sQQ16s")
+_INDEX_RECORD = struct.Struct("<QQIqqI")
+
+_LEVELS = {level.value: level for level in LogLevelValue}
+
+# handlers with buffered entries, which are written at exit
+_buffering_handlers: "weakref.WeakSet[BinaryHandler]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_buffering_handlers():
+    for log_handler in list(_buffering_handlers):
+        log_handler.flush()
+
+
+class BlockInfo(NamedTuple):
+    # offset of the first record of the block
+    offset: int
+    end: int
+    record_count: int
+    min_timestamp: int
+    max_timestamp: int
+
+
+class _BlockIndex:
+    """
+    Headers of the blocks of a file, read up to the scanned_to offset.
+    """
+    def __init__(self, file_id: Tuple[int, int]):
+        self.file_id = file_id
+        self.blocks: List[BlockInfo] = []
+        self.offsets: List[int] = []
+        self.scanned_to = len(FILE_MAGIC)
+        # state of the log up to scanned_to (None before the first block)
+        self.log_state: Optional[LogState] = None
+
+    def add(self, block: BlockInfo):
+        self.blocks.append(block)
+        self.offsets.append(block.offset)
+        self.scanned_to = block.end
+
+    def extend(self, buffer: Buffer):
+        position = self.scanned_to
+        size = len(buffer)
+        while position + BLOCK_HEADER.size <= size:
+            magic, record_count, length, min_timestamp, max_timestamp = \
+                BLOCK_HEADER.unpack_from(buffer, position)
+            records_start = position + BLOCK_HEADER.size
+            end = records_start + length
+            if magic != BLOCK_MAGIC or end > size:
+                # a damaged block or one being written
+                break
+            self.add(BlockInfo(records_start, end, record_count,
+                               min_timestamp, max_timestamp))
+            position = end
+
+    def find_block(self, offset: int, block_count: int) -> int:
+        """
+        Number of the block containing a record at the offset (-1 if
+        the offset precedes all the blocks).
+        """
+        return bisect.bisect_right(self.offsets, offset, 0, block_count) - 1
+
+
+class _IndexFile:
+    """
+    Blocks of a log file stored in a sidecar file (see the module
+    docstring). Records are read once and then only new ones are loaded.
+    """
+    def __init__(self, log_path: str):
+        self.path = f"{log_path}.index"
+        # header of the loaded sidecar file
+        self._header = b""
+        self._loaded_to = 0
+        # end of the last block stored in the file
+        self._stored_to = 0
+
+    def load(self, index: _BlockIndex, log_fh: BinaryIO,
+             log_size: int) -> bool:
+        """
+        Add stored blocks following the blocks of the index of the log
+        file opened for reading (mapped up to log_size). False means that
+        the stored blocks aren't blocks of the log - they're discarded,
+        and the index has to be built again.
+        """
+        try:
+            with open(self.path, "rb") as fh:
+                header = fh.read(_INDEX_HEADER.size)
+                if header != self._header:
+                    # a new sidecar file - possibly with the inode of
+                    # the loaded one
+                    self.reset()
+                    self._read_header(header, index.file_id)
+                fh.seek(self._loaded_to)
+                data = fh.read()
+        except FileNotFoundError:
+            self.reset()
+            return True
+        except (ValueError, struct.error):
+            self.clear()
+            return True
+        record_size = _INDEX_RECORD.size
+        position = 0
+        log_checksum = None
+        while position + record_size <= len(data):
+            *block, checksum = _INDEX_RECORD.unpack_from(data, position)
+            block = BlockInfo(*block)
+            if block.end > log_size:
+                # stored after the log was mapped
+                break
+            if block.end > index.scanned_to:
+                if block.offset - BLOCK_HEADER.size != index.scanned_to:
+                    self.clear()
+                    return False
+                index.add(block)
+                log_checksum = checksum
+            self._stored_to = block.end
+            position += record_size
+        self._loaded_to += position
+        if log_checksum is not None and not is_extended(log_fh, LogState(
+                *index.file_id, index.scanned_to, log_checksum)):
+            self.clear()
+            return False
+        return True
+
+    def _read_header(self, header: bytes, log_id: Tuple[int, int]):
+        magic, device, inode, _ = _INDEX_HEADER.unpack(header)
+        if magic != INDEX_MAGIC or (device, inode) != log_id:
+            raise ValueError("not an index of the log")
+        self._header = header
+        self._loaded_to = _INDEX_HEADER.size
+
+    def append(self, index: _BlockIndex, log_fh: BinaryIO):
+        """
+        Store the blocks of the index (of the log file opened for
+        reading) following the stored ones.
+        """
+        with open(self.path, "ab") as fh:
+            if fh.tell() == 0:
+                self._header = _INDEX_HEADER.pack(
+                    INDEX_MAGIC, *index.file_id, uuid.uuid4().bytes)
+                fh.write(self._header)
+                self._loaded_to = fh.tell()
+                self._stored_to = 0
+            first = bisect.bisect_right(index.offsets, self._stored_to)
+            blocks = index.blocks[first:]
+            if not blocks:
+                return
+            appended = fh.tell() == self._loaded_to
+            fh.write(b"".join(
+                _INDEX_RECORD.pack(*block,
+                                   get_log_state(log_fh, block.end).checksum)
+                for block in blocks))
+            if appended:
+                # otherwise records stored meanwhile are loaded first
+                self._loaded_to = fh.tell()
+                self._stored_to = blocks[-1].end
+
+    def reset(self):
+        """
+        Load the stored blocks from the start, into a new index.
+        """
+        self._header = b""
+        self._loaded_to = self._stored_to = 0
+
+    def clear(self):
+        """
+        Discard the stored blocks (and their sidecar file).
+        """
+        self.reset()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class BinaryHandler(FileIOHandler):
+    """
+    Manages log entries in a compact binary file (see the module
+    docstring for the format). The byte offset of a record is used as
+    the entry_id. With dictionary_encoded=True, messages repeated within
+    blocks are written once per block.
+
+    Each write appends new blocks - written blocks are never changed, so
+    that writes stay single appends (also of several processes) and
+    readers never see a block being modified. Entries of persist_log()
+    are therefore buffered, up to buffer_size of them, and written as
+    one block when the buffer fills up, on flush() or close(), before
+    reads by the handler, with the next persist_logs() and at exit -
+    until then other handlers (and processes) don't read them.
+    """
+    # maximum number of records in a block
+    block_size = 4096
+
+    def __init__(self,
+                 filepath: str,
+                 dictionary_encoded: bool = False,
+                 rollups: Optional[str] = None,
+                 buffer_size: int = 256):
+        self.dictionary_encoded = dictionary_encoded
+        self.buffer_size = buffer_size
+        self._buffer: List[LogEntry] = []
+        # reentrant - rebuilding rollups of a write reads the log
+        self._write_lock = threading.RLock()
+        self._index: Optional[_BlockIndex] = None
+        self._index_file = _IndexFile(filepath)
+        self._index_lock = threading.Lock()
+        super(BinaryHandler, self).__init__(filepath, rollups)
+
+    def _create_log_if_non_existent(self):
+        if not os.path.exists(self.filepath) \
+                or os.path.getsize(self.filepath) == 0:
+            with self._get_file_handle("wb") as fh:
+                fh.write(FILE_MAGIC)
+            self._discard_sidecars()
+
+    def _discard_sidecars(self):
+        super(BinaryHandler, self)._discard_sidecars()
+        with self._index_lock:
+            self._index = None
+            self._index_file.clear()
+
+    def persist_log(self, entry: LogEntry):
+        with self._write_lock:
+            self._buffer.append(entry)
+            if len(self._buffer) < self.buffer_size:
+                _buffering_handlers.add(self)
+                return
+            self._write_buffered([])
+
+    def persist_logs(self, entries: List[LogEntry]):
+        with self._write_lock:
+            self._write_buffered(entries)
+
+    def flush(self):
+        """
+        Write the buffered entries (see the class docstring).
+        """
+        with self._write_lock:
+            self._write_buffered([])
+
+    def close(self):
+        self.flush()
+
+    def _write_buffered(self, entries: List[LogEntry]):
+        # has to be called with the write lock held
+        entries = self._buffer + entries
+        if not entries:
+            return
+        blocks = [self._encode_block(entries[start:start + self.block_size])
+                  for start in range(0, len(entries), self.block_size)]
+        with self._open_for_writing("ab") as fh:
+            if fh.tell() == 0:
+                # the log was deleted (or emptied)
+                fh.write(FILE_MAGIC)
+            fh.write(b"".join(blocks))
+        # cleared once written, so that a failed write can be retried
+        self._buffer = []
+        _buffering_handlers.discard(self)
+        self._update_rollups(entries)
+        self._store_index()
+
+    def _store_index(self):
+        """
+        Store the blocks of the log (including the written ones) in
+        the sidecar file.
+        """
+        with self._get_file_handle("rb") as fh, map_file(fh) as buffer:
+            if buffer[:len(FILE_MAGIC)] != FILE_MAGIC:
+                return
+            index, _ = self._get_index(fh, buffer)
+            with self._index_lock:
+                self._index_file.append(index, fh)
+
+    def _encode_block(self, entries: List[LogEntry]) -> bytes:
+        pack_record_header = RECORD_HEADER.pack
+        header_size = RECORD_HEADER.size
+        # offsets of the records holding messages, for dictionary encoding
+        message_offsets: Optional[Dict[str, int]] = \
+            {} if self.dictionary_encoded else None
+        position = 0
+        timestamps = []
+        records = []
+        for entry in entries:
+            timestamp = to_epoch_us(entry.date)
+            timestamps.append(timestamp)
+            if message_offsets is not None:
+                message_offset = message_offsets.get(entry.message)
+                if message_offset is not None:
+                    records.append(pack_record_header(
+                        timestamp, entry.level.value | REFERENCE_FLAG,
+                        message_offset))
+                    position += header_size
+                    continue
+                message_offsets[entry.message] = position
+            message = entry.message.encode("utf-8")
+            records.append(pack_record_header(
+                timestamp, entry.level.value, len(message)))
+            records.append(message)
+            position += header_size + len(message)
+        records_data = b"".join(records)
+        return BLOCK_HEADER.pack(BLOCK_MAGIC, len(entries), len(records_data),
+                                 min(timestamps), max(timestamps)) \
+            + records_data
+
+    def retrieve_all_logs(self) -> List[LogEntry]:
+        return list(self.iter_logs())
+
+    def iter_logs(
+            self,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            contains: Optional[str] = None,
+            levels: Optional[Collection[LogLevelValue]] = None) \
+            -> Iterator[LogEntry]:
+        self.flush()
+        try:
+            with self._get_file_handle("rb") as fh, \
+                    map_file(fh) as buffer:
+                if buffer[:len(FILE_MAGIC)] != FILE_MAGIC:
+                    return
+                index, block_count = self._get_index(fh, buffer)
+                yield from self._scan_blocks(
+                    buffer, index, block_count, newest_first, after,
+                    start_date, end_date, contains, levels)
+        except FileNotFoundError as error:
+            self.metrics.count_error(error)
+            return
+
+    def _get_index(self,
+                   fh: BinaryIO,
+                   buffer: Buffer) -> Tuple[_BlockIndex, int]:
+        """
+        Get the block index extended to the end of the mapped file, and
+        the number of blocks in it (index lists are only appended to, so
+        that many blocks can be read without holding the lock).
+        """
+        stat = os.fstat(fh.fileno())
+        file_id = (stat.st_dev, stat.st_ino)
+        with self._index_lock:
+            index = self._index
+            if index is None or index.file_id != file_id \
+                    or index.scanned_to > len(buffer) \
+                    or (index.log_state is not None
+                        and not is_extended(fh, index.log_state)):
+                # a new (or replaced, truncated) file
+                index = self._new_index(file_id)
+            scanned_to = index.scanned_to
+            if not self._index_file.load(index, fh, len(buffer)):
+                index = self._new_index(file_id)
+            index.extend(buffer)
+            if index.scanned_to != scanned_to:
+                index.log_state = get_log_state(fh, index.scanned_to)
+            return index, len(index.blocks)
+
+    def _new_index(self, file_id: Tuple[int, int]) -> _BlockIndex:
+        # has to be called with the index lock held
+        self._index_file.reset()
+        self._index = _BlockIndex(file_id)
+        return self._index
+
+    def count_buckets(
+            self,
+            resolution: str,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None) \
+            -> Optional[Dict[str, Dict[LogLevelValue, int]]]:
+        self.flush()
+        return super(BinaryHandler, self).count_buckets(
+            resolution, start_date, end_date)
+
+    def stats(self) -> Dict:
+        with self._write_lock:
+            buffered = len(self._buffer)
+        return {**super(BinaryHandler, self).stats(), "buffered": buffered}
+
+    def _scan_blocks(
+            self,
+            buffer: Buffer,
+            index: _BlockIndex,
+            block_count: int,
+            newest_first: bool,
+            after: Optional[LogCursor],
+            start_date: Optional[datetime.datetime],
+            end_date: Optional[datetime.datetime],
+            contains: Optional[str],
+            levels: Optional[Collection[LogLevelValue]]) \
+            -> Iterator[LogEntry]:
+        needle = contains.encode("utf-8") if contains else None
+        level_values = None if levels is None \
+            else {level.value for level in levels}
+        lower_bound = to_epoch_us(start_date) if start_date else -2 ** 63
+        upper_bound = to_epoch_us(end_date) if end_date else 2 ** 63
+        cursor_block = None
+        block_numbers = range(block_count)
+        if after:
+            cursor_block = index.find_block(after.entry_id, block_count)
+            block_numbers = range(cursor_block, -1, -1) if newest_first \
+                else range(max(cursor_block, 0), block_count)
+        elif newest_first:
+            block_numbers = range(block_count - 1, -1, -1)
+
+        for block_number in block_numbers:
+            block = index.blocks[block_number]
+            if block.max_timestamp < lower_bound \
+                    or block.min_timestamp > upper_bound:
+                continue
+            records = _read_block_records(buffer, block)
+            if newest_first:
+                records.reverse()
+            # filters are applied to whole blocks, only where needed
+            if after and block_number == cursor_block:
+                records = [record for record in records
+                           if (record[0] < after.entry_id if newest_first
+                               else record[0] > after.entry_id)]
+            if block.min_timestamp < lower_bound \
+                    or block.max_timestamp > upper_bound:
+                records = [record for record in records
+                           if lower_bound <= record[1] <= upper_bound]
+            if level_values is not None:
+                records = [record for record in records
+                           if record[2] in level_values]
+            if needle:
+                records = [record for record in records
+                           if buffer.find(needle, record[3], record[4]) >= 0]
+            yield from _decode_records(buffer, records, self._messages)
+
+
+def _decode_records(
+        buffer: Buffer,
+        records: List[Tuple[int, int, int, int, int]],
+        messages: MessageInterner) -> Iterator[LogEntry]:
+    # messages referred to by several records are decoded once
+    decoded_messages: Dict[int, str] = {}
+    for offset, timestamp, level, message_start, message_end in records:
+        try:
+            message = decoded_messages.get(message_start)
+            if message is None:
+                message = decoded_messages[message_start] = messages.intern(
+                    str(buffer[message_start:message_end], "utf-8"))
+            yield LogEntry(from_epoch_us(timestamp), _LEVELS[level],
+                           message, offset)
+        except (KeyError, UnicodeDecodeError):
+            # damaged records are skipped
+            continue
+
+
+def _read_block_records(
+        buffer: Buffer,
+        block: BlockInfo) -> List[Tuple[int, int, int, int, int]]:
+    """
+    Read (offset, timestamp, level, message start, message end) of
+    the records of a block, without decoding messages.
+    """
+    unpack_record_header = RECORD_HEADER.unpack_from
+    header_size = RECORD_HEADER.size
+    records = []
+    position = block.offset
+    try:
+        while position < block.end:
+            timestamp, level, length = unpack_record_header(buffer, position)
+            if level & REFERENCE_FLAG:
+                referenced = block.offset + length
+                _, referenced_level, message_length = unpack_record_header(
+                    buffer, referenced)
+                # only preceding records holding messages can be referred to
+                if referenced < position \
+                        and not referenced_level & REFERENCE_FLAG:
+                    message_start = referenced + header_size
+                    records.append((position, timestamp,
+                                    level & ~REFERENCE_FLAG, message_start,
+                                    message_start + message_length))
+                position += header_size
+                continue
+            message_start = position + header_size
+            records.append((position, timestamp, level, message_start,
+                            message_start + length))
+            position = message_start + length
+    except struct.error:
+        pass
+    return records
@@ -0,0 +1,269 @@
+"""
+Bloom filters of chunks of log files, for skipping chunks which can't
+contain a searched text.
+
+Filters hold the words (runs of ASCII letters, digits and underscores)
+of a chunk and their 4-grams. A searched text can occur in a chunk only
+if the chunk contains:
++ the words of the text which are delimited within the text (e.g.
+  a request id in "request 7f3a9c handled" - but not "request", which
+  can be the end of a longer word),
++ all 4-grams of the words of the text,
+so chunks whose filter lacks any of them are skipped - filters give
+false positives (chunks which are read in vain), never false negatives.
+Texts without such words or 4-grams can't be looked up.
+
+Filters are kept in a sidecar file ('<log file>.bloom'):
+
+    header:  FILE_MAGIC, <I filter size in bytes, <QQ device and inode
+             of the log file, 16 bytes of a UUID of the sidecar file
+    records: <QQI chunk start and end offsets, checksum of the log up to
+             the chunk end (see profil_logger.log_state), filter bits
+
+Records are only appended, when the log grows by another chunk. Filters
+are used only while the log is the same file, with the same bytes up to
+the end of the last chunk - filters of a replaced log are discarded.
+"""
+import mmap
+import os
+import re
+import struct
+import uuid
+import zlib
+from typing import BinaryIO, Iterable, List, NamedTuple, Optional, Set, \
+    Tuple, Union
+from profil_logger.log_state import LogState, is_extended
+
+FILE_MAGIC = b"PLBLOOM2"
+_HEADER = struct.Struct("<8sIQQ16s")
+_CHUNK_HEADER = struct.Struct("<QQI")
+
+_WORD_PATTERN = re.compile(rb"\w+")
+_NGRAM_SIZE = 4
+# distinguishes whole words from n-grams
+_WORD_PREFIX = b"\x00"
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_HASH_MASK = (1 << 64) - 1
+
+
+def get_tokens(data: bytes) -> Set[bytes]:
+    """
+    Words of the data and their n-grams.
+    """
+    words = set(_WORD_PATTERN.findall(data))
+    tokens = {word[start:start + _NGRAM_SIZE] for word in words
+              for start in range(len(word) - _NGRAM_SIZE + 1)}
+    tokens.update(_WORD_PREFIX + word for word in words)
+    return tokens
+
+
+def get_searched_tokens(searched_data: bytes) -> Set[bytes]:
+    """
+    Tokens which have to be in the data containing the searched data.
+    """
+    tokens = set()
+    for match in _WORD_PATTERN.finditer(searched_data):
+        word = match.group()
+        tokens.update(word[start:start + _NGRAM_SIZE]
+                      for start in range(len(word) - _NGRAM_SIZE + 1))
+        if match.start() > 0 and match.end() < len(searched_data):
+            tokens.add(_WORD_PREFIX + word)
+    return tokens
+
+
+class BloomFilter:
+    """
+    Bloom filter of tokens, with two bit positions per token taken from
+    a multiplicative hash (stable between processes, unlike hash()).
+    """
+    def __init__(self, size: int, bits: Optional[bytes] = None):
+        self.size = size
+        self._bits = bytearray(size) if bits is None else bytearray(bits)
+        self._size_mask = size * 8 - 1
+
+    def add_all(self, tokens: Iterable[bytes]):
+        bits = self._bits
+        size_mask = self._size_mask
+        # _get_positions() inlined - filters are built on writes
+        for token in tokens:
+            hashed = (zlib.crc32(token) * _HASH_MULTIPLIER) & _HASH_MASK
+            position = hashed & size_mask
+            bits[position >> 3] |= 1 << (position & 7)
+            position = (hashed >> 32) & size_mask
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def might_contain_all(self, tokens: Iterable[bytes]) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7))
+                   for token in tokens
+                   for position in self._get_positions(token))
+
+    def _get_positions(self, token: bytes) -> Tuple[int, int]:
+        hashed = (zlib.crc32(token) * _HASH_MULTIPLIER) & _HASH_MASK
+        return hashed & self._size_mask, (hashed >> 32) & self._size_mask
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._bits)
+
+
+class ChunkFilter(NamedTuple):
+    start: int
+    end: int
+    # checksum of the log up to the end of the chunk
+    log_checksum: int
+    bloom_filter: BloomFilter
+
+
+class ChunkBloomIndex:
+    """
+    Bloom filters of consecutive chunks of a log file, stored in
+    a sidecar file. Filters are read once and then only new records
+    are loaded. Chunks are appended by a single writer.
+    """
+    def __init__(self, log_path: str, filter_size: int):
+        self.path = f"{log_path}.bloom"
+        self.filter_size = filter_size
+        self._chunks: List[ChunkFilter] = []
+        # header of the loaded sidecar file
+        self._header = b""
+        self._log_id: Tuple[int, int] = (0, 0)
+        self._loaded_to = 0
+
+    @property
+    def indexed_end(self) -> int:
+        return self._chunks[-1].end if self._chunks else 0
+
+    def load(self, log_fh: BinaryIO) -> List[ChunkFilter]:
+        """
+        Load new filters of the log file opened for reading - filters of
+        another (e.g. deleted and created again) or rewritten log file are
+        discarded.
+        """
+        try:
+            with open(self.path, "rb") as fh:
+                header = fh.read(_HEADER.size)
+                if header != self._header:
+                    # a new (or rewritten) sidecar file - possibly with
+                    # the inode of the loaded one
+                    self._reset()
+                    self._read_header(header)
+                fh.seek(self._loaded_to)
+                self._read_chunks(fh.read())
+        except FileNotFoundError:
+            self._reset()
+        except (ValueError, struct.error):
+            self.clear()
+        if self._chunks and not is_extended(log_fh, LogState(
+                *self._log_id, self.indexed_end,
+                self._chunks[-1].log_checksum)):
+            self.clear()
+        return self._chunks
+
+    def _read_header(self, header: bytes):
+        magic, filter_size, device, inode, _ = _HEADER.unpack(header)
+        if magic != FILE_MAGIC or filter_size != self.filter_size:
+            raise ValueError("incompatible bloom filters")
+        self._header = header
+        self._log_id = (device, inode)
+        self._loaded_to = _HEADER.size
+
+    def _read_chunks(self, data: bytes):
+        record_size = _CHUNK_HEADER.size + self.filter_size
+        # an incomplete record (being written) is read next time
+        complete_size = len(data) - len(data) % record_size
+        for offset in range(0, complete_size, record_size):
+            start, end, log_checksum = _CHUNK_HEADER.unpack_from(data,
+                                                                 offset)
+            bits_start = offset + _CHUNK_HEADER.size
+            bloom_filter = BloomFilter(
+                self.filter_size,
+                data[bits_start:bits_start + self.filter_size])
+            self._chunks.append(ChunkFilter(start, end, log_checksum,
+                                            bloom_filter))
+        self._loaded_to += complete_size
+
+    def append(self, start: int, end: int, data: bytes,
+               log_state: LogState):
+        """
+        Add the filter of a chunk of data (following the last chunk), with
+        the state of the log covering it.
+        """
+        bloom_filter = BloomFilter(self.filter_size)
+        bloom_filter.add_all(get_tokens(data))
+        with open(self.path, "ab") as fh:
+            if fh.tell() == 0:
+                self._header = _HEADER.pack(
+                    FILE_MAGIC, self.filter_size, log_state.device,
+                    log_state.inode, uuid.uuid4().bytes)
+                fh.write(self._header)
+                self._log_id = (log_state.device, log_state.inode)
+            fh.write(_CHUNK_HEADER.pack(start, end, log_state.checksum))
+            fh.write(bloom_filter.to_bytes())
+            self._loaded_to = fh.tell()
+        self._chunks.append(ChunkFilter(start, end, log_state.checksum,
+                                        bloom_filter))
+
+    def clear(self):
+        """
+        Discard the filters (and their sidecar file).
+        """
+        self._reset()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _reset(self):
+        self._chunks, self._header = [], b""
+        self._loaded_to = 0
+
+    def get_scan_ranges(self,
+                        searched_data: bytes,
+                        log_size: int,
+                        log_fh: BinaryIO) -> Optional[List[Tuple[int, int]]]:
+        """
+        Byte ranges of the first log_size bytes of the log which may
+        contain the searched data: chunks whose filters match, and the
+        tail not covered by filters. None means the whole log has to be
+        scanned.
+        """
+        tokens = get_searched_tokens(searched_data)
+        if not tokens:
+            return None
+        chunks = self.load(log_fh)
+        if self.indexed_end > log_size:
+            # the log grew since it was mapped
+            return None
+        ranges: List[Tuple[int, int]] = []
+        for chunk in chunks:
+            if not chunk.bloom_filter.might_contain_all(tokens):
+                continue
+            if ranges and ranges[-1][1] == chunk.start:
+                # adjacent chunks are scanned as one range
+                ranges[-1] = (ranges[-1][0], chunk.end)
+            else:
+                ranges.append((chunk.start, chunk.end))
+        if self.indexed_end < log_size:
+            ranges.append((self.indexed_end, log_size))
+        return ranges
+
+
+def find_chunk_end(buffer: Union[mmap.mmap, bytes],
+                   start: int,
+                   chunk_size: int,
+                   quoted_records: bool = False) -> int:
+    """
+    Offset of the end of a chunk of records starting at the start offset:
+    of the first line end at least chunk_size bytes later (outside of
+    quoted fields, if records can span several lines) - or -1 if there
+    isn't such a line end yet.
+    """
+    line_end = buffer.find(b"\n", start + chunk_size - 1)
+    if line_end >= 0 and quoted_records:
+        quotes = buffer[start:line_end + 1].count(b'"')
+        while line_end >= 0 and quotes % 2:
+            next_line_end = buffer.find(b"\n", line_end + 1)
+            if next_line_end >= 0:
+                quotes += buffer[line_end + 1:next_line_end + 1].count(b'"')
+            line_end = next_line_end
+    return line_end + 1 if line_end >= 0 else -1
@@ -0,0 +1,261 @@
+"""
+Persistent cache of parsed logs, so that new processes reading a big text
+(or JSON) log don't parse it from scratch.
+
+Entries of the source log are kept in columnar segment files (see
+profil_logger.segments) in a '<file>.cache' directory, with a meta.json
+file describing the state of the source they were parsed from: its inode,
+size, modification time and a checksum of its first and last cached
+bytes. When the source only grew (it's appended to by line-based
+handlers), just the appended entries are parsed into a new segment -
+otherwise (e.g. a rewritten JSON array, or a rotated file) the whole log
+is parsed again. Segment files are never changed - a new meta.json file
+replaces the previous one once the segments it lists are written.
+"""
+import datetime
+import itertools
+import json
+import os
+import threading
+import uuid
+import zlib
+from collections import Counter
+from typing import Collection, Dict, Iterable, Iterator, List, Optional
+from profil_logger.handlers import FileIOHandler, Handler, \
+    LineFileIOHandler
+from profil_logger.log_entry import LogCursor, LogEntry, LogLevelValue
+from profil_logger.segments import count_segment, iter_segment, \
+    write_segment
+from profil_logger.timestamps import from_epoch_us, to_epoch_us
+
+CACHE_VERSION = 1
+META_FILE_NAME = "meta.json"
+
+# bytes of the source at the start and at the end of the cached part
+# which have to stay unchanged for the cache to be extended
+_CHECKED_BYTES = 64
+
+
+class CachedHandler(Handler):
+    """
+    Reads entries of the source handler (a FileHandler, CSVHandler,
+    JsonLinesHandler or JsonHandler) from a persistent cache of the parsed
+    log (see the module docstring), refreshed before each read. Entries
+    are written to the source. The cache keeps the entry ids of
+    the source, so cursors are interchangeable.
+
+    Appended entries are cached in new segments - once there are more
+    than max_segments, they're merged into one.
+    """
+    def __init__(self,
+                 source: FileIOHandler,
+                 cache_directory: Optional[str] = None,
+                 block_size: int = 65_536,
+                 max_segments: int = 8):
+        self.source = source
+        self.cache_directory = cache_directory \
+            or f"{source.filepath}.cache"
+        self.block_size = block_size
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        super(CachedHandler, self).__init__()
+
+    def _create_log_if_non_existent(self):
+        os.makedirs(self.cache_directory, exist_ok=True)
+
+    def persist_log(self, entry: LogEntry):
+        self.source.persist_log(entry)
+
+    def persist_logs(self, entries: List[LogEntry]):
+        self.source.persist_logs(entries)
+
+    def bulk_load(self,
+                  entries: Iterable[LogEntry],
+                  batch_size: Optional[int] = None) -> int:
+        return self.source.bulk_load(entries, batch_size)
+
+    def _get_meta_path(self) -> str:
+        return os.path.join(self.cache_directory, META_FILE_NAME)
+
+    def _get_segment_paths(self, file_names: List[str]) -> List[str]:
+        return [os.path.join(self.cache_directory, file_name)
+                for file_name in file_names]
+
+    def _load_meta(self) -> Optional[Dict]:
+        try:
+            with open(self._get_meta_path(), encoding="utf-8") as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("version") == CACHE_VERSION else None
+
+    def _save_meta(self, meta: Dict):
+        temporary_path = f"{self._get_meta_path()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        os.replace(temporary_path, self._get_meta_path())
+
+    def _get_checksum(self, size: int) -> int:
+        with open(self.source.filepath, "rb") as fh:
+            head = fh.read(min(size, _CHECKED_BYTES))
+            fh.seek(max(size - _CHECKED_BYTES, 0))
+            tail = fh.read(min(size, _CHECKED_BYTES))
+        return zlib.crc32(head + tail)
+
+    def refresh(self) -> Optional[List[str]]:
+        """
+        Bring the cache up to date with the source. Returns paths of
+        the segments with all the entries of the source, or None if
+        the cache couldn't be written (the source is read instead).
+        """
+        with self._lock:
+            try:
+                return self._refresh()
+            except OSError as error:
+                self.metrics.count_error(error)
+                return None
+
+    def _refresh(self) -> List[str]:
+        status = os.stat(self.source.filepath)
+        meta = self._load_meta()
+        if meta is not None and meta["inode"] == status.st_ino:
+            if meta["size"] == status.st_size \
+                    and meta["mtime_ns"] == status.st_mtime_ns:
+                return self._get_segment_paths(meta["segments"])
+            if self._is_appended(meta, status.st_size):
+                return self._extend(meta, status)
+        return self._rebuild(meta, status)
+
+    def _is_appended(self, meta: Dict, size: int) -> bool:
+        """
+        Check if the source was only appended to since it was cached.
+        """
+        # entry ids of other sources (e.g. indexes in a JSON array) change
+        # with the appended entries
+        return isinstance(self.source, LineFileIOHandler) \
+            and size > meta["size"] \
+            and self._get_checksum(meta["size"]) == meta["checksum"]
+
+    def _rebuild(self, meta: Optional[Dict],
+                 status: os.stat_result) -> List[str]:
+        new_meta = self._make_meta(status, [], None)
+        self._append_segment(new_meta, self.source.iter_logs())
+        self._replace_meta(new_meta,
+                           meta["segments"] if meta is not None else [])
+        return self._get_segment_paths(new_meta["segments"])
+
+    def _extend(self, meta: Dict, status: os.stat_result) -> List[str]:
+        after = None
+        if meta["last_entry"] is not None:
+            timestamp, entry_id = meta["last_entry"]
+            after = LogCursor(from_epoch_us(timestamp), entry_id)
+        new_meta = self._make_meta(status, meta["segments"],
+                                   meta["last_entry"])
+        self._append_segment(new_meta, self.source.iter_logs(after=after))
+        replaced_segments = meta["segments"]
+        if len(new_meta["segments"]) > self.max_segments:
+            replaced_segments = new_meta["segments"]
+            new_meta["segments"] = []
+            self._append_segment(new_meta, (
+                entry for file_path
+                in self._get_segment_paths(replaced_segments)
+                for entry in iter_segment(file_path, False, None, None,
+                                          None, None, None)))
+        self._replace_meta(new_meta, replaced_segments)
+        return self._get_segment_paths(new_meta["segments"])
+
+    def _make_meta(self, status: os.stat_result, segments: List[str],
+                   last_entry: Optional[List[int]]) -> Dict:
+        return {"version": CACHE_VERSION,
+                "inode": status.st_ino,
+                "size": status.st_size,
+                "mtime_ns": status.st_mtime_ns,
+                "checksum": self._get_checksum(status.st_size),
+                "segments": list(segments),
+                "last_entry": last_entry}
+
+    def _append_segment(self, meta: Dict, entries: Iterator[LogEntry]):
+        """
+        Write entries into a new segment listed in meta (no segment is
+        written if there are no entries).
+        """
+        entries = self._track_last_entry(meta, entries)
+        first_entry = next(entries, None)
+        if first_entry is None:
+            return
+        # segments have unique names, as another process could be
+        # refreshing the cache at the same time
+        file_name = f"segment-{uuid.uuid4().hex}.seg"
+        write_segment(os.path.join(self.cache_directory, file_name),
+                      itertools.chain([first_entry], entries),
+                      self.block_size)
+        meta["segments"].append(file_name)
+
+    @staticmethod
+    def _track_last_entry(meta: Dict,
+                          entries: Iterator[LogEntry]) -> Iterator[LogEntry]:
+        for entry in entries:
+            meta["last_entry"] = [to_epoch_us(entry.date), entry.entry_id]
+            yield entry
+
+    def _replace_meta(self, meta: Dict, replaced_segments: List[str]):
+        """
+        Save meta, and remove the replaced segments not listed in it.
+        """
+        self._save_meta(meta)
+        for file_name in set(replaced_segments) - set(meta["segments"]):
+            try:
+                os.remove(os.path.join(self.cache_directory, file_name))
+            except FileNotFoundError:
+                pass
+
+    def retrieve_all_logs(self) -> List[LogEntry]:
+        return list(self.iter_logs())
+
+    def iter_logs(
+            self,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            contains: Optional[str] = None,
+            levels: Optional[Collection[LogLevelValue]] = None) \
+            -> Iterator[LogEntry]:
+        segment_paths = self.refresh()
+        if segment_paths is None:
+            yield from self.source.iter_logs(
+                newest_first=newest_first, after=after,
+                start_date=start_date, end_date=end_date, contains=contains,
+                levels=levels)
+            return
+        if newest_first:
+            segment_paths.reverse()
+        try:
+            for file_path in segment_paths:
+                # entry ids (offsets in the source) grow across segments
+                yield from iter_segment(file_path, newest_first, after,
+                                        start_date, end_date, contains,
+                                        levels)
+        except (FileNotFoundError, ValueError) as error:
+            self.metrics.count_error(error)
+            return
+
+    def count_logs(
+            self,
+            group_by: str,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None) -> Optional[Dict]:
+        segment_paths = self.refresh()
+        if segment_paths is None:
+            return self.source.count_logs(group_by, start_date, end_date)
+        lower_bound = to_epoch_us(start_date) if start_date else -2 ** 63
+        upper_bound = to_epoch_us(end_date) if end_date else 2 ** 63
+        counts: Counter = Counter()
+        for file_path in segment_paths:
+            count_segment(file_path, group_by, lower_bound, upper_bound,
+                          counts)
+        if group_by == "level":
+            return {level: counts[level] for level in LogLevelValue
+                    if counts[level]}
+        return dict(sorted(counts.items()))
+
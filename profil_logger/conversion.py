@@ -0,0 +1,64 @@
+"""
+Conversion of logs between handlers (see also python3 -m profil_logger,
+converting logs from the command line).
+"""
+import os
+import time
+from typing import Callable, Dict, Iterable, Iterator, Optional
+from profil_logger.binary_handler import BinaryHandler
+from profil_logger.handlers import CSVHandler, FileHandler, Handler, \
+    JsonHandler, JsonLinesHandler, SQLiteHandler
+from profil_logger.log_entry import LogEntry
+
+# handlers of logs, by file extensions
+HANDLERS_BY_EXTENSION: Dict[str, Callable[[str], Handler]] = {
+    ".txt": FileHandler, ".log": FileHandler, ".csv": CSVHandler,
+    ".jsonl": JsonLinesHandler, ".json": JsonHandler,
+    ".sqlite": SQLiteHandler, ".db": SQLiteHandler, ".bin": BinaryHandler}
+
+ProgressCallback = Callable[[int, float], None]
+
+
+def open_log(path: str) -> Handler:
+    """
+    A handler of the log file, chosen by its extension.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in HANDLERS_BY_EXTENSION:
+        raise ValueError(f"Unknown log format: {path}")
+    return HANDLERS_BY_EXTENSION[extension](path)
+
+
+def copy_logs(source: Handler, target: Handler,
+              batch_size: Optional[int] = None,
+              progress: Optional[ProgressCallback] = None,
+              progress_interval: float = 1.0) -> int:
+    """
+    Copy all entries of the source handler to the target handler (e.g.
+    to convert a text log into the binary format), in the logging order.
+    Entries are streamed in batches written with the target's fastest way
+    of writing many entries (see Handler.bulk_load()), so the whole log is
+    never loaded into memory. progress(copied entries, seconds) is called
+    every progress_interval seconds. Returns the number of copied
+    entries.
+    """
+    entries: Iterable[LogEntry] = source.iter_logs()
+    if progress is not None:
+        entries = _report_progress(entries, progress, progress_interval)
+    return target.bulk_load(entries, batch_size)
+
+
+def _report_progress(entries: Iterable[LogEntry],
+                     progress: ProgressCallback,
+                     interval: float) -> Iterator[LogEntry]:
+    started = time.perf_counter()
+    reported = started
+    count = 0
+    for count, entry in enumerate(entries, 1):
+        # the clock is checked every 1024 entries
+        if not count % 1024:
+            now = time.perf_counter()
+            if now - reported >= interval:
+                progress(count, now - started)
+                reported = now
+        yield entry
@@ -0,0 +1,331 @@
+import atexit
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+from profil_logger.handlers import Handler
+from profil_logger.log_entry import LogEntry
+
+
+class Dispatcher(ABC):
+    """
+    Base-abstract class for strategies of writing logged entries
+    to handlers.
+    """
+    @abstractmethod
+    def dispatch(self, entry: LogEntry, handlers: Sequence[Handler]):
+        pass
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until dispatched entries are written.
+        """
+        return True
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict[Handler, Dict]:
+        return {}
+
+
+class SerialDispatcher(Dispatcher):
+    """
+    Writes entries to handlers one after another, in the logging thread.
+    Writes are timed in the metrics of handlers.
+    """
+    def dispatch(self, entry: LogEntry, handlers: Sequence[Handler]):
+        for log_handler in handlers:
+            started = time.perf_counter()
+            try:
+                log_handler.persist_log(entry)
+            except Exception:
+                log_handler.metrics.record_failed_write()
+                raise
+            log_handler.metrics.record_write(
+                1, time.perf_counter() - started)
+
+
+class CircuitBreaker:
+    """
+    Sheds a handler after a number of consecutive failed (or too slow)
+    writes. After reset_timeout seconds a single trial write is let
+    through (see acquire_write()): it closes the circuit on success or
+    opens it again. Entries submitted meanwhile wait for its result.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._state = self.CLOSED
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if (self._state == self.OPEN and time.monotonic()
+                - self._opened_at >= self.reset_timeout):
+            return self.HALF_OPEN
+        return self._state
+
+    def allows(self) -> bool:
+        """
+        Check if entries for the handler are accepted (to be written, or
+        to wait for the trial write).
+        """
+        return self.state != self.OPEN
+
+    def acquire_write(self) -> bool:
+        """
+        Check if a write can be made - while half-open, only the trial
+        write is allowed until its result is recorded.
+        """
+        with self._lock:
+            state = self.state
+            if state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    return False
+                self._trial_in_flight = True
+            return state != self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._state = self.CLOSED
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if (self._trial_in_flight or self._consecutive_failures
+                    >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class HandlerWorker:
+    """
+    Writes entries to a single handler in a dedicated thread, in batches
+    of entries collected in its queue. Writes taking longer than timeout
+    seconds count as failures of the handler (a running write can't be
+    interrupted, but the logging thread never waits for it).
+    """
+    _stop = object()
+
+    def __init__(self,
+                 handler: Handler,
+                 queue_size: int = 10_000,
+                 timeout: float = 1.0,
+                 batch_size: int = 256,
+                 circuit_breaker: Optional[CircuitBreaker] = None):
+        self.handler = handler
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._written = 0
+        self._failed = 0
+        self._shed = 0
+        self._dropped = 0
+        self._lag = 0.0
+        self._last_write_duration = 0.0
+        self._thread = threading.Thread(
+            target=self._run, name=f"{type(handler).__name__}-worker",
+            daemon=True)
+        self._thread.start()
+
+    def submit(self, entry: LogEntry) -> bool:
+        """
+        Enqueue an entry without blocking. Returns False if the entry was
+        shed (open circuit) or dropped (full queue).
+        """
+        if not self.circuit_breaker.allows():
+            self._shed += 1
+            return False
+        try:
+            self._queue.put_nowait((time.monotonic(), entry))
+        except queue.Full:
+            self._dropped += 1
+            return False
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the queued entries are written (or shed).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None \
+                    else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        if self._thread.is_alive():
+            self._queue.put((time.monotonic(), self._stop))
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict:
+        return {"queued": self._queue.qsize(),
+                "written": self._written,
+                "failed": self._failed,
+                "shed": self._shed,
+                "dropped": self._dropped,
+                "lag_seconds": self._lag,
+                "last_write_seconds": self._last_write_duration,
+                "circuit": self.circuit_breaker.state}
+
+    def _run(self):
+        while True:
+            batch = self._get_batch()
+            stop = batch[-1][1] is self._stop
+            if stop:
+                batch.pop()
+            if batch:
+                self._write(batch)
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _get_batch(self) -> List[Tuple[float, LogEntry]]:
+        batch = [self._queue.get()]
+        while len(batch) < self.batch_size \
+                and batch[-1][1] is not self._stop:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[Tuple[float, LogEntry]]):
+        if not self.circuit_breaker.acquire_write():
+            self._shed += len(batch)
+            return
+        if self.circuit_breaker.state == CircuitBreaker.HALF_OPEN \
+                and len(batch) > 1:
+            # the trial is a single entry - the rest of the batch is
+            # written (or shed) after its result
+            self._write_allowed(batch[:1])
+            self._write(batch[1:])
+            return
+        self._write_allowed(batch)
+
+    def _write_allowed(self, batch: List[Tuple[float, LogEntry]]):
+        started = time.monotonic()
+        try:
+            self.handler.persist_logs([entry for _, entry in batch])
+        except Exception:
+            self._failed += len(batch)
+            self.handler.metrics.record_failed_write()
+            self.circuit_breaker.record_failure()
+            return
+        finished = time.monotonic()
+        self._written += len(batch)
+        self.handler.metrics.record_write(len(batch), finished - started)
+        self._lag = finished - batch[0][0]
+        self._last_write_duration = finished - started
+        if self._last_write_duration > self.timeout:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+
+
+class ConcurrentDispatcher(Dispatcher):
+    """
+    Fans entries out to handlers concurrently - each handler has its own
+    worker thread and queue, so a slow or failing handler delays neither
+    the other handlers nor the logging thread. Queued entries are written
+    by close(), also called at exit - entries dispatched afterwards are
+    written in the logging thread.
+    """
+    def __init__(self,
+                 queue_size: int = 10_000,
+                 timeout: float = 1.0,
+                 batch_size: int = 256,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30.0):
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._workers: Dict[Handler, HandlerWorker] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        atexit.register(self.close)
+
+    def dispatch(self, entry: LogEntry, handlers: Sequence[Handler]):
+        with self._lock:
+            if not self._closed:
+                for log_handler in handlers:
+                    worker = self._workers.get(log_handler) \
+                        or self._start_worker(log_handler)
+                    worker.submit(entry)
+                return
+        # entries logged after close() (e.g. by other functions called at
+        # exit) are written in the logging thread
+        self._write_closed(entry, handlers)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in list(self._workers.values()):
+            remaining = None if deadline is None \
+                else max(0.0, deadline - time.monotonic())
+            if not worker.flush(remaining):
+                return False
+        return True
+
+    def close(self):
+        # workers are closed under the lock, so entries dispatched
+        # meanwhile are written after the queued ones
+        with self._lock:
+            self._closed = True
+            workers, self._workers = self._workers, {}
+            atexit.unregister(self.close)
+            for worker in workers.values():
+                worker.close()
+
+    def stats(self) -> Dict[Handler, Dict]:
+        return {log_handler: worker.stats()
+                for log_handler, worker in list(self._workers.items())}
+
+    def _start_worker(self, log_handler: Handler) -> HandlerWorker:
+        """
+        Start the worker of a handler (called with the lock held).
+        """
+        worker = HandlerWorker(
+            log_handler,
+            queue_size=self.queue_size,
+            timeout=self.timeout,
+            batch_size=self.batch_size,
+            circuit_breaker=CircuitBreaker(self.failure_threshold,
+                                           self.reset_timeout))
+        self._workers[log_handler] = worker
+        return worker
+
+    def _write_closed(self, entry: LogEntry, handlers: Sequence[Handler]):
+        """
+        Write an entry dispatched after close() - like the workers, failed
+        writes are only counted, the logging call never raises.
+        """
+        for log_handler in handlers:
+            started = time.perf_counter()
+            try:
+                log_handler.persist_log(entry)
+            except Exception:
+                log_handler.metrics.record_failed_write()
+                continue
+            log_handler.metrics.record_write(
+                1, time.perf_counter() - started)
@@ -1,11 +1,25 @@
+import contextlib
 import csv
 import datetime
+import io
+import itertools
 import json
+import mmap
 import os
+import re
 import sqlite3
 from abc import ABC, abstractmethod
-from typing import Dict, IO, List, TextIO, Tuple
-from profil_logger.log_entry import LogEntry, LogLevelValue
+from typing import Any, BinaryIO, Collection, ContextManager, Dict, IO, \
+    Iterable, Iterator, List, Optional, Set, TextIO, Tuple, Union
+from profil_logger.bloom import ChunkBloomIndex, find_chunk_end
+from profil_logger.log_entry import LogCursor, LogEntry, LogLevelValue, \
+    MessageInterner
+from profil_logger.log_state import get_log_state
+from profil_logger.metrics import HandlerMetrics
+from profil_logger.rollups import BUCKET_KEY_LENGTHS, ROLLUP_RESOLUTIONS, \
+    RollupCounts, RollupFile, count_entries, covers_whole_buckets, \
+    get_key_range, group_counts, is_finer_or_equal, iter_counts, sum_buckets
+from profil_logger.timestamps import format_timestamp, parse_timestamp
 
 
 class Handler(ABC):
@@ -13,7 +27,13 @@ class Handler(ABC):
     Base-abstract class for creating handlers for managing
     logs (creating log backends and storing, retrieving entries).
     """
+    # number of entries written at once by bulk_load()
+    bulk_batch_size = 10_000
+
     def __init__(self):
+        # read entries share str objects of repeated messages
+        self._messages = MessageInterner()
+        self.metrics = HandlerMetrics()
         self._create_log_if_non_existent()
 
     @abstractmethod
@@ -23,6 +43,33 @@ class Handler(ABC):
         """
         pass
 
+    def persist_logs(self, entries: List[LogEntry]):
+        """
+        Persists a batch of entries - handlers override it to write
+        the whole batch at once.
+        """
+        for entry in entries:
+            self.persist_log(entry)
+
+    def bulk_load(self,
+                  entries: Iterable[LogEntry],
+                  batch_size: Optional[int] = None) -> int:
+        """
+        Write a stream of entries (e.g. converted from another log) in
+        batches, without loading all of them into memory - handlers
+        override it with their fastest way of writing many entries.
+        Returns the number of written entries.
+        """
+        entries = iter(entries)
+        loaded = 0
+        while True:
+            batch = list(itertools.islice(
+                entries, batch_size or self.bulk_batch_size))
+            if not batch:
+                return loaded
+            self.persist_logs(batch)
+            loaded += len(batch)
+
     @abstractmethod
     def retrieve_all_logs(self) -> List[LogEntry]:
         """
@@ -31,52 +78,594 @@ class Handler(ABC):
         """
         pass
 
+    def iter_logs(
+            self,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            contains: Optional[str] = None,
+            levels: Optional[Collection[LogLevelValue]] = None) \
+            -> Iterator[LogEntry]:
+        """
+        Lazily iterate over stored entries in the logging order (or from
+        the newest one), continuing past the 'after' cursor if given.
+        Boundary dates, the 'contains' text and 'levels' are hints -
+        handlers able to use them may skip entries logged outside of
+        the period, with messages not containing the text or of other
+        levels, but callers should still filter the returned entries.
+        """
+        entries = self.retrieve_all_logs()
+        if newest_first:
+            entries.reverse()
+        if after:
+            entries = [entry for entry in entries
+                       if _is_past_cursor(entry, after, newest_first)]
+        return iter(entries)
+
+    def count_logs(
+            self,
+            group_by: str,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None) -> Optional[Dict]:
+        """
+        Count entries logged between start_date and end_date (inclusive)
+        by "level" (LogLevelValue keys) or "month" ('year-month' keys).
+        Handlers able to count entries without reading them (e.g. from
+        metadata or with a database query) override it - None means
+        the entries have to be counted by the caller.
+        """
+        return None
+
+    def count_buckets(
+            self,
+            resolution: str,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None) \
+            -> Optional[Dict[str, Dict[LogLevelValue, int]]]:
+        """
+        Count entries by levels in time buckets of the resolution
+        ("minute", "hour", "day" or "month" - keyed by timestamp prefixes,
+        e.g. '2020-01-01T10' for an hour) overlapping the period. Handlers
+        maintaining rollups (see profil_logger.rollups) override it -
+        None means the entries have to be counted by the caller.
+        """
+        return None
+
+    def stats(self) -> Dict:
+        """
+        A snapshot of the handler metrics (see profil_logger.metrics).
+        """
+        return self.metrics.stats()
+
     def _create_log_if_non_existent(self):
         pass
 
 
+def _is_past_cursor(entry: LogEntry,
+                    cursor: LogCursor,
+                    newest_first: bool) -> bool:
+    entry_key = (entry.date, -1 if entry.entry_id is None
+                 else entry.entry_id)
+    if newest_first:
+        return entry_key < tuple(cursor)
+    return entry_key > tuple(cursor)
+
+
 class FileIOHandler(Handler):
     """
     Generic class for inheriting classes using file input-output.
+
+    With rollups set to "minute", "hour" or "day", numbers of written
+    entries per level and bucket of that resolution are kept in
+    a '<file>.rollups' sidecar file, and entries are counted from them.
     """
-    def __init__(self, filepath: str):
+    # True if writes rewrite the log instead of appending to it
+    rewrites_log = False
+
+    def __init__(self, filepath: str, rollups: Optional[str] = None):
         self.filepath = filepath
+        self._rollups = RollupFile(filepath, rollups) if rollups else None
+        # rollups of a rewritten log are checked before the rewrite
+        self._rollups_checked = False
         super(FileIOHandler, self).__init__()
 
     def _get_file_handle(self, mode: str, **kwargs) -> IO:
         return open(self.filepath, mode, **kwargs)
 
+    @contextlib.contextmanager
+    def _open_for_writing(self, mode: str, **kwargs) -> Iterator[IO]:
+        """
+        Open the file for appending (or rewriting), counting written bytes
+        in the metrics.
+        """
+        with self._get_file_handle(mode, **kwargs) as fh:
+            start = fh.tell()
+            if start == 0 and "a" in mode:
+                # the log was deleted (or emptied) and is created again
+                self._discard_sidecars()
+            yield fh
+            self.metrics.add_bytes(fh.tell() - start)
+
+    def _discard_sidecars(self):
+        """
+        Remove sidecar files describing a previous log of the path - called
+        when a new log file is created.
+        """
+        if self._rollups is not None:
+            self._rollups.clear()
+
+    def rebuild_rollups(self):
+        """
+        Count all the entries of the log into new rollups (e.g. of a log
+        written before rollups were enabled).
+        """
+        if self._rollups is None:
+            return
+        with self._get_file_handle("rb") as fh:
+            log_state = get_log_state(fh)
+        counts = count_entries(self.iter_logs(), self._rollups.resolution)
+        self._rollups.write(counts, log_state)
+        self._rollups_checked = True
+
+    def _check_rollups(self):
+        """
+        Check if rollups match the log before it's rewritten (handlers
+        rewriting the log call it before each write - the rewritten log
+        can't be checked against them).
+        """
+        if self._rollups is not None:
+            self._rollups_checked = self._load_rollups() is not None
+
+    def _update_rollups(self, entries: List[LogEntry]):
+        """
+        Add written entries to rollups - rollups missing (or not matching
+        the log) are rebuilt instead.
+        """
+        if self._rollups is None:
+            return
+        with self._get_file_handle("rb") as fh:
+            if self.rewrites_log:
+                rollups_match = self._rollups_checked
+            else:
+                rollups_match = self._rollups.load(fh) is not None
+            if rollups_match:
+                self._rollups.append(
+                    count_entries(entries, self._rollups.resolution),
+                    get_log_state(fh))
+                return
+        self.rebuild_rollups()
+
+    def _load_rollups(self) -> Optional[RollupCounts]:
+        if self._rollups is None:
+            return None
+        try:
+            with self._get_file_handle("rb") as fh:
+                return self._rollups.load(fh)
+        except FileNotFoundError:
+            return None
+
+    def count_logs(
+            self,
+            group_by: str,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None) -> Optional[Dict]:
+        if self._rollups is None or not covers_whole_buckets(
+                self._rollups.resolution, start_date, end_date):
+            return None
+        buckets = self.count_buckets(self._rollups.resolution, start_date,
+                                     end_date)
+        return None if buckets is None else sum_buckets(buckets, group_by)
+
+    def count_buckets(
+            self,
+            resolution: str,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None) \
+            -> Optional[Dict[str, Dict[LogLevelValue, int]]]:
+        if self._rollups is None \
+                or not is_finer_or_equal(self._rollups.resolution,
+                                         resolution):
+            return None
+        counts = self._load_rollups()
+        if counts is None:
+            return None
+        first_key, last_key = get_key_range(
+            self._rollups.resolution, resolution, start_date, end_date)
+        return group_counts(iter_counts(counts), resolution, first_key,
+                            last_key)
+
 
-class FileHandler(FileIOHandler):
+class LineFileIOHandler(FileIOHandler):
+    """
+    Generic class for handlers appending entries to a text file as
+    (possibly multi-line) records. The byte offset of a record is used as
+    the entry_id, which allows reading the file from any cursor - also
+    backwards, from the end of the file.
+
+    With bloom_filters=True, Bloom filters of chunks of the file (see
+    profil_logger.bloom) are kept in a '<file>.bloom' sidecar file,
+    updated whenever entries written since the last update fill another
+    chunk - text searches skip chunks which can't contain the text.
+    """
+    read_block_size = 64 * 1024
+    # True if records can span several lines inside double-quoted fields
+    quoted_records = False
+    # minimum size of chunks covered by Bloom filters
+    bloom_chunk_size = 64 * 1024
+    # size of a Bloom filter of a chunk in bytes (a power of two)
+    bloom_filter_size = 8 * 1024
+
+    def __init__(self,
+                 filepath: str,
+                 bloom_filters: bool = False,
+                 rollups: Optional[str] = None):
+        self._bloom_index = ChunkBloomIndex(
+            filepath, self.bloom_filter_size) if bloom_filters else None
+        super(LineFileIOHandler, self).__init__(filepath, rollups)
+
+    def _discard_sidecars(self):
+        super(LineFileIOHandler, self)._discard_sidecars()
+        if self._bloom_index is not None:
+            self._bloom_index.clear()
+
+    def update_bloom_filters(self):
+        """
+        Add Bloom filters of complete chunks not covered yet (e.g. of
+        a log written before the filters were enabled).
+        """
+        if self._bloom_index is None:
+            return
+        with self._get_file_handle("rb") as fh, map_file(fh) as buffer:
+            self._bloom_index.load(fh)
+            start = self._bloom_index.indexed_end
+            while True:
+                end = find_chunk_end(buffer, start, self.bloom_chunk_size,
+                                     self.quoted_records)
+                if end < 0:
+                    return
+                self._bloom_index.append(start, end, buffer[start:end],
+                                         get_log_state(fh, end))
+                start = end
+
+    def _update_bloom_filters_if_needed(self):
+        if self._bloom_index is not None and os.path.getsize(self.filepath) \
+                - self._bloom_index.indexed_end >= self.bloom_chunk_size:
+            self.update_bloom_filters()
+
+    def _get_scan_ranges(
+            self,
+            contains: Optional[str],
+            file_size: int,
+            fh: BinaryIO) -> List[Tuple[int, int]]:
+        """
+        Byte ranges of the first file_size bytes of the file (opened for
+        reading) to scan for entries containing the text.
+        """
+        ranges = None
+        if self._bloom_index is not None and contains:
+            ranges = self._bloom_index.get_scan_ranges(
+                self._encode_searched_text(contains), file_size, fh)
+        return [(0, file_size)] if ranges is None else ranges
+
+    def _encode_searched_text(self, text: str) -> bytes:
+        """
+        Encode a text the way it's stored in the file.
+        """
+        return text.encode("utf-8")
+
+    def iter_logs(
+            self,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            contains: Optional[str] = None,
+            levels: Optional[Collection[LogLevelValue]] = None) \
+            -> Iterator[LogEntry]:
+        try:
+            with self._get_file_handle("rb") as fh:
+                file_size = fh.seek(0, os.SEEK_END)
+                ranges = self._get_scan_ranges(contains, file_size, fh)
+                if newest_first:
+                    end = after.entry_id if after else file_size
+                    records = itertools.chain.from_iterable(
+                        self._iter_records_backward(
+                            fh, min(range_end, end), range_start)
+                        for range_start, range_end in reversed(ranges)
+                        if range_start < end)
+                else:
+                    start = after.entry_id if after else 0
+                    records = itertools.chain.from_iterable(
+                        self._iter_records_forward(
+                            fh, max(range_start, start), range_end)
+                        for range_start, range_end in ranges
+                        if range_end > start)
+                    if after:
+                        records = (record for record in records
+                                   if record[0] > after.entry_id)
+                for offset, record in records:
+                    try:
+                        yield self._parse_record(record, offset)
+                    except (ValueError, KeyError, IndexError,
+                            TypeError) as error:
+                        self.metrics.count_error(error)
+                        # malformed records (and csv headers) are skipped
+                        continue
+        except FileNotFoundError:
+            return
+
+    @abstractmethod
+    def _parse_record(self, record: bytes, offset: int) -> LogEntry:
+        pass
+
+    def _iter_records_forward(
+            self,
+            fh: BinaryIO,
+            start: int,
+            end: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+        fh.seek(start)
+        offset = start
+        record_start = start
+        pending: List[bytes] = []
+        quotes = 0
+        for line in fh:
+            if not pending:
+                if end is not None and offset >= end:
+                    return
+                record_start = offset
+            offset += len(line)
+            pending.append(line)
+            quotes += line.count(b'"') if self.quoted_records else 0
+            if quotes % 2 == 0:
+                record = b"".join(pending).rstrip(b"\r\n")
+                pending, quotes = [], 0
+                if record:
+                    yield record_start, record
+
+    def _iter_records_backward(
+            self,
+            fh: BinaryIO,
+            end: Optional[int] = None,
+            start: int = 0) -> Iterator[Tuple[int, bytes]]:
+        pending: List[bytes] = []
+        quotes = 0
+        for line_start, line in self._iter_lines_backward(fh, end, start):
+            if not pending and not line.rstrip(b"\r"):
+                continue
+            pending.append(line)
+            quotes += line.count(b'"') if self.quoted_records else 0
+            if quotes % 2 == 0:
+                # like forward reads, only the terminator of the record's
+                # last line is stripped
+                yield line_start, b"\n".join(reversed(pending)).rstrip(
+                    b"\r\n")
+                pending, quotes = [], 0
+
+    def _iter_lines_backward(
+            self,
+            fh: BinaryIO,
+            end: Optional[int] = None,
+            start: int = 0) -> Iterator[Tuple[int, bytes]]:
+        position = fh.seek(0, os.SEEK_END) if end is None else end
+        tail = b""
+        while position > start:
+            size = min(self.read_block_size, position - start)
+            position -= size
+            fh.seek(position)
+            block = fh.read(size) + tail
+            lines = block.split(b"\n")
+            tail = lines[0]
+            line_end = position + len(block)
+            for line in reversed(lines[1:]):
+                line_start = line_end - len(line)
+                yield line_start, line
+                line_end = line_start - 1
+        if tail:
+            yield start, tail
+
+
+# lengths of naive ISO 8601 timestamps: without and with microseconds
+_ISO_TIMESTAMP_LENGTHS = (19, 26)
+
+Buffer = Union[mmap.mmap, bytes]
+
+
+def map_file(fh: BinaryIO) -> ContextManager[Buffer]:
+    """
+    Map a file opened for reading into memory (read-only).
+    """
+    try:
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        # empty (or special) files can't be mapped
+        return contextlib.nullcontext(fh.read())
+
+
+class FileHandler(LineFileIOHandler):
     """
     Manages log entries in file-based storage.
+
+    The file is read through a memory map: lines are found and filtered
+    by dates (timestamps compared as bytes) and text (searched with
+    find()) in the mapped file, and only returned lines are decoded.
     """
     def _create_log_if_non_existent(self):
         if not os.path.exists(self.filepath):
             with self._get_file_handle("w") as fh:
                 fh.write("")
+            self._discard_sidecars()
 
     def persist_log(self, entry: LogEntry):
         log_line = f"{entry['date']} {entry['level']} {entry['message']}\n"
-        with self._get_file_handle("a") as fh:
+        with self._open_for_writing("a") as fh:
             fh.write(log_line)
+        self._update_bloom_filters_if_needed()
+        self._update_rollups([entry])
+
+    def persist_logs(self, entries: List[LogEntry]):
+        log_lines = "".join(
+            f"{entry['date']} {entry['level']} {entry['message']}\n"
+            for entry in entries)
+        with self._open_for_writing("a") as fh:
+            fh.write(log_lines)
+        self._update_bloom_filters_if_needed()
+        self._update_rollups(entries)
 
     def retrieve_all_logs(self) -> List[LogEntry]:
         try:
-            with self._get_file_handle("r") as fh:
-                log_entries = self._read_entries_from_file(fh)
-        except (FileNotFoundError, ValueError):
+            with self._get_file_handle("rb") as fh, \
+                    map_file(fh) as buffer:
+                log_entries = self._read_entries_from_buffer(buffer)
+        except (FileNotFoundError, ValueError) as error:
+            self.metrics.count_error(error)
             return []
         return log_entries
 
-    def _read_entries_from_file(self, file_handle: TextIO) -> List[LogEntry]:
-        return [self._read_line_into_log_entry(line)
-                for line in filter(None, file_handle.readlines())]
+    def _read_entries_from_buffer(self, buffer: Buffer) -> List[LogEntry]:
+        return [self._read_line_into_log_entry(
+                    buffer[line_start:line_end].decode("utf-8"))
+                for line_start, line_end
+                in self._iter_buffer_lines(buffer, 0)]
+
+    def iter_logs(
+            self,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            contains: Optional[str] = None,
+            levels: Optional[Collection[LogLevelValue]] = None) \
+            -> Iterator[LogEntry]:
+        try:
+            with self._get_file_handle("rb") as fh, \
+                    map_file(fh) as buffer:
+                yield from self._scan_buffer(
+                    fh, buffer, newest_first, after, start_date, end_date,
+                    contains, levels)
+        except FileNotFoundError as error:
+            self.metrics.count_error(error)
+            return
+
+    def _scan_buffer(
+            self,
+            fh: BinaryIO,
+            buffer: Buffer,
+            newest_first: bool,
+            after: Optional[LogCursor],
+            start_date: Optional[datetime.datetime],
+            end_date: Optional[datetime.datetime],
+            contains: Optional[str],
+            levels: Optional[Collection[LogLevelValue]]) \
+            -> Iterator[LogEntry]:
+        needle = contains.encode("utf-8") if contains else None
+        level_names = None if levels is None \
+            else {level.name.encode("ascii") for level in levels}
+        lower_bound = _get_timestamp_bound(start_date)
+        upper_bound = _get_timestamp_bound(end_date)
+        ranges = self._get_scan_ranges(contains, len(buffer), fh)
+        if newest_first:
+            end = after.entry_id if after else len(buffer)
+            lines = itertools.chain.from_iterable(
+                self._iter_buffer_lines_backward(
+                    buffer, min(range_end, end), needle, range_start)
+                for range_start, range_end in reversed(ranges)
+                if range_start < end)
+        else:
+            start = 0
+            if after:
+                cursor_line_end = buffer.find(b"\n", after.entry_id)
+                start = len(buffer) if cursor_line_end < 0 \
+                    else cursor_line_end + 1
+            lines = itertools.chain.from_iterable(
+                self._iter_buffer_lines(
+                    buffer, max(range_start, start), needle, range_end)
+                for range_start, range_end in ranges
+                if range_end > start)
+
+        for line_start, line_end in lines:
+            date_end = buffer.find(b" ", line_start, line_end)
+            if date_end < 0:
+                continue
+            if (lower_bound or upper_bound) and not _timestamp_in_range(
+                    buffer[line_start:date_end], lower_bound, upper_bound):
+                continue
+            if needle or level_names is not None:
+                level_end = buffer.find(b" ", date_end + 1, line_end)
+                if level_end < 0:
+                    continue
+                if level_names is not None and buffer[
+                        date_end + 1:level_end] not in level_names:
+                    continue
+                if needle and buffer.find(
+                        needle, level_end + 1, line_end) < 0:
+                    continue
+            try:
+                entry = self._parse_record(
+                    buffer[line_start:line_end].rstrip(b"\r"), line_start)
+            except (ValueError, KeyError, IndexError) as error:
+                self.metrics.count_error(error)
+                continue
+            yield entry
+
+    @staticmethod
+    def _iter_buffer_lines(
+            buffer: Buffer,
+            start: int,
+            needle: Optional[bytes] = None,
+            end: Optional[int] = None) -> Iterator[Tuple[int, int]]:
+        """
+        Yield (start, end) offsets of non-empty lines between the start
+        and end offsets - only of those containing the needle, if given,
+        which is searched for in the whole range instead of line by line.
+        """
+        end = len(buffer) if end is None else end
+        position = start
+        while position < end:
+            if needle:
+                hit = buffer.find(needle, position, end)
+                if hit < 0:
+                    return
+                line_start = buffer.rfind(b"\n", position, hit) + 1 \
+                    or position
+            else:
+                hit = line_start = position
+            line_end = buffer.find(b"\n", hit, end)
+            if line_end < 0:
+                line_end = end
+            if line_end > line_start:
+                yield line_start, line_end
+            position = line_end + 1
+
+    @staticmethod
+    def _iter_buffer_lines_backward(
+            buffer: Buffer,
+            end: int,
+            needle: Optional[bytes] = None,
+            start: int = 0) -> Iterator[Tuple[int, int]]:
+        position = end
+        while position > start:
+            if needle:
+                hit = buffer.rfind(needle, start, position)
+                if hit < 0:
+                    return
+                line_end = buffer.find(b"\n", hit, position)
+                if line_end < 0:
+                    line_end = position
+            else:
+                line_end = position
+                if buffer[line_end - 1] == ord("\n"):
+                    line_end -= 1
+                hit = line_end
+            line_start = max(buffer.rfind(b"\n", start, hit) + 1, start)
+            if line_end > line_start:
+                yield line_start, line_end
+            position = line_start
 
     @staticmethod
     def _read_line_into_log_entry(line: str) -> LogEntry:
         parts = line.strip().split(" ", 2)
-        date = datetime.datetime.fromisoformat(parts[0])
+        date = parse_timestamp(parts[0])
         level = LogLevelValue[parts[1]]
         msg = parts[2]
         if len(parts) == 3:
@@ -86,30 +675,183 @@ class FileHandler(FileIOHandler):
             raise ValueError
         return log_entry
 
+    def _parse_record(self, record: bytes, offset: int) -> LogEntry:
+        parts = record.decode("utf-8").split(" ", 2)
+        return LogEntry(date=parse_timestamp(parts[0]),
+                        level=LogLevelValue[parts[1]],
+                        msg=self._messages.intern(parts[2]),
+                        entry_id=offset)
+
+
+def _get_timestamp_bound(
+        date: Optional[datetime.datetime]) -> Optional[bytes]:
+    if date is None:
+        return None
+    bound = format_timestamp(date).encode("ascii")
+    return bound if len(bound) in _ISO_TIMESTAMP_LENGTHS else None
+
+
+def _timestamp_in_range(timestamp: bytes,
+                        lower_bound: Optional[bytes],
+                        upper_bound: Optional[bytes]) -> bool:
+    """
+    Naive ISO 8601 timestamps are ordered like their byte strings; other
+    timestamps are passed on to be compared after parsing.
+    """
+    if len(timestamp) not in _ISO_TIMESTAMP_LENGTHS:
+        return True
+    return (lower_bound is None or timestamp >= lower_bound) \
+        and (upper_bound is None or timestamp <= upper_bound)
+
+
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def _iter_json_array(fh: TextIO, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """
+    Parse items of a JSON array incrementally, holding a chunk of the file
+    (and the item being parsed) in memory. Items have to be objects or
+    arrays - a number cut at the end of a chunk would be parsed as it is.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    # "[", then "item" or "]", then "," or "]", and "item" again
+    expected = "["
+    while True:
+        position = _JSON_WHITESPACE.match(buffer, position).end()
+        if position == len(buffer):
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                raise json.JSONDecodeError("Unterminated array", buffer,
+                                           position)
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        char = buffer[position]
+        if expected == "[" or expected == ",":
+            if char == "]" and expected == ",":
+                return
+            if char != expected:
+                raise json.JSONDecodeError(f"Expecting '{expected}'",
+                                           buffer, position)
+            position += 1
+            expected = "item or ]" if expected == "[" else "item"
+            continue
+        if char == "]" and expected == "item or ]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # the item may continue in the next chunk
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                raise
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+        position = end
+        expected = ","
+        if position > chunk_size:
+            buffer = buffer[position:]
+            position = 0
+
 
 class JsonHandler(FileIOHandler):
     """
     Manages log entries in json-file based storage.
     """
+    rewrites_log = True
+
     def _create_log_if_non_existent(self):
         if not os.path.exists(self.filepath):
             with self._get_file_handle("w") as fh:
                 json.dump([], fh)
+            self._discard_sidecars()
 
     def persist_log(self, entry: LogEntry):
         log_entries = []
         try:
             if self._nonempty_file_exists():
                 log_entries = self._load_entries()
-        except (json.JSONDecodeError, FileNotFoundError):
+        except (json.JSONDecodeError, FileNotFoundError) as error:
+            self.metrics.count_error(error)
             log_entries = []
         log_entries = [*log_entries, entry.to_dict()]
         self._save_entries(log_entries)
+        self._update_rollups([entry])
+
+    def persist_logs(self, entries: List[LogEntry]):
+        # the file is rewritten once per batch instead of once per entry
+        log_entries = []
+        try:
+            if self._nonempty_file_exists():
+                log_entries = self._load_entries()
+        except (json.JSONDecodeError, FileNotFoundError) as error:
+            self.metrics.count_error(error)
+            log_entries = []
+        log_entries.extend(entry.to_dict() for entry in entries)
+        self._save_entries(log_entries)
+        self._update_rollups(entries)
 
     def _save_entries(self, log_entries: List[Dict]):
-        with self._get_file_handle("w") as fh:
+        self._check_rollups()
+        with self._open_for_writing("w") as fh:
             json.dump(log_entries, fh, indent=4)
 
+    def bulk_load(self,
+                  entries: Iterable[LogEntry],
+                  batch_size: Optional[int] = None) -> int:
+        """
+        Stream the existing entries and then the new ones into a new file
+        (laid out like json.dump(..., indent=4)), replacing the log once -
+        instead of rewriting the whole file for each batch.
+        """
+        temporary_path = f"{self.filepath}.tmp"
+        entries = iter(entries)
+        loaded = 0
+        with open(temporary_path, "w") as fh:
+            written = self._write_existing_items(fh)
+            while True:
+                batch = list(itertools.islice(
+                    entries, batch_size or self.bulk_batch_size))
+                if not batch:
+                    break
+                for entry in batch:
+                    fh.write(",\n" if written else "[\n")
+                    fh.write(self._format_item(entry.to_dict()))
+                    written += 1
+                loaded += len(batch)
+            fh.write("\n]" if written else "[]")
+            self.metrics.add_bytes(fh.tell())
+        os.replace(temporary_path, self.filepath)
+        # rollups are counted of the new file
+        self.rebuild_rollups()
+        return loaded
+
+    def _write_existing_items(self, fh: TextIO) -> int:
+        written = 0
+        if not self._nonempty_file_exists():
+            return written
+        try:
+            with self._get_file_handle("r") as existing_fh:
+                for item in _iter_json_array(existing_fh):
+                    fh.write(",\n" if written else "[\n")
+                    fh.write(self._format_item(item))
+                    written += 1
+        except json.JSONDecodeError as error:
+            # a corrupted log is replaced, like by persist_logs()
+            self.metrics.count_error(error)
+            fh.seek(0)
+            fh.truncate()
+            written = 0
+        return written
+
+    @staticmethod
+    def _format_item(item: Dict) -> str:
+        return "    " + json.dumps(item, indent=4).replace("\n", "\n    ")
+
     def _load_entries(self):
         with self._get_file_handle("r") as fh:
             return json.load(fh)
@@ -126,21 +868,69 @@ class JsonHandler(FileIOHandler):
                 for entry in loaded_log_entries:
                     log_entry = LogEntry.from_dict(entry)
                     log_entries.append(log_entry)
-        except (FileNotFoundError, json.decoder.JSONDecodeError):
+        except (FileNotFoundError, json.decoder.JSONDecodeError) as error:
+            self.metrics.count_error(error)
             return []
         return log_entries
 
+    def iter_logs(
+            self,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            contains: Optional[str] = None,
+            levels: Optional[Collection[LogLevelValue]] = None) \
+            -> Iterator[LogEntry]:
+        if not newest_first:
+            yield from self._iter_forward(after)
+            return
+        # entries are identified by their index in the array, so it has
+        # to be loaded to be read backwards
+        try:
+            with self._get_file_handle("r") as fh:
+                loaded_log_entries = json.load(fh)
+        except (FileNotFoundError, json.decoder.JSONDecodeError) as error:
+            self.metrics.count_error(error)
+            return
+        end = after.entry_id if after else len(loaded_log_entries)
+        for index in range(min(end, len(loaded_log_entries)) - 1, -1, -1):
+            yield self._to_entry(loaded_log_entries[index], index)
+
+    def _iter_forward(self,
+                      after: Optional[LogCursor]) -> Iterator[LogEntry]:
+        """
+        Parse entries one at a time, not loading the whole array.
+        """
+        try:
+            with self._get_file_handle("r") as fh:
+                for index, entry in enumerate(_iter_json_array(fh)):
+                    if after is None or index > after.entry_id:
+                        yield self._to_entry(entry, index)
+        except (FileNotFoundError, json.decoder.JSONDecodeError) as error:
+            self.metrics.count_error(error)
+            return
+
+    def _to_entry(self, entry: Dict, index: int) -> LogEntry:
+        return LogEntry(date=parse_timestamp(entry["date"]),
+                        level=LogLevelValue[entry["level"]],
+                        msg=self._messages.intern(entry["message"]),
+                        entry_id=index)
+
 
-class CSVHandler(FileIOHandler):
+class CSVHandler(LineFileIOHandler):
     """
     Manages log entries in csv-file based storage.
     """
+    quoted_records = True
+
     def _create_log_if_non_existent(self):
         if not os.path.exists(self.filepath) or \
            os.path.getsize(self.filepath) == 0:
             with self._get_file_handle("w", newline="") as fh:
                 writer = csv.writer(fh)
                 writer.writerow(["date", "level", "message"])
+            self._discard_sidecars()
 
     def persist_log(self, entry: LogEntry):
         log_entry = entry.to_dict()
@@ -148,16 +938,31 @@ class CSVHandler(FileIOHandler):
                          log_entry["level"],
                          log_entry["message"]]
         self._save_entry(log_entry_row)
+        self._update_rollups([entry])
 
     def _save_entry(self, log_entry_row: List[str]):
-        with self._get_file_handle("a", newline="") as fh:
+        with self._open_for_writing("a", newline="") as fh:
             writer = csv.writer(fh)
             writer.writerow(log_entry_row)
+        self._update_bloom_filters_if_needed()
+
+    def persist_logs(self, entries: List[LogEntry]):
+        with self._open_for_writing("a", newline="") as fh:
+            writer = csv.writer(fh)
+            writer.writerows([entry["date"], entry["level"], entry["message"]]
+                             for entry in entries)
+        self._update_bloom_filters_if_needed()
+        self._update_rollups(entries)
+
+    def _encode_searched_text(self, text: str) -> bytes:
+        # quotes are doubled in quoted fields
+        return text.replace('"', '""').encode("utf-8")
 
     def retrieve_all_logs(self) -> List[LogEntry]:
         try:
             log_entries = self._load_entries()
-        except FileNotFoundError:
+        except FileNotFoundError as error:
+            self.metrics.count_error(error)
             return []
         return log_entries
 
@@ -168,48 +973,388 @@ class CSVHandler(FileIOHandler):
 
         return log_entries
 
+    def _parse_record(self, record: bytes, offset: int) -> LogEntry:
+        text = io.StringIO(record.decode("utf-8"), newline="")
+        date, level, message = next(csv.reader(text))
+        return LogEntry(date=parse_timestamp(date),
+                        level=LogLevelValue[level],
+                        msg=self._messages.intern(message),
+                        entry_id=offset)
+
+
+class JsonLinesHandler(LineFileIOHandler):
+    """
+    Manages log entries in a JSON Lines file - a JSON object per line.
+    Unlike JsonHandler, entries are appended without rewriting the file.
+    """
+    def _create_log_if_non_existent(self):
+        if not os.path.exists(self.filepath):
+            with self._get_file_handle("w") as fh:
+                fh.write("")
+            self._discard_sidecars()
+
+    def persist_log(self, entry: LogEntry):
+        self.persist_logs([entry])
+
+    def persist_logs(self, entries: List[LogEntry]):
+        log_lines = "".join(json.dumps(entry.to_dict(), ensure_ascii=False)
+                            + "\n" for entry in entries)
+        with self._open_for_writing("a", encoding="utf-8") as fh:
+            fh.write(log_lines)
+        self._update_bloom_filters_if_needed()
+        self._update_rollups(entries)
+
+    def retrieve_all_logs(self) -> List[LogEntry]:
+        return list(self.iter_logs())
+
+    def _encode_searched_text(self, text: str) -> bytes:
+        return json.dumps(text, ensure_ascii=False)[1:-1].encode("utf-8")
+
+    def _parse_record(self, record: bytes, offset: int) -> LogEntry:
+        entry = json.loads(record)
+        return LogEntry(date=parse_timestamp(entry["date"]),
+                        level=LogLevelValue[entry["level"]],
+                        msg=self._messages.intern(entry["message"]),
+                        entry_id=offset)
+
+
+# lengths of partition keys (timestamp prefixes) of SQLiteHandler partitions
+_PARTITION_KEY_LENGTHS = {"month": 7, "day": 10}
+_ADD_ROLLUP_COUNT = ("ON CONFLICT (bucket, level) "
+                     "DO UPDATE SET count = count + excluded.count")
+
 
 class SQLiteHandler(Handler):
     """
     Manages log entries in SQLite database table storage.
+
+    With dictionary_encoded=True, a newly created table refers to
+    messages stored once in a '<table name>_messages' table, instead of
+    repeating their texts in every row (an existing table keeps its
+    layout).
+
+    With partition_by="month" (or "day"), entries are stored in separate
+    tables per month (day) of their dates, named '<table name>_YYYY_MM'
+    ('<table name>_YYYY_MM_DD'). Queries only read partitions overlapping
+    the searched period, and old entries are removed by dropping whole
+    partitions (see drop_partitions_before()).
+
+    With rollups set to "minute", "hour" or "day", numbers of entries
+    per level and bucket of that resolution are kept in
+    a '<table name>_<resolution>_rollups' table, updated in
+    the transactions inserting entries, and entries are counted from it.
+
+    With keep_entry_ids=True, entries are stored with their entry_ids as
+    row ids (e.g. entries moved from another handler keep their cursors),
+    and entries with ids already stored are skipped.
     """
-    def __init__(self, database_path: str, table_name: str = "log"):
+    bulk_batch_size = 100_000
+
+    def __init__(self,
+                 database_path: str,
+                 table_name: str = "log",
+                 dictionary_encoded: bool = False,
+                 partition_by: Optional[str] = None,
+                 rollups: Optional[str] = None,
+                 keep_entry_ids: bool = False):
+        if partition_by not in (None, *_PARTITION_KEY_LENGTHS):
+            raise ValueError(f"Unknown partitioning: {partition_by}")
+        if rollups not in (None, *ROLLUP_RESOLUTIONS):
+            raise ValueError(f"Unknown rollup resolution: {rollups}")
         self.db_path = database_path
         self.table_name = table_name
+        self.dictionary_encoded = dictionary_encoded
+        self.partition_by = partition_by
+        self.rollups = rollups
+        self.keep_entry_ids = keep_entry_ids
+        self._created_partitions: Set[str] = set()
+        # indexes of tables created during bulk_load() are built after it
+        self._indexes_deferred = False
         super(SQLiteHandler, self).__init__()
 
     def _create_log_if_non_existent(self):
         with self._get_conn() as connection:
             cursor = connection.cursor()
-            create_table_sql = f'''
-                CREATE TABLE IF NOT EXISTS {self.table_name} (
-                    id INTEGER PRIMARY KEY,
-                    timestamp TEXT NOT NULL,
-                    level TEXT NOT NULL,
-                    message TEXT NOT NULL
-                )
-            '''
-            cursor.executescript(create_table_sql)
+            if self.partition_by:
+                # new partitions are created like the latest existing one
+                partitions = self._list_partitions(cursor)
+                if partitions:
+                    self._detect_layout(cursor, partitions[-1][1])
+            else:
+                self._detect_layout(cursor, self.table_name)
+                self._create_table(cursor, self.table_name)
+            if self.rollups:
+                self._create_rollups_table(cursor)
+
+    def _detect_layout(self, cursor: sqlite3.Cursor, table_name: str):
+        columns = [row[1] for row in cursor.execute(
+            f"PRAGMA table_info({table_name})")]
+        if columns:
+            self.dictionary_encoded = "message_id" in columns
+
+    def _create_table(self, cursor: sqlite3.Cursor, table_name: str):
+        message_column = "message_id INTEGER NOT NULL" \
+            if self.dictionary_encoded else "message TEXT NOT NULL"
+        create_table_sql = f'''
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                id INTEGER PRIMARY KEY,
+                timestamp TEXT NOT NULL,
+                level TEXT NOT NULL,
+                {message_column}
+            )
+        '''
+        cursor.executescript(create_table_sql)
+        if not self._indexes_deferred:
+            self._create_index(cursor, table_name)
+        if self.dictionary_encoded:
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS "
+                           f"{table_name}_messages ("
+                           "message_id INTEGER PRIMARY KEY, "
+                           "message TEXT NOT NULL UNIQUE)")
+
+    @staticmethod
+    def _create_index(cursor: sqlite3.Cursor, table_name: str):
+        # (timestamp, id) index makes the newest/oldest entries and
+        # keyset pagination available without scanning the table
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS "
+                       f"{table_name}_timestamp_id "
+                       f"ON {table_name} (timestamp, id)")
+
+    @property
+    def _rollups_table(self) -> str:
+        return f"{self.table_name}_{self.rollups}_rollups"
+
+    def _create_rollups_table(self, cursor: sqlite3.Cursor):
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (self._rollups_table,)).fetchone()
+        if exists:
+            return
+        cursor.execute(f"CREATE TABLE {self._rollups_table} ("
+                       "bucket TEXT NOT NULL, "
+                       "level TEXT NOT NULL, "
+                       "count INTEGER NOT NULL, "
+                       "PRIMARY KEY (bucket, level)) WITHOUT ROWID")
+        # entries written before rollups were enabled
+        key_length = BUCKET_KEY_LENGTHS[self.rollups]
+        for table_name in self._get_tables(cursor):
+            cursor.execute(
+                f"INSERT INTO {self._rollups_table} (bucket, level, count) "
+                f"SELECT substr(timestamp, 1, {key_length}), level, "
+                f"count(*) FROM {table_name} WHERE true GROUP BY 1, 2 "
+                f"{_ADD_ROLLUP_COUNT}")
+
+    def _update_rollups(self,
+                        cursor: sqlite3.Cursor,
+                        entries: List[LogEntry]):
+        if not self.rollups:
+            return
+        counts = count_entries(entries, self.rollups)
+        cursor.executemany(
+            f"INSERT INTO {self._rollups_table} (bucket, level, count) "
+            f"VALUES (?, ?, ?) {_ADD_ROLLUP_COUNT}",
+            [(key, level.name, count)
+             for (key, level), count in counts.items()])
+
+    def _list_partitions(self,
+                         cursor: sqlite3.Cursor) -> List[Tuple[str, str]]:
+        """
+        (partition key, table name) pairs of existing partitions, sorted
+        by their keys ('YYYY-MM' or 'YYYY-MM-DD').
+        """
+        key_pattern = r"\d{4}_\d{2}" if self.partition_by == "month" \
+            else r"\d{4}_\d{2}_\d{2}"
+        table_pattern = re.compile(
+            rf"{re.escape(self.table_name)}_({key_pattern})")
+        partitions = []
+        for (name,) in cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"):
+            match = table_pattern.fullmatch(name)
+            if match:
+                partitions.append((match.group(1).replace("_", "-"), name))
+        return sorted(partitions)
+
+    def _get_partition_key(self, timestamp: str) -> str:
+        return timestamp[:_PARTITION_KEY_LENGTHS[self.partition_by]]
+
+    def _get_partition_table(self, timestamp: str) -> str:
+        key = self._get_partition_key(timestamp)
+        return f"{self.table_name}_{key.replace('-', '_')}"
+
+    def _get_tables(self,
+                    cursor: sqlite3.Cursor,
+                    start_date: Optional[datetime.datetime] = None,
+                    end_date: Optional[datetime.datetime] = None) \
+            -> List[str]:
+        """
+        Tables holding entries of the period, in chronological order.
+        """
+        if not self.partition_by:
+            return [self.table_name]
+        first_key = self._get_partition_key(
+            format_timestamp(start_date)) if start_date else None
+        last_key = self._get_partition_key(
+            format_timestamp(end_date)) if end_date else None
+        return [table_name
+                for key, table_name in self._list_partitions(cursor)
+                if (first_key is None or key >= first_key)
+                and (last_key is None or key <= last_key)]
+
+    def drop_partitions_before(self, date: datetime.datetime) -> List[str]:
+        """
+        Drop partitions of periods ending before the date (i.e. preceding
+        the partition of the date). Returns names of dropped tables.
+        """
+        if not self.partition_by:
+            return []
+        last_dropped_key = self._get_partition_key(format_timestamp(date))
+        with self._get_conn() as connection:
+            cursor = connection.cursor()
+            dropped = [table_name for key, table_name
+                       in self._list_partitions(cursor)
+                       if key < last_dropped_key]
+            for table_name in dropped:
+                cursor.execute(f"DROP TABLE {table_name}")
+                cursor.execute(f"DROP TABLE IF EXISTS {table_name}_messages")
+                # entries of the period are inserted into a new table
+                self._created_partitions.discard(table_name)
+            if self.rollups:
+                cursor.execute(f"DELETE FROM {self._rollups_table} "
+                               "WHERE bucket < ?", (last_dropped_key,))
+        return dropped
 
     def persist_log(self, entry: LogEntry):
-        entry_fields = {
-            "timestamp": entry["date"],
-            "level": entry["level"],
-            "message": entry["message"]
-        }
+        entry_fields = self._get_fields(entry)
 
         with self._get_conn() as conn:
             cursor = conn.cursor()
-            sql_statement = (f"INSERT INTO {self.table_name} (timestamp, "
-                             "level, message) VALUES "
-                             "(:timestamp, :level, :message)")
+            table_name = self._get_insert_table(cursor,
+                                                entry_fields["timestamp"])
+            self._insert_messages(cursor, table_name, [entry_fields])
+            cursor.execute(self._get_insert_statement(table_name),
+                           entry_fields)
+            self._update_rollups(cursor, [entry])
 
-            cursor.execute(sql_statement, entry_fields)
+    def persist_logs(self, entries: List[LogEntry]):
+        # a single transaction for the whole batch
+        with self._get_conn() as conn:
+            self._insert_entries(conn.cursor(), entries)
+
+    def bulk_load(self,
+                  entries: Iterable[LogEntry],
+                  batch_size: Optional[int] = None) -> int:
+        """
+        Insert entries with a single connection, in large transactions,
+        with durability relaxed (synchronous=OFF, the rollback journal in
+        memory) and indexes dropped during the load and built afterwards.
+        A crash during the load can corrupt the database - it's meant
+        for importing logs into a new database.
+        """
+        entries = iter(entries)
+        loaded = 0
+        connection = self._get_conn()
+        try:
+            connection.execute("PRAGMA synchronous = OFF")
+            connection.execute("PRAGMA journal_mode = MEMORY")
+            self._indexes_deferred = True
+            with connection:
+                for table_name in self._get_tables(connection.cursor()):
+                    connection.execute(
+                        f"DROP INDEX IF EXISTS {table_name}_timestamp_id")
+            while True:
+                batch = list(itertools.islice(
+                    entries, batch_size or self.bulk_batch_size))
+                if not batch:
+                    break
+                with connection:
+                    self._insert_entries(connection.cursor(), batch)
+                loaded += len(batch)
+        finally:
+            self._indexes_deferred = False
+            with connection:
+                cursor = connection.cursor()
+                for table_name in self._get_tables(cursor):
+                    self._create_index(cursor, table_name)
+            connection.close()
+        return loaded
+
+    def _insert_entries(self,
+                        cursor: sqlite3.Cursor,
+                        entries: List[LogEntry]):
+        entries_fields = [self._get_fields(entry) for entry in entries]
+        tables_entries: Dict[str, List[Dict[str, str]]] = {}
+        for fields in entries_fields:
+            table_name = self._get_insert_table(cursor, fields["timestamp"])
+            tables_entries.setdefault(table_name, []).append(fields)
+        for table_name, table_entries in tables_entries.items():
+            self._insert_messages(cursor, table_name, table_entries)
+            cursor.executemany(self._get_insert_statement(table_name),
+                               table_entries)
+        self._update_rollups(cursor, entries)
+
+    def _get_fields(self, entry: LogEntry) -> Dict:
+        entry_fields = {"timestamp": entry["date"],
+                        "level": entry["level"],
+                        "message": entry["message"]}
+        if self.keep_entry_ids:
+            entry_fields["id"] = entry.entry_id
+        return entry_fields
+
+    def _get_insert_table(self, cursor: sqlite3.Cursor, timestamp: str) -> str:
+        """
+        The table for an entry - partitions are created when their first
+        entries are inserted.
+        """
+        if not self.partition_by:
+            return self.table_name
+        table_name = self._get_partition_table(timestamp)
+        if table_name not in self._created_partitions:
+            self._create_table(cursor, table_name)
+            self._created_partitions.add(table_name)
+        return table_name
+
+    def _get_insert_statement(self, table_name: str) -> str:
+        insert = "INSERT OR IGNORE" if self.keep_entry_ids else "INSERT"
+        id_column, id_value = ("id, ", ":id, ") if self.keep_entry_ids \
+            else ("", "")
+        if self.dictionary_encoded:
+            return (f"{insert} INTO {table_name} ({id_column}timestamp, "
+                    f"level, message_id) VALUES ({id_value}:timestamp, "
+                    f":level, (SELECT message_id FROM {table_name}_messages "
+                    "WHERE message = :message))")
+        return (f"{insert} INTO {table_name} ({id_column}timestamp, "
+                f"level, message) VALUES "
+                f"({id_value}:timestamp, :level, :message)")
+
+    def _insert_messages(self,
+                         cursor: sqlite3.Cursor,
+                         table_name: str,
+                         entries_fields: List[Dict[str, str]]):
+        """
+        Add messages not stored yet to the messages table (of
+        a dictionary-encoded table).
+        """
+        if not self.dictionary_encoded:
+            return
+        messages = {fields["message"] for fields in entries_fields}
+        cursor.executemany(f"INSERT OR IGNORE INTO {table_name}"
+                           "_messages (message) VALUES (?)",
+                           [(message,) for message in messages])
+
+    def _get_entries_source(self, table_name: str) -> str:
+        """
+        The table (joined with its messages) entries are selected from.
+        """
+        if self.dictionary_encoded:
+            return (f"{table_name} JOIN {table_name}_messages "
+                    "USING (message_id)")
+        return table_name
 
     def retrieve_all_logs(self) -> List[LogEntry]:
         try:
             log_entries = self._fetch_resulting_rows()
-        except (sqlite3.Error, ValueError):
+        except (sqlite3.Error, ValueError) as error:
+            self.metrics.count_error(error)
             return []
         return log_entries
 
@@ -217,20 +1362,169 @@ class SQLiteHandler(Handler):
         return sqlite3.connect(self.db_path)
 
     def _fetch_resulting_rows(self) -> List[LogEntry]:
-        retrieval_statement = (f"SELECT timestamp, level, message FROM "
-                               f"{self.table_name} ORDER BY timestamp ASC")
-
+        entry_rows = []
         with self._get_conn() as connection:
             cursor = connection.cursor()
-            cursor.execute(retrieval_statement)
-            entry_rows = cursor.fetchall()
+            for table_name in self._get_tables(cursor):
+                retrieval_statement = (
+                    f"SELECT timestamp, level, message FROM "
+                    f"{self._get_entries_source(table_name)} "
+                    "ORDER BY timestamp ASC")
+                cursor.execute(retrieval_statement)
+                entry_rows.extend(cursor.fetchall())
 
         fetched_entries = self._fetch_log_entries(entry_rows)
         return fetched_entries
 
     def _fetch_log_entries(self,
                            fetched_rows: List[Tuple]) -> List[LogEntry]:
-        return [LogEntry(date=datetime.datetime.fromisoformat(row[0]),
+        return [LogEntry(date=parse_timestamp(row[0]),
                          level=LogLevelValue[row[1]],
-                         msg=row[2])
+                         msg=self._messages.intern(row[2]))
                 for row in fetched_rows]
+
+    def iter_logs(
+            self,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            contains: Optional[str] = None,
+            levels: Optional[Collection[LogLevelValue]] = None) \
+            -> Iterator[LogEntry]:
+        conditions, parameters = self._get_scan_conditions(
+            newest_first, after, start_date, end_date, levels)
+        order = "DESC" if newest_first else "ASC"
+        where_clause = f" WHERE {' AND '.join(conditions)}" \
+            if conditions else ""
+        connection = self._get_conn()
+        try:
+            tables = self._get_tables(connection.cursor(), start_date,
+                                      end_date)
+            if after and self.partition_by:
+                # partitions preceding (following) the cursor are pruned
+                # too - names of partitions are ordered like their periods
+                cursor_table = self._get_partition_table(
+                    format_timestamp(after.date))
+                tables = [table_name for table_name in tables
+                          if (table_name <= cursor_table if newest_first
+                              else table_name >= cursor_table)]
+            if newest_first:
+                tables.reverse()
+            for table_name in tables:
+                retrieval_statement = (
+                    f"SELECT id, timestamp, level, message FROM "
+                    f"{self._get_entries_source(table_name)}{where_clause} "
+                    f"ORDER BY timestamp {order}, id {order}")
+                # rows are fetched lazily, so that callers reading only
+                # the first few entries don't load the whole table
+                for row in connection.execute(retrieval_statement,
+                                              parameters):
+                    yield LogEntry(date=parse_timestamp(row[1]),
+                                   level=LogLevelValue[row[2]],
+                                   msg=self._messages.intern(row[3]),
+                                   entry_id=row[0])
+        except (sqlite3.Error, ValueError) as error:
+            self.metrics.count_error(error)
+            return
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _get_scan_conditions(
+            newest_first: bool,
+            after: Optional[LogCursor],
+            start_date: Optional[datetime.datetime],
+            end_date: Optional[datetime.datetime],
+            levels: Optional[Collection[LogLevelValue]] = None) \
+            -> Tuple[List[str], Dict]:
+        conditions = []
+        parameters = {}
+        if after:
+            operator = "<" if newest_first else ">"
+            conditions.append(f"(timestamp, id) {operator} "
+                              "(:after_timestamp, :after_id)")
+            parameters["after_timestamp"] = format_timestamp(after.date)
+            parameters["after_id"] = after.entry_id
+        if start_date:
+            conditions.append("timestamp >= :start_date")
+            parameters["start_date"] = format_timestamp(start_date)
+        if end_date:
+            conditions.append("timestamp <= :end_date")
+            parameters["end_date"] = format_timestamp(end_date)
+        if levels is not None:
+            level_parameters = [f":level_{level.name}" for level in levels]
+            conditions.append(f"level IN ({', '.join(level_parameters)})")
+            parameters.update((f"level_{level.name}", level.name)
+                              for level in levels)
+        return conditions, parameters
+
+    def count_logs(
+            self,
+            group_by: str,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None) -> Optional[Dict]:
+        if self.rollups and covers_whole_buckets(self.rollups, start_date,
+                                                 end_date):
+            buckets = self.count_buckets(self.rollups, start_date, end_date)
+            return None if buckets is None \
+                else sum_buckets(buckets, group_by)
+        group_expression = {"level": "level",
+                            "month": "substr(timestamp, 1, 7)"}[group_by]
+        conditions, parameters = self._get_scan_conditions(
+            False, None, start_date, end_date)
+        where_clause = f" WHERE {' AND '.join(conditions)}" \
+            if conditions else ""
+        counts: Dict = {}
+        try:
+            with self._get_conn() as connection:
+                # partitions are counted separately
+                for table_name in self._get_tables(
+                        connection.cursor(), start_date, end_date):
+                    count_statement = (
+                        f"SELECT {group_expression}, count(*) FROM "
+                        f"{table_name}{where_clause} "
+                        f"GROUP BY {group_expression}")
+                    for key, count in connection.execute(
+                            count_statement, parameters):
+                        counts[key] = counts.get(key, 0) + count
+        except sqlite3.Error as error:
+            self.metrics.count_error(error)
+            return None
+        if group_by == "level":
+            return {LogLevelValue[level]: count
+                    for level, count in counts.items()}
+        return counts
+
+    def count_buckets(
+            self,
+            resolution: str,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None) \
+            -> Optional[Dict[str, Dict[LogLevelValue, int]]]:
+        if not self.rollups \
+                or not is_finer_or_equal(self.rollups, resolution):
+            return None
+        first_key, last_key = get_key_range(self.rollups, resolution,
+                                            start_date, end_date)
+        conditions = []
+        if first_key:
+            conditions.append("bucket >= :first_key")
+        if last_key:
+            conditions.append("bucket <= :last_key")
+        where_clause = f" WHERE {' AND '.join(conditions)}" \
+            if conditions else ""
+        try:
+            with self._get_conn() as connection:
+                rows = connection.execute(
+                    f"SELECT bucket, level, count FROM "
+                    f"{self._rollups_table}{where_clause}",
+                    {"first_key": first_key, "last_key": last_key})
+                return group_counts(
+                    ((key, LogLevelValue[level], count)
+                     for key, level, count in rows),
+                    resolution, None, None)
+        except (sqlite3.Error, KeyError) as error:
+            self.metrics.count_error(error)
+            return None
+
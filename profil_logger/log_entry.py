@@ -1,7 +1,8 @@
 from __future__ import annotations
 import datetime
 from enum import Enum
-from typing import Dict, List
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from profil_logger.timestamps import format_timestamp, parse_timestamp
 
 
 class LogLevelValue(Enum):
@@ -16,31 +17,42 @@ class LogEntry:
     def __init__(self,
                  date: datetime.datetime,
                  level: LogLevelValue,
-                 msg: str):
+                 msg: str,
+                 entry_id: Optional[int] = None,
+                 args: Tuple = ()):
         self._date = date
         self._log_level = level
+        # printf-style message arguments are merged into the message only
+        # when it's read for the first time (i.e. by handlers)
         self._message = msg
+        self._args = args
+        self._formatted_message: Optional[str] = None if args else msg
+        # position of the entry in its storage (row id, byte offset etc.),
+        # assigned by handlers when reading entries
+        self._entry_id = entry_id
+        # formatted lazily, once - handlers read it several times per entry
+        self._iso_date: Optional[str] = None
 
     def to_dict(self) -> Dict[str, str]:
         return dict(self)
 
     @staticmethod
     def from_dict(entry: Dict[str, str]) -> LogEntry:
-        date = datetime.datetime.fromisoformat(entry["date"])
+        date = parse_timestamp(entry["date"])
         level = LogLevelValue[entry["level"]]
         return LogEntry(date=date,
                         level=level,
                         msg=entry["message"])
 
     def __getitem__(self, key: str):
-        return dict(zip(self.keys(), self.values()))[key]
+        return _ITEM_GETTERS[key](self)
 
     @staticmethod
     def keys() -> List[str]:
         return ["date", "level", "message"]
 
     def values(self) -> List[str]:
-        return [self.date.isoformat(), self.level.name, self.message]
+        return [self.iso_date, self.level.name, self.message]
 
     def __repr__(self):
         return f"LogEntry(date={self['date']}, " \
@@ -49,4 +61,68 @@ class LogEntry:
 
     date = property(lambda self: self._date)
     level = property(lambda self: self._log_level)
-    message = property(lambda self: self._message)
+    entry_id = property(lambda self: self._entry_id)
+
+    @property
+    def message(self) -> str:
+        message = self._formatted_message
+        if message is None:
+            message = self._formatted_message = _format_message(
+                self._message, self._args)
+        return message
+
+    @property
+    def iso_date(self) -> str:
+        if self._iso_date is None:
+            self._iso_date = format_timestamp(self._date)
+        return self._iso_date
+
+
+def _format_message(message: str, args: Tuple) -> str:
+    try:
+        return message % args
+    except (TypeError, ValueError):
+        # a logging call shouldn't fail because of mismatched arguments
+        return f"{message} {args!r}"
+
+
+class MessageInterner:
+    """
+    Shares a single str object between entries read with the same
+    message - most messages of a log repeat, so loaded logs hold one
+    copy of each. Up to max_size messages are kept; the cache is
+    cleared when it fills up, so that scans over unique messages don't
+    grow it indefinitely.
+    """
+    def __init__(self, max_size: int = 16_384):
+        self.max_size = max_size
+        self._messages: Dict[str, str] = {}
+
+    def intern(self, message: str) -> str:
+        messages = self._messages
+        interned = messages.get(message)
+        if interned is None:
+            if len(messages) >= self.max_size:
+                messages.clear()
+            interned = messages[message] = message
+        return interned
+
+
+_ITEM_GETTERS: Dict[str, Callable[[LogEntry], str]] = {
+    "date": lambda entry: entry.iso_date,
+    "level": lambda entry: entry.level.name,
+    "message": lambda entry: entry.message
+}
+
+
+class LogCursor(NamedTuple):
+    """
+    Keyset pagination cursor: points at the (date, entry_id) position of
+    the last entry of a page.
+    """
+    date: datetime.datetime
+    entry_id: int
+
+    @staticmethod
+    def from_entry(entry: LogEntry) -> LogCursor:
+        return LogCursor(date=entry.date, entry_id=entry.entry_id)
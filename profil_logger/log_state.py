@@ -0,0 +1,62 @@
+"""
+States of log files, kept by sidecar files (Bloom filters, rollups) to
+check that the log they describe hasn't been replaced.
+
+A state identifies the log file (by its device and inode) and the part
+of it covered by the sidecar: its size and a checksum of its first and
+last bytes (like the cache of parsed logs, see profil_logger.cache).
+A sidecar describes the current log only if it's the same file, which
+still has the same covered bytes - i.e. it was only appended to since.
+A log deleted and created again - often with the same inode, and e.g.
+a CSV header as its first bytes - is told apart by the checksum of
+the end of the covered part.
+"""
+import os
+import zlib
+from typing import BinaryIO, NamedTuple, Optional
+
+# bytes at the start and at the end of the covered part of the log
+# included in the checksum
+CHECKED_BYTES = 64
+
+
+class LogState(NamedTuple):
+    device: int
+    inode: int
+    # size of the covered part of the log
+    size: int
+    checksum: int
+
+
+def get_log_state(fh: BinaryIO, size: Optional[int] = None) -> LogState:
+    """
+    State of the log file opened for reading, covering its first size
+    bytes (the whole file by default). The position in the file is kept.
+    """
+    stat = os.fstat(fh.fileno())
+    if size is None:
+        size = stat.st_size
+    return LogState(stat.st_dev, stat.st_ino, size, _get_checksum(fh, size))
+
+
+def is_extended(fh: BinaryIO, state: LogState) -> bool:
+    """
+    Check if the log file opened for reading is the file of the state,
+    with the covered part unchanged (e.g. only appended to).
+    """
+    stat = os.fstat(fh.fileno())
+    return (stat.st_dev, stat.st_ino) == (state.device, state.inode) \
+        and stat.st_size >= state.size \
+        and _get_checksum(fh, state.size) == state.checksum
+
+
+def _get_checksum(fh: BinaryIO, size: int) -> int:
+    position = fh.tell()
+    try:
+        fh.seek(0)
+        head = fh.read(min(size, CHECKED_BYTES))
+        fh.seek(max(size - CHECKED_BYTES, 0))
+        tail = fh.read(min(size, CHECKED_BYTES))
+    finally:
+        fh.seek(position)
+    return zlib.crc32(head + tail)
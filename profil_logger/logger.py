@@ -1,46 +1,334 @@
 import datetime
-from typing import List
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from .dispatch import Dispatcher, SerialDispatcher
 from .handlers import Handler
+from .metrics import LoggerMetrics
+from .throttling import REPEATED_MESSAGE, DuplicateSuppressor, Sampler, \
+    TokenBucket
 from profil_logger import LogEntry, LogLevelValue
 
 
 DEFAULT_LOG_LEVEL = LogLevelValue.DEBUG
 
+RoutingPredicate = Callable[[LogEntry], bool]
+
+
+class _HandlerList(list):
+    """
+    Handlers of a logger - calls on_change whenever changed in place
+    (e.g. by logger.log_handlers.append()), to recompile the dispatch
+    table.
+    """
+    def __init__(self, log_handlers: List[Handler],
+                 on_change: Callable[[], None]):
+        super(_HandlerList, self).__init__(log_handlers)
+        self._on_change = on_change
+
+
+def _notify_change(method_name: str):
+    method = getattr(list, method_name)
+
+    def changing_method(self, *args):
+        result = method(self, *args)
+        self._on_change()
+        return result
+    changing_method.__name__ = method_name
+    return changing_method
+
+
+for _method_name in ("append", "extend", "insert", "remove", "pop",
+                     "clear", "sort", "reverse", "__setitem__",
+                     "__delitem__", "__iadd__", "__imul__"):
+    setattr(_HandlerList, _method_name, _notify_change(_method_name))
+
 
 class ProfilLogger:
-    def __init__(self, log_handlers: List[Handler]):
-        self.log_handlers = log_handlers
+    """
+    Logs entries to handlers. Messages can be given with printf-style
+    arguments - e.g. logger.debug("user %s did %s", uid, action) - which
+    are merged into the message only if the entry is actually logged.
+
+    By default entries are written to handlers serially, in the calling
+    thread; a ConcurrentDispatcher writes them in worker threads instead.
+
+    Each handler can have its own minimum level and a routing predicate
+    (see set_handler_level() and set_handler_filter()). These are compiled
+    into a level-to-handlers dispatch table whenever they change, so
+    routing doesn't add work to logging calls. Handlers are added and
+    removed with add_handler()/remove_handler(), or by changing (or
+    assigning) the log_handlers list - the logger keeps its own copy of
+    the given list, which updates the table when changed.
+
+    Floods of entries can be throttled with sampling, rate limits (per
+    level) and suppression of repeated messages - see
+    profil_logger.throttling.
+
+    Numbers of logged, filtered out and throttled entries (and metrics of
+    handlers) are returned by stats().
+    """
+    def __init__(self,
+                 log_handlers: List[Handler],
+                 dispatcher: Optional[Dispatcher] = None):
+        self.dispatcher = dispatcher or SerialDispatcher()
+        self.metrics = LoggerMetrics()
         self._current_log_level: LogLevelValue = DEFAULT_LOG_LEVEL
+        self._current_log_level_value = DEFAULT_LOG_LEVEL.value
+        self._handler_levels: Dict[Handler, LogLevelValue] = {}
+        self._handler_filters: Dict[Handler, RoutingPredicate] = {}
+        self._dispatch_table: Dict[LogLevelValue, Tuple] = {}
+        # throttling, indexed by level values
+        self._samplers: List[Optional[Sampler]] = [None] * len(LogLevelValue)
+        self._rate_limits: List[Optional[TokenBucket]] = \
+            [None] * len(LogLevelValue)
+        self._duplicates: Optional[DuplicateSuppressor] = None
+        self._throttled = False
+        self.log_handlers = log_handlers
+
+    @property
+    def log_handlers(self) -> List[Handler]:
+        return self._log_handlers
 
-    def debug(self, message: str):
-        self._log(LogLevelValue.DEBUG, message)
+    @log_handlers.setter
+    def log_handlers(self, log_handlers: List[Handler]):
+        self._log_handlers = _HandlerList(log_handlers,
+                                          self._compile_dispatch_table)
+        self._compile_dispatch_table()
 
-    def info(self, message: str):
-        self._log(LogLevelValue.INFO, message)
+    def debug(self, message: str, *args):
+        return self._log(LogLevelValue.DEBUG, message, args)
 
-    def warning(self, message: str):
-        self._log(LogLevelValue.WARNING, message)
+    def info(self, message: str, *args):
+        return self._log(LogLevelValue.INFO, message, args)
 
-    def error(self, message: str):
-        self._log(LogLevelValue.ERROR, message)
+    def warning(self, message: str, *args):
+        return self._log(LogLevelValue.WARNING, message, args)
 
-    def critical(self, message: str):
-        self._log(LogLevelValue.CRITICAL, message)
+    def error(self, message: str, *args):
+        return self._log(LogLevelValue.ERROR, message, args)
+
+    def critical(self, message: str, *args):
+        return self._log(LogLevelValue.CRITICAL, message, args)
 
     def set_log_level(self, log_level: LogLevelValue):
         self._current_log_level = log_level
+        self._current_log_level_value = log_level.value
+        self._bind_level_methods()
+
+    def add_handler(self,
+                    log_handler: Handler,
+                    log_level: Optional[LogLevelValue] = None,
+                    predicate: Optional[RoutingPredicate] = None):
+        if log_level is not None:
+            self._handler_levels[log_handler] = log_level
+        if predicate is not None:
+            self._handler_filters[log_handler] = predicate
+        # recompiles the dispatch table
+        self._log_handlers.append(log_handler)
+
+    def remove_handler(self, log_handler: Handler):
+        self._handler_levels.pop(log_handler, None)
+        self._handler_filters.pop(log_handler, None)
+        self._log_handlers.remove(log_handler)
+
+    def set_handler_level(self,
+                          log_handler: Handler,
+                          log_level: Optional[LogLevelValue]):
+        """
+        Set the minimum level of entries written to the handler (on top of
+        the logger level); None removes the threshold.
+        """
+        if log_level is not None:
+            self._handler_levels[log_handler] = log_level
+        else:
+            self._handler_levels.pop(log_handler, None)
+        self._compile_dispatch_table()
 
-    def _log(self, log_level: LogLevelValue, message: str):
+    def set_handler_filter(self,
+                           log_handler: Handler,
+                           predicate: Optional[RoutingPredicate]):
+        """
+        Write only entries for which predicate(entry) is true to
+        the handler; None removes the predicate.
+        """
+        if predicate is not None:
+            self._handler_filters[log_handler] = predicate
+        else:
+            self._handler_filters.pop(log_handler, None)
+        self._compile_dispatch_table()
+
+    def set_sampling_rate(self,
+                          log_level: LogLevelValue,
+                          rate: Optional[float]):
+        """
+        Log only a 'rate' fraction (from 0 to 1) of entries of the level,
+        chosen at random; None stops sampling.
+        """
+        self._samplers[log_level.value] = \
+            Sampler(rate) if rate is not None else None
+        self._update_throttled()
+
+    def set_rate_limit(self,
+                       log_level: LogLevelValue,
+                       rate: Optional[float],
+                       burst: Optional[float] = None):
+        """
+        Log at most 'rate' entries of the level per second on average,
+        in bursts of up to 'burst' entries (by default, one second of
+        entries); None removes the limit.
+        """
+        self._rate_limits[log_level.value] = \
+            TokenBucket(rate, burst) if rate is not None else None
+        self._update_throttled()
+
+    def set_duplicate_suppression(self, enabled: bool, window: float = 10.0):
+        """
+        Log a message repeated right after itself (with the same level and
+        arguments) once, and then the number of its repetitions - when
+        another message is logged, on flush(), or every 'window' seconds
+        of the repetitions.
+        """
+        self._write_repetitions()
+        self._duplicates = DuplicateSuppressor(window) if enabled else None
+        self._update_throttled()
+
+    def is_enabled_for(self, log_level: LogLevelValue) -> bool:
+        """
+        Check if entries of the given level would be logged - for guarding
+        expensive computations of message arguments.
+        """
+        return not self._log_level_lower_than_current(log_level) \
+            and bool(self._dispatch_table[log_level][0])
+
+    def stats(self) -> Dict:
+        """
+        A snapshot of the logger metrics, with metrics of its handlers
+        and stats of the dispatcher (both keyed by handlers) - see
+        profil_logger.metrics.
+        """
+        return {**self.metrics.stats(),
+                "handlers": {log_handler: log_handler.stats()
+                             for log_handler in self._log_handlers},
+                "dispatcher": self.dispatcher.stats()}
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until entries queued by the dispatcher are written.
+        """
+        self._write_repetitions()
+        return self.dispatcher.flush(timeout)
+
+    def close(self):
+        self._write_repetitions()
+        self.dispatcher.close()
+
+    def _update_throttled(self):
+        self._throttled = self._duplicates is not None \
+            or any(self._samplers) or any(self._rate_limits)
+
+    def _throttle(self, log_level: LogLevelValue, message: str,
+                  args: tuple) -> bool:
+        """
+        Check if the entry should be logged, counting it if it's not.
+        """
+        log_level_value = log_level.value
+        if self._duplicates is not None:
+            is_new, repetitions = self._duplicates.check(
+                log_level, message, args)
+            if repetitions is not None:
+                self._write_repetitions_entry(*repetitions)
+            if not is_new:
+                self.metrics.suppressed[log_level_value] += 1
+                return False
+        sampler = self._samplers[log_level_value]
+        if sampler is not None and not sampler.sample():
+            self.metrics.sampled_out[log_level_value] += 1
+            return False
+        rate_limit = self._rate_limits[log_level_value]
+        if rate_limit is not None and not rate_limit.consume():
+            self.metrics.rate_limited[log_level_value] += 1
+            return False
+        return True
+
+    def _write_repetitions(self):
+        if self._duplicates is not None:
+            repetitions = self._duplicates.flush()
+            if repetitions is not None:
+                self._write_repetitions_entry(*repetitions)
+
+    def _write_repetitions_entry(self, log_level: LogLevelValue, count: int):
+        """
+        Summarize suppressed repetitions - not throttled itself.
+        """
+        entry = LogEntry(date=datetime.datetime.now(), level=log_level,
+                         msg=REPEATED_MESSAGE, args=(count,))
+        self._write_to_handlers(entry)
+
+    def _compile_dispatch_table(self):
+        """
+        For each level, store the handlers accepting its entries and - if
+        any of them has a predicate - (handler, predicate) routes to
+        evaluate for each entry, with the level value (indexing counters
+        of the metrics).
+        """
+        self._dispatch_table = {}
+        for log_level in LogLevelValue:
+            handlers = tuple(
+                log_handler for log_handler in self._log_handlers
+                if log_level.value >= self._handler_levels.get(
+                    log_handler, log_level).value)
+            routes = tuple((log_handler,
+                            self._handler_filters.get(log_handler))
+                           for log_handler in handlers)
+            has_predicates = any(predicate for _, predicate in routes)
+            self._dispatch_table[log_level] = (
+                handlers, routes if has_predicates else None,
+                log_level.value)
+        self._bind_level_methods()
+
+    def _bind_level_methods(self):
+        """
+        Replace methods of disabled levels with functions only counting
+        the call (in the instance dictionary), so that filtered out calls
+        cost a single function call.
+        """
+        for log_level in LogLevelValue:
+            method_name = log_level.name.lower()
+            if self.is_enabled_for(log_level):
+                self.__dict__.pop(method_name, None)
+            else:
+                setattr(self, method_name,
+                        self._make_filtering_method(log_level.value))
+
+    def _make_filtering_method(self, log_level_value: int) -> Callable:
+        filtered = self.metrics.filtered
+
+        def log_filtered(message: str, *args):
+            filtered[log_level_value] += 1
+        return log_filtered
+
+    def _log(self, log_level: LogLevelValue, message: str, args=()):
         if self._log_level_lower_than_current(log_level):
+            self.metrics.filtered[log_level.value] += 1
             return
+        if self._throttled and not self._throttle(log_level, message, args):
+            return None
 
         log_entry_date = datetime.datetime.now()
-        entry = LogEntry(date=log_entry_date, level=log_level, msg=message)
-        self._write_to_handlers(entry)
+        entry = LogEntry(date=log_entry_date, level=log_level, msg=message,
+                         args=args)
+        return self._write_to_handlers(entry)
 
     def _log_level_lower_than_current(self, log_level: LogLevelValue) -> bool:
-        return log_level.value < self._current_log_level.value
+        return log_level.value < self._current_log_level_value
 
     def _write_to_handlers(self, entry: LogEntry):
-        for log_handler in self.log_handlers:
-            log_handler.persist_log(entry)
+        handlers: Sequence[Handler]
+        handlers, routes, log_level_value = self._dispatch_table[entry.level]
+        if routes:
+            handlers = [log_handler for log_handler, predicate in routes
+                        if predicate is None or predicate(entry)]
+        if handlers:
+            self.metrics.logged[log_level_value] += 1
+            return self.dispatcher.dispatch(entry, handlers)
+        self.metrics.filtered[log_level_value] += 1
+        return None
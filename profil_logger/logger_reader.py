@@ -1,120 +1,583 @@
+import asyncio
+import contextlib
 import datetime
+import functools
+import itertools
 import re
-from typing import Dict, List, Optional
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import Executor
+from typing import Any, AsyncIterator, Callable, Collection, \
+    ContextManager, Dict, Iterable, Iterator, List, Optional, Sequence, \
+    Tuple, Union
 from profil_logger.handlers import Handler
-from profil_logger.log_entry import LogEntry, LogLevelValue
+from profil_logger.log_entry import LogCursor, LogEntry, LogLevelValue
+from profil_logger.merged import MergedHandler
+from profil_logger.profiling import QueryProfile, QueryProfiler
+from profil_logger.rollups import BUCKET_KEY_LENGTHS, get_bucket_bounds
+
+
+async def _no_entries() -> AsyncIterator[LogEntry]:
+    return
+    yield
+
+
+class _LevelGroups:
+    def __init__(self):
+        self._groups: Dict[LogLevelValue, List[LogEntry]] = defaultdict(list)
+
+    def extend(self, entries: Iterable[LogEntry]):
+        for entry in entries:
+            self._groups[entry.level].append(entry)
+
+    def result(self) -> Dict[LogLevelValue, List[LogEntry]]:
+        return {level: self._groups[level] for level in LogLevelValue
+                if level in self._groups}
+
+
+class _MonthGroups:
+    def __init__(self):
+        self._groups: Dict[str, List[LogEntry]] = defaultdict(list)
+
+    def extend(self, entries: Iterable[LogEntry]):
+        for entry in entries:
+            self._groups[entry.date.strftime("%Y-%m")].append(entry)
+
+    def result(self) -> Dict[str, List[LogEntry]]:
+        return dict(self._groups)
+
+
+def _count_returned_entries(result: Any) -> int:
+    """
+    Number of entries (or counts) returned by a query.
+    """
+    if isinstance(result, dict):
+        return sum(len(value) if isinstance(value, list) else 1
+                   for value in result.values())
+    return len(result)
+
+
+def _close_iterator(entries: Iterator[LogEntry]):
+    """
+    Close a generator of entries (other iterators have nothing to close).
+    """
+    close = getattr(entries, "close", None)
+    if close is not None:
+        close()
+
+
+def _profiled(query_method: Callable) -> Callable:
+    """
+    Profile calls of a query method if the reader has a profiler.
+    """
+    @functools.wraps(query_method)
+    def profiled_query(self, *args, **kwargs):
+        if self.profiler is None or self._get_profile() is not None:
+            return query_method(self, *args, **kwargs)
+        return self._run_profiled(self.profiler, query_method, args,
+                                  kwargs)[0]
+    return profiled_query
 
 
 class ProfilLoggerReader:
-    def __init__(self, handler: Handler):
+    """
+    Searches and groups entries read from a handler - or from several
+    handlers, merged by dates (see MergedHandler).
+
+    Each method accepts optional pagination arguments:
+    + limit, offset - return at most 'limit' entries, after skipping
+      'offset' of them
+    + newest_first - return entries starting from the most recent one
+    + after - a LogCursor (see LogCursor.from_entry()) of the last entry
+      of the previous page, for keyset pagination
+    Reading stops as soon as the requested page is complete.
+
+    The aiter_*() and agroupby_*() methods are asynchronous counterparts
+    for asyncio applications: the log is scanned in an executor thread
+    and found entries are streamed to the event loop in chunks.
+
+    With a QueryProfiler, (synchronous) queries are profiled - see
+    profil_logger.profiling, last_profile and explain().
+    """
+    # number of entries passed to the event loop at once
+    async_chunk_size = 256
+    # number of chunks the scanning thread can get ahead of the consumer
+    async_max_pending_chunks = 4
+
+    def __init__(self,
+                 handler: Union[Handler, Sequence[Handler]],
+                 executor: Optional[Executor] = None,
+                 profiler: Optional[QueryProfiler] = None):
+        if not isinstance(handler, Handler):
+            handler = MergedHandler(handler)
         self._handler = handler
+        self._executor = executor
+        self.profiler = profiler
+        # the profile of the query running in a thread
+        self._profiling = threading.local()
+
+    @property
+    def last_profile(self) -> Optional[QueryProfile]:
+        return self.profiler.last_profile if self.profiler else None
+
+    def explain(self, query: str, *args, **kwargs) -> Tuple[Any, QueryProfile]:
+        """
+        Run a query method (e.g. explain("find_by_text", "error",
+        limit=10)) profiled - also if the reader has no profiler - and
+        return its result and profile.
+        """
+        query_method = getattr(getattr(type(self), query, None),
+                               "__wrapped__", None)
+        if query_method is None:
+            raise ValueError(f"Not a query method: {query}")
+        return self._run_profiled(self.profiler or QueryProfiler(),
+                                  query_method, args, kwargs)
+
+    def _run_profiled(self,
+                      profiler: QueryProfiler,
+                      query_method: Callable,
+                      args: Tuple,
+                      kwargs: Dict) -> Tuple[Any, QueryProfile]:
+        with profiler.profile(query_method.__name__,
+                              type(self._handler).__name__) as profile:
+            self._profiling.profile = profile
+            try:
+                result = query_method(self, *args, **kwargs)
+            finally:
+                self._profiling.profile = None
+            profile.entries_returned = _count_returned_entries(result)
+        return result, profile
+
+    def _get_profile(self) -> Optional[QueryProfile]:
+        return getattr(self._profiling, "profile", None)
+
+    def _time_entries(self,
+                      stage_name: str,
+                      entries: Iterable[LogEntry]) -> Iterable[LogEntry]:
+        profile = self._get_profile()
+        return entries if profile is None \
+            else profile.time_entries(stage_name, entries)
 
+    def _time_stage(self, stage_name: str) -> ContextManager:
+        profile = self._get_profile()
+        return contextlib.nullcontext() if profile is None \
+            else profile.time_stage(stage_name)
+
+    @_profiled
     def find_by_text(
             self,
             text: str,
             start_date: Optional[datetime.datetime] = None,
-            end_date: Optional[datetime.datetime] = None) -> List[LogEntry]:
+            end_date: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None,
+            offset: int = 0,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None) -> List[LogEntry]:
         """
         Find log entries by a message text, optionally filtering
         them by dates.
         """
-        filtered_entries = self._filter_all_logs_by_date(start_date, end_date)
-        result_entries = self._filter_entries_by_text(filtered_entries, text)
-        return result_entries
+        result_entries = self._find_by_text(
+            text, start_date, end_date, newest_first, after)
+        return self._paginate(result_entries, limit, offset)
 
-    @staticmethod
-    def _filter_entries_by_text(
-            log_entries: List[LogEntry], text: str) -> List[LogEntry]:
-        return [log for log in log_entries if text in log.message]
+    def _find_by_text(
+            self,
+            text: str,
+            start_date: Optional[datetime.datetime],
+            end_date: Optional[datetime.datetime],
+            newest_first: bool,
+            after: Optional[LogCursor]) -> Iterator[LogEntry]:
+        filtered_entries = self._filter_all_logs_by_date(
+            start_date, end_date, newest_first, after, contains=text)
+        return self._time_entries(
+            "match",
+            (entry for entry in filtered_entries if text in entry.message))
 
+    @_profiled
     def find_by_regex(
             self,
             regex: str,
             start_date: Optional[datetime.datetime] = None,
-            end_date: Optional[datetime.datetime] = None) -> List[LogEntry]:
+            end_date: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None,
+            offset: int = 0,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None) -> List[LogEntry]:
         """
         Find log entries by a regular expression, optionally filtering
         them by dates.
         """
-        filtered_entries = self._filter_all_logs_by_date(start_date, end_date)
         try:
-            result_entries = self._filter_entries_by_regex(
-                filtered_entries, regex)
+            result_entries = self._find_by_regex(
+                regex, start_date, end_date, newest_first, after)
         except re.error:
             return []
 
-        return result_entries
+        return self._paginate(result_entries, limit, offset)
 
-    @staticmethod
-    def _filter_entries_by_regex(entries, regex: str) -> List[LogEntry]:
+    def _find_by_regex(
+            self,
+            regex: str,
+            start_date: Optional[datetime.datetime],
+            end_date: Optional[datetime.datetime],
+            newest_first: bool,
+            after: Optional[LogCursor]) -> Iterator[LogEntry]:
         pattern = re.compile(regex)
-        matching_logs = filter(
-            lambda entry: pattern.search(entry.message), entries)
-
-        return list(matching_logs)
+        filtered_entries = self._filter_all_logs_by_date(
+            start_date, end_date, newest_first, after)
+        return self._time_entries(
+            "match", (entry for entry in filtered_entries
+                      if pattern.search(entry.message)))
 
+    @_profiled
     def groupby_level(
             self,
             start_date: Optional[datetime.datetime] = None,
-            end_date: Optional[datetime.datetime] = None) \
+            end_date: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None,
+            offset: int = 0,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None) \
             -> Dict[LogLevelValue, List[LogEntry]]:
         """
         Group log entries from an optionally given time period by
         logging levels.
         """
-        log_entries = self._filter_all_logs_by_date(start_date, end_date)
-        grouped_entries: Dict = {level: [entry for entry in log_entries
-                                         if entry.level == level]
-                                 for level in LogLevelValue}
-
-        return {level: entries for level, entries
-                in grouped_entries.items() if entries}
+        log_entries = self._iter_page(
+            self._filter_all_logs_by_date(
+                start_date, end_date, newest_first, after),
+            limit, offset)
+        grouped_entries = _LevelGroups()
+        grouped_entries.extend(log_entries)
+        return grouped_entries.result()
 
+    @_profiled
     def groupby_month(
             self,
             start_date: Optional[datetime.datetime] = None,
-            end_date: Optional[datetime.datetime] = None) \
+            end_date: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None,
+            offset: int = 0,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None) \
             -> Dict[str, List[LogEntry]]:
         """
         Group log entries in a dictionary by 'year-month' keys.
         """
-        entries_filtered_by_date = self._filter_all_logs_by_date(
-            start_date, end_date)
-        year_month_keys = {entry.date.strftime("%Y-%m")
-                           for entry in entries_filtered_by_date}
-        entries_by_year_month = {
-            year_month_key: [entry for entry
-                             in entries_filtered_by_date
-                             if entry.date.strftime("%Y-%m") == year_month_key]
-            for year_month_key in year_month_keys
-        }
-        return entries_by_year_month
-
-    def _get_all_logs_from_handler(self) -> List[LogEntry]:
-        return self._handler.retrieve_all_logs()
+        entries_filtered_by_date = self._iter_page(
+            self._filter_all_logs_by_date(
+                start_date, end_date, newest_first, after),
+            limit, offset)
+        entries_by_year_month = _MonthGroups()
+        entries_by_year_month.extend(entries_filtered_by_date)
+        return entries_by_year_month.result()
+
+    @_profiled
+    def find_by_level(
+            self,
+            levels: Collection[LogLevelValue],
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None,
+            offset: int = 0,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None) -> List[LogEntry]:
+        """
+        Find log entries of the given levels, optionally filtering
+        them by dates.
+        """
+        result_entries = self._filter_all_logs_by_date(
+            start_date, end_date, newest_first, after, levels=levels)
+        return self._paginate(result_entries, limit, offset)
+
+    @_profiled
+    def count_by_level(
+            self,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None) \
+            -> Dict[LogLevelValue, int]:
+        """
+        Count log entries from an optionally given time period by
+        logging levels - like groupby_level(), but handlers storing
+        metadata (or a database) can count entries without reading them.
+        """
+        with self._time_stage("count"):
+            counts = self._handler.count_logs("level", start_date, end_date)
+        if counts is None:
+            counts = Counter(entry.level for entry
+                             in self._filter_all_logs_by_date(
+                                 start_date, end_date))
+        return {level: counts[level] for level in LogLevelValue
+                if counts.get(level)}
+
+    @_profiled
+    def count_by_month(
+            self,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None) -> Dict[str, int]:
+        """
+        Count log entries by 'year-month' keys - see count_by_level().
+        """
+        with self._time_stage("count"):
+            counts = self._handler.count_logs("month", start_date, end_date)
+        if counts is None:
+            counts = Counter(entry.date.strftime("%Y-%m") for entry
+                             in self._filter_all_logs_by_date(
+                                 start_date, end_date))
+        return dict(sorted(counts.items()))
+
+    @_profiled
+    def count_by_bucket(
+            self,
+            resolution: str = "hour",
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None) \
+            -> Dict[str, Dict[LogLevelValue, int]]:
+        """
+        Count log entries by logging levels in time buckets ("minute",
+        "hour", "day" or "month"), keyed by timestamp prefixes (e.g.
+        '2020-01-01T10' for an hour). Whole buckets overlapping the time
+        period are counted. Handlers maintaining rollups answer without
+        reading entries.
+        """
+        if resolution not in BUCKET_KEY_LENGTHS:
+            raise ValueError(f"Unknown bucket resolution: {resolution}")
+        with self._time_stage("count"):
+            buckets = self._handler.count_buckets(resolution, start_date,
+                                                  end_date)
+        if buckets is None:
+            key_length = BUCKET_KEY_LENGTHS[resolution]
+            buckets = defaultdict(Counter)
+            for entry in self._filter_all_logs_by_date(
+                    start_date and get_bucket_bounds(start_date,
+                                                     resolution)[0],
+                    end_date and get_bucket_bounds(end_date,
+                                                   resolution)[1]):
+                buckets[entry.iso_date[:key_length]][entry.level] += 1
+        return {key: {level: bucket[level] for level in LogLevelValue
+                      if bucket.get(level)}
+                for key, bucket in sorted(buckets.items())}
+
+    def aiter_find_by_text(
+            self,
+            text: str,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None,
+            offset: int = 0,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            timeout: Optional[float] = None) -> AsyncIterator[LogEntry]:
+        """
+        Stream entries found by a message text - see find_by_text().
+        TimeoutError is raised if the whole search takes longer than
+        timeout seconds.
+        """
+        return self._aiter_in_executor(
+            lambda: self._iter_page(
+                self._find_by_text(text, start_date, end_date,
+                                   newest_first, after),
+                limit, offset),
+            timeout)
+
+    def aiter_find_by_regex(
+            self,
+            regex: str,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None,
+            offset: int = 0,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            timeout: Optional[float] = None) -> AsyncIterator[LogEntry]:
+        """
+        Stream entries found by a regular expression - see find_by_regex().
+        """
+        try:
+            re.compile(regex)
+        except re.error:
+            return _no_entries()
+
+        return self._aiter_in_executor(
+            lambda: self._iter_page(
+                self._find_by_regex(regex, start_date, end_date,
+                                    newest_first, after),
+                limit, offset),
+            timeout)
+
+    async def agroupby_level(
+            self,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None,
+            offset: int = 0,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            timeout: Optional[float] = None) \
+            -> Dict[LogLevelValue, List[LogEntry]]:
+        """
+        Asynchronous counterpart of groupby_level().
+        """
+        grouped_entries = _LevelGroups()
+        await self._agroup(grouped_entries, start_date, end_date, limit,
+                           offset, newest_first, after, timeout)
+        return grouped_entries.result()
+
+    async def agroupby_month(
+            self,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None,
+            offset: int = 0,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            timeout: Optional[float] = None) -> Dict[str, List[LogEntry]]:
+        """
+        Asynchronous counterpart of groupby_month().
+        """
+        entries_by_year_month = _MonthGroups()
+        await self._agroup(entries_by_year_month, start_date, end_date,
+                           limit, offset, newest_first, after, timeout)
+        return entries_by_year_month.result()
+
+    async def _agroup(
+            self,
+            groups: Union[_LevelGroups, _MonthGroups],
+            start_date: Optional[datetime.datetime],
+            end_date: Optional[datetime.datetime],
+            limit: Optional[int],
+            offset: int,
+            newest_first: bool,
+            after: Optional[LogCursor],
+            timeout: Optional[float]):
+        chunks = self._aiter_chunks_in_executor(
+            lambda: self._iter_page(
+                self._filter_all_logs_by_date(
+                    start_date, end_date, newest_first, after),
+                limit, offset),
+            timeout)
+        try:
+            async for chunk in chunks:
+                groups.extend(chunk)
+        finally:
+            await chunks.aclose()
+
+    async def _aiter_in_executor(
+            self,
+            get_entries: Callable[[], Iterable[LogEntry]],
+            timeout: Optional[float]) -> AsyncIterator[LogEntry]:
+        chunks = self._aiter_chunks_in_executor(get_entries, timeout)
+        try:
+            async for chunk in chunks:
+                for entry in chunk:
+                    yield entry
+        finally:
+            await chunks.aclose()
+
+    async def _aiter_chunks_in_executor(
+            self,
+            get_entries: Callable[[], Iterable[LogEntry]],
+            timeout: Optional[float]) -> AsyncIterator[List[LogEntry]]:
+        """
+        Run the scan in an executor thread, which passes chunks of found
+        entries to the event loop. The thread is stopped when the consumer
+        stops iterating (break, cancellation, timeout).
+        """
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        free_slots = threading.Semaphore(self.async_max_pending_chunks)
+        stopped = threading.Event()
+        end_of_scan = object()
+
+        def scan():
+            entries = iter(())
+            try:
+                entries = iter(get_entries())
+                while not stopped.is_set():
+                    chunk = list(itertools.islice(
+                        entries, self.async_chunk_size))
+                    if not chunk:
+                        break
+                    while not free_slots.acquire(timeout=0.1):
+                        if stopped.is_set():
+                            return
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+                loop.call_soon_threadsafe(chunks.put_nowait, end_of_scan)
+            except Exception as exception:
+                loop.call_soon_threadsafe(chunks.put_nowait, exception)
+            finally:
+                # release files (and memory maps) read by the handler
+                # right away, also when the consumer stopped early
+                _close_iterator(entries)
+
+        deadline = None if timeout is None else loop.time() + timeout
+        loop.run_in_executor(self._executor, scan)
+        try:
+            while True:
+                remaining = None if deadline is None \
+                    else max(0.0, deadline - loop.time())
+                chunk = await asyncio.wait_for(chunks.get(), remaining)
+                if chunk is end_of_scan:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                free_slots.release()
+                yield chunk
+        finally:
+            stopped.set()
+            free_slots.release()
+
+    @staticmethod
+    def _iter_page(entries: Iterable[LogEntry],
+                   limit: Optional[int],
+                   offset: int) -> Iterator[LogEntry]:
+        """
+        Entries of the page - the source iterator is closed once the page
+        is complete (or the page iterator is closed).
+        """
+        stop = None if limit is None else offset + limit
+        entries = iter(entries)
+        try:
+            yield from itertools.islice(entries, offset, stop)
+        finally:
+            _close_iterator(entries)
+
+    def _paginate(self,
+                  entries: Iterable[LogEntry],
+                  limit: Optional[int],
+                  offset: int) -> List[LogEntry]:
+        return list(self._iter_page(entries, limit, offset))
 
     def _filter_all_logs_by_date(
             self,
             start_date: Optional[datetime.datetime] = None,
-            end_date: Optional[datetime.datetime] = None) -> List[LogEntry]:
+            end_date: Optional[datetime.datetime] = None,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            contains: Optional[str] = None,
+            levels: Optional[Collection[LogLevelValue]] = None) \
+            -> Iterator[LogEntry]:
         """
-        Returns entries logged between start_date and end_date (including
-        entries logged exactly on those dates).
+        Lazily yields entries logged between start_date and end_date
+        (including entries logged exactly on those dates).
         """
-        all_entries = self._get_all_logs_from_handler()
-        filtered_entries = []
+        all_entries = self._time_entries("read", self._handler.iter_logs(
+            newest_first=newest_first, after=after,
+            start_date=start_date, end_date=end_date, contains=contains,
+            levels=levels))
+        if levels is not None:
+            levels = set(levels)
+            all_entries = (entry for entry in all_entries
+                           if entry.level in levels)
 
         if start_date and end_date:
-            filtered_entries = [entry for entry in all_entries
-                                if start_date <= entry.date <= end_date]
+            all_entries = (entry for entry in all_entries
+                           if start_date <= entry.date <= end_date)
         elif start_date:
-            filtered_entries = [entry for entry in all_entries
-                                if entry.date >= start_date]
+            all_entries = (entry for entry in all_entries
+                           if entry.date >= start_date)
         elif end_date:
-            filtered_entries = [entry for entry in all_entries
-                                if entry.date <= end_date]
-
-        if not filtered_entries and any([start_date, end_date]):
-            all_entries = []
-
-        return filtered_entries or all_entries
+            all_entries = (entry for entry in all_entries
+                           if entry.date <= end_date)
+        return self._time_entries("filter", all_entries)
@@ -0,0 +1,160 @@
+import datetime
+import threading
+from array import array
+from typing import Collection, Dict, Iterator, List, Optional, Tuple
+from profil_logger.handlers import Handler, _is_past_cursor
+from profil_logger.log_entry import LogCursor, LogEntry, LogLevelValue
+
+
+class MemoryHandler(Handler):
+    """
+    Keeps the last 'capacity' entries (and, with max_bytes, at most that
+    many bytes of UTF-8 encoded messages) in a ring buffer preallocated
+    when the handler is created - older entries are overwritten. Buffered
+    entries are read (e.g. by ProfilLoggerReader) without any I/O; their
+    entry_ids are sequence numbers of the entries written to the handler.
+
+    With a target handler, buffered entries are written to it in a single
+    batch (and removed from the buffer) on flush(), and whenever an entry
+    of flush_level or higher arrives - so that a cheap buffer of DEBUG
+    entries can be persisted with the context of an error.
+    """
+    def __init__(self,
+                 capacity: int = 10_000,
+                 max_bytes: Optional[int] = None,
+                 target: Optional[Handler] = None,
+                 flush_level: Optional[LogLevelValue] = LogLevelValue.ERROR):
+        if capacity < 1:
+            raise ValueError("The capacity has to be positive")
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.target = target
+        self.flush_level = flush_level
+        self._entries: List[Optional[LogEntry]] = [None] * capacity
+        # message sizes of the buffered entries (if their bytes are limited)
+        self._sizes = array("Q", bytes(8 * capacity)) \
+            if max_bytes is not None else None
+        # slot of the oldest entry
+        self._start = 0
+        self._count = 0
+        self._size = 0
+        # entry_id of the next written entry
+        self._next_id = 0
+        self._overwritten = 0
+        self._lock = threading.Lock()
+        # flushes are serialized (and made outside of the buffer lock)
+        self._flush_lock = threading.Lock()
+        super(MemoryHandler, self).__init__()
+
+    def persist_log(self, entry: LogEntry):
+        with self._lock:
+            self._append(entry)
+        if self._is_flushed_by(entry):
+            self.flush()
+
+    def persist_logs(self, entries: List[LogEntry]):
+        with self._lock:
+            for entry in entries:
+                self._append(entry)
+        if any(self._is_flushed_by(entry) for entry in entries):
+            self.flush()
+
+    def _is_flushed_by(self, entry: LogEntry) -> bool:
+        return self.target is not None and self.flush_level is not None \
+            and entry.level.value >= self.flush_level.value
+
+    def _append(self, entry: LogEntry):
+        size = 0
+        if self._sizes is not None:
+            size = len(entry.message.encode("utf-8"))
+            # an entry bigger than max_bytes is still kept - on its own
+            while self._count and self._size + size > self.max_bytes:
+                self._remove_oldest()
+        if self._count == self.capacity:
+            self._remove_oldest()
+        slot = (self._start + self._count) % self.capacity
+        self._entries[slot] = entry
+        if self._sizes is not None:
+            self._sizes[slot] = size
+            self._size += size
+        self._count += 1
+        self._next_id += 1
+
+    def _remove_oldest(self):
+        slot = self._start
+        self._entries[slot] = None
+        if self._sizes is not None:
+            self._size -= self._sizes[slot]
+        self._start = (slot + 1) % self.capacity
+        self._count -= 1
+        self._overwritten += 1
+
+    def flush(self) -> int:
+        """
+        Write the buffered entries to the target handler in a single batch
+        and clear the buffer. Returns the number of written entries.
+        """
+        if self.target is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                _, entries = self._get_buffered()
+                self._clear()
+            if entries:
+                self.target.persist_logs(entries)
+        return len(entries)
+
+    def _get_buffered(self) -> Tuple[int, List[LogEntry]]:
+        """
+        The entry_id of the oldest buffered entry and buffered entries
+        (in the logging order) - has to be called with the lock held.
+        """
+        end = self._start + self._count
+        entries = self._entries[self._start:min(end, self.capacity)]
+        if end > self.capacity:
+            entries += self._entries[:end - self.capacity]
+        return self._next_id - self._count, entries
+
+    def clear(self):
+        """
+        Remove the buffered entries (without writing them).
+        """
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._entries[:] = [None] * self.capacity
+        self._start = self._count = self._size = 0
+
+    def retrieve_all_logs(self) -> List[LogEntry]:
+        return list(self.iter_logs())
+
+    def iter_logs(
+            self,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            contains: Optional[str] = None,
+            levels: Optional[Collection[LogLevelValue]] = None) \
+            -> Iterator[LogEntry]:
+        with self._lock:
+            first_id, entries = self._get_buffered()
+        ids = range(first_id, first_id + len(entries))
+        buffered = zip(ids, entries)
+        if newest_first:
+            buffered = zip(reversed(ids), reversed(entries))
+        for entry_id, entry in buffered:
+            # the read entry has its position in the buffer
+            entry = LogEntry(date=entry.date, level=entry.level,
+                             msg=entry.message, entry_id=entry_id)
+            if after and not _is_past_cursor(entry, after, newest_first):
+                continue
+            yield entry
+
+    def stats(self) -> Dict:
+        with self._lock:
+            buffer_stats = {"buffered": self._count,
+                            "buffered_bytes": self._size,
+                            "overwritten": self._overwritten}
+        return {**super(MemoryHandler, self).stats(), **buffer_stats}
@@ -0,0 +1,177 @@
+import datetime
+import heapq
+import queue
+import threading
+from collections import Counter
+from typing import Collection, Dict, Iterator, List, Optional, Sequence
+from profil_logger.handlers import Handler, _is_past_cursor
+from profil_logger.log_entry import LogCursor, LogEntry, LogLevelValue
+
+_END_OF_SOURCE = object()
+
+
+class MergedHandler(Handler):
+    """
+    Read-only view of the logs of several handlers (e.g. one file per
+    worker, rotated files and databases) as a single log: entries read
+    from each handler (with the same date, text and level hints) are
+    merged by dates with a heap-based k-way merge, holding a single entry
+    of each source at a time.
+
+    With parallel=True, each source is read in its own thread, a few
+    batches of entries ahead of the merge - so that I/O and parsing of
+    the sources overlap.
+
+    Entry ids of the merged log are entry ids of the sources interleaved
+    by the source index, so they're unique across the sources and can be
+    used in cursors.
+    """
+    def __init__(self,
+                 handlers: Sequence[Handler],
+                 parallel: bool = False,
+                 batch_size: int = 256,
+                 prefetched_batches: int = 4):
+        if not handlers:
+            raise ValueError("At least one handler has to be merged")
+        self.handlers = list(handlers)
+        self.parallel = parallel
+        self.batch_size = batch_size
+        self.prefetched_batches = prefetched_batches
+        super(MergedHandler, self).__init__()
+
+    def persist_log(self, entry: LogEntry):
+        raise NotImplementedError("merged logs are read-only")
+
+    def persist_logs(self, entries: List[LogEntry]):
+        raise NotImplementedError("merged logs are read-only")
+
+    def retrieve_all_logs(self) -> List[LogEntry]:
+        return list(self.iter_logs())
+
+    def iter_logs(
+            self,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            contains: Optional[str] = None,
+            levels: Optional[Collection[LogLevelValue]] = None) \
+            -> Iterator[LogEntry]:
+        if after is not None:
+            # cursors of the merged log aren't cursors of the sources -
+            # these read entries from the cursor date, skipped below
+            if newest_first and (end_date is None or after.date < end_date):
+                end_date = after.date
+            elif not newest_first and (start_date is None
+                                       or after.date > start_date):
+                start_date = after.date
+        sources = []
+        for index, log_handler in enumerate(self.handlers):
+            entries = log_handler.iter_logs(
+                newest_first=newest_first, start_date=start_date,
+                end_date=end_date, contains=contains, levels=levels)
+            if self.parallel:
+                entries = self._prefetch(entries)
+            sources.append(self._renumber(entries, index))
+        merged = heapq.merge(
+            *sources, key=lambda entry: (entry.date, entry.entry_id),
+            reverse=newest_first)
+        try:
+            for entry in merged:
+                if after and not _is_past_cursor(entry, after, newest_first):
+                    continue
+                yield entry
+        finally:
+            for source in sources:
+                source.close()
+
+    def _renumber(self, entries: Iterator[LogEntry],
+                  index: int) -> Iterator[LogEntry]:
+        source_count = len(self.handlers)
+        try:
+            for position, entry in enumerate(entries):
+                local_id = entry.entry_id if entry.entry_id is not None \
+                    else position
+                yield LogEntry(entry.date, entry.level, entry.message,
+                               local_id * source_count + index)
+        finally:
+            close = getattr(entries, "close", None)
+            if close is not None:
+                close()
+
+    def _prefetch(self, entries: Iterator[LogEntry]) -> Iterator[LogEntry]:
+        """
+        Read entries in a thread, in batches put into a bounded queue.
+        """
+        batches: queue.Queue = queue.Queue(maxsize=self.prefetched_batches)
+        stopped = threading.Event()
+
+        def put(item) -> bool:
+            while not stopped.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read():
+            try:
+                batch = []
+                for entry in entries:
+                    batch.append(entry)
+                    if len(batch) == self.batch_size:
+                        if not put(batch):
+                            return
+                        batch = []
+                if put(batch):
+                    put(_END_OF_SOURCE)
+            except Exception as error:
+                put(error)
+            finally:
+                # generators of handlers are closed in the reading thread
+                close = getattr(entries, "close", None)
+                if close is not None:
+                    close()
+
+        threading.Thread(target=read, daemon=True).start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is _END_OF_SOURCE:
+                    return
+                if isinstance(batch, Exception):
+                    raise batch
+                yield from batch
+        finally:
+            stopped.set()
+
+    def count_logs(
+            self,
+            group_by: str,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None) -> Optional[Dict]:
+        counts: Counter = Counter()
+        for log_handler in self.handlers:
+            handler_counts = log_handler.count_logs(group_by, start_date,
+                                                    end_date)
+            if handler_counts is None:
+                return None
+            counts.update(handler_counts)
+        return dict(counts)
+
+    def count_buckets(
+            self,
+            resolution: str,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None) \
+            -> Optional[Dict[str, Dict[LogLevelValue, int]]]:
+        buckets: Dict[str, Counter] = {}
+        for log_handler in self.handlers:
+            handler_buckets = log_handler.count_buckets(
+                resolution, start_date, end_date)
+            if handler_buckets is None:
+                return None
+            for key, counts in handler_buckets.items():
+                buckets.setdefault(key, Counter()).update(counts)
+        return {key: dict(buckets[key]) for key in sorted(buckets)}
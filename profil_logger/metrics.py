@@ -0,0 +1,221 @@
+"""
+Metrics of logging - counters and latency histograms of ProfilLogger and
+handlers, cheap enough to be always collected:
++ ProfilLogger counts logged and filtered out entries per level,
++ handlers count bytes they write and errors they swallow (e.g. of
+  malformed entries skipped when the log is read),
++ dispatchers time and count writes of entries to handlers.
+
+Snapshots are taken with ProfilLogger.stats() (or Handler.stats()), and
+can be sent to an Exporter periodically by a PeriodicExporter. Counters
+are plain integers updated without locks (like the dispatcher stats) -
+increments racing in different threads can be lost.
+"""
+import bisect
+import datetime
+import json
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from profil_logger.log_entry import LogLevelValue
+
+# upper bounds (in seconds) of histogram buckets: from 1 microsecond,
+# doubled up to 16.8 seconds
+LATENCY_BOUNDS = tuple(1e-6 * 2 ** exponent for exponent in range(25))
+
+
+class Histogram:
+    """
+    Counts of observed values in buckets with fixed upper bounds (values
+    over the last bound are counted in an overflow bucket). Quantiles are
+    estimated with upper bounds of the buckets containing them.
+    """
+    def __init__(self, bounds: Sequence[float] = LATENCY_BOUNDS):
+        self.bounds = tuple(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self._counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, quantile: float) -> Optional[float]:
+        """
+        Estimated quantile (0-1) of the observed values - None if nothing
+        was observed.
+        """
+        if not self.count:
+            return None
+        rank = quantile * self.count
+        cumulative_count = 0
+        for index, count in enumerate(self._counts):
+            cumulative_count += count
+            if count and cumulative_count >= rank:
+                return min(self.bounds[index], self.max) \
+                    if index < len(self.bounds) else self.max
+        return self.max
+
+    def stats(self) -> Dict:
+        return {"count": self.count,
+                "sum": self.sum,
+                "max": self.max,
+                "p50": self.quantile(0.5),
+                "p99": self.quantile(0.99),
+                # (upper bound, count) of non-empty buckets
+                "buckets": [(bound, count) for bound, count
+                            in zip(self.bounds + (float("inf"),),
+                                   self._counts) if count]}
+
+
+class HandlerMetrics:
+    """
+    Metrics of a handler.
+    """
+    def __init__(self):
+        self.writes = 0
+        self.entries_written = 0
+        self.failed_writes = 0
+        self.bytes_written = 0
+        self.errors: Dict[str, int] = {}
+        self.write_seconds = Histogram()
+
+    def record_write(self, entry_count: int, seconds: float):
+        self.writes += 1
+        self.entries_written += entry_count
+        self.write_seconds.observe(seconds)
+
+    def record_failed_write(self):
+        self.failed_writes += 1
+
+    def add_bytes(self, byte_count: int):
+        self.bytes_written += byte_count
+
+    def count_error(self, error: BaseException):
+        """
+        Count an error handled (swallowed) by the handler, by its type.
+        """
+        name = type(error).__name__
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def stats(self) -> Dict:
+        return {"writes": self.writes,
+                "entries_written": self.entries_written,
+                "failed_writes": self.failed_writes,
+                "bytes_written": self.bytes_written,
+                "errors": dict(self.errors),
+                "write_seconds": self.write_seconds.stats()}
+
+
+class LoggerMetrics:
+    """
+    Numbers of logged, filtered out (below the logger level, or not
+    routed to any handler) and throttled (sampled out, rate limited or
+    suppressed as duplicates) entries per level. Counts are kept in lists
+    indexed by level values (hashing enum members is slow).
+    """
+    COUNTERS = ("logged", "filtered", "sampled_out", "rate_limited",
+                "suppressed")
+
+    def __init__(self):
+        for counter in self.COUNTERS:
+            setattr(self, counter, [0] * len(LogLevelValue))
+
+    def stats(self) -> Dict:
+        return {counter: {level: getattr(self, counter)[level.value]
+                          for level in LogLevelValue}
+                for counter in self.COUNTERS}
+
+
+def to_serializable(stats: Any) -> Any:
+    """
+    Convert a snapshot to JSON-serializable values: levels to their names
+    and handlers (keys of handler stats) to their class names and storage
+    paths.
+    """
+    if isinstance(stats, dict):
+        return {_get_key_name(key): to_serializable(value)
+                for key, value in stats.items()}
+    if isinstance(stats, (list, tuple)):
+        return [to_serializable(value) for value in stats]
+    if isinstance(stats, float) and stats == float("inf"):
+        return "inf"
+    return stats
+
+
+def _get_key_name(key: Any) -> str:
+    if isinstance(key, LogLevelValue):
+        return key.name
+    if isinstance(key, str):
+        return key
+    for attribute in ("filepath", "db_path", "directory"):
+        path = getattr(key, attribute, None)
+        if isinstance(path, str):
+            return f"{type(key).__name__}({path})"
+    return f"{type(key).__name__}@{id(key):x}"
+
+
+class Exporter(ABC):
+    """
+    Base-abstract class for sending snapshots of metrics (e.g. to
+    a monitoring system).
+    """
+    @abstractmethod
+    def export(self, stats: Dict):
+        pass
+
+
+class JsonLinesExporter(Exporter):
+    """
+    Appends snapshots (with their date) to a JSON Lines file.
+    """
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+
+    def export(self, stats: Dict):
+        snapshot = {"date": datetime.datetime.now().isoformat(),
+                    **to_serializable(stats)}
+        with open(self.filepath, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(snapshot) + "\n")
+
+
+class PeriodicExporter:
+    """
+    Exports snapshots taken by get_stats (e.g. ProfilLogger.stats) every
+    interval seconds in a daemon thread, and once more when closed.
+    Exporter errors are counted, not raised.
+    """
+    def __init__(self,
+                 get_stats: Callable[[], Dict],
+                 exporters: List[Exporter],
+                 interval: float = 60.0):
+        self.get_stats = get_stats
+        self.exporters = exporters
+        self.interval = interval
+        self.failed_exports = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name="metrics-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self):
+        stats = self.get_stats()
+        for exporter in self.exporters:
+            try:
+                exporter.export(stats)
+            except Exception:
+                self.failed_exports += 1
+
+    def close(self):
+        if not self._stopped.is_set():
+            self._stopped.set()
+            self._thread.join()
+            self.export()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.export()
@@ -0,0 +1,236 @@
+"""
+Profiling of ProfilLoggerReader queries - an opt-in mode recording, for
+each query call:
++ time and number of entries of each stage of the scan:
+  - "count": counting entries by the handler (without reading them),
+  - "read": reading entries from the handler (I/O, parsing, and skipping
+    entries with handler's indexes, e.g. zone maps or Bloom filters),
+  - "filter": filtering read entries by dates and levels,
+  - "match": matching messages with the searched text or regex,
+  - "collect": paginating, grouping or counting found entries,
++ numbers of scanned (read from the handler) and returned entries,
++ bytes read with read() calls and page faults (memory-mapped files are
+  read through page faults) of the querying thread - where the platform
+  reports them,
++ peak memory allocated by the query (traced with tracemalloc).
+
+Stage times exclude the time of earlier stages. Profiling adds
+the overhead of timing each entry in each stage (and of tracemalloc, if
+memory is traced), so profiled queries are slower than regular ones.
+"""
+import contextlib
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, \
+    Tuple
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+STAGES = ("count", "read", "filter", "match", "collect")
+_IO_COUNTERS_PATH = "/proc/thread-self/io"
+
+
+class StageProfile:
+    def __init__(self):
+        self.seconds = 0.0
+        # number of entries passed to the next stage
+        self.entries = 0
+
+    def to_dict(self) -> Dict:
+        return {"seconds": self.seconds, "entries": self.entries}
+
+
+class _TimedEntries:
+    """
+    Iterator timing (inclusively - with earlier stages) and counting
+    the entries taken from another one.
+    """
+    def __init__(self, entries: Iterable, stage: StageProfile):
+        self._entries = iter(entries)
+        self._stage = stage
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            entry = next(self._entries)
+        finally:
+            self._stage.seconds += time.perf_counter() - started
+        self._stage.entries += 1
+        return entry
+
+
+class QueryProfile:
+    """
+    Profile of a single query call.
+    """
+    def __init__(self, query: str, handler_name: str):
+        self.query = query
+        self.handler_name = handler_name
+        self.seconds = 0.0
+        self.stages: Dict[str, StageProfile] = {}
+        self.entries_returned = 0
+        self.bytes_read: Optional[int] = None
+        self.page_faults: Optional[int] = None
+        self.peak_memory_bytes: Optional[int] = None
+        # stages of chained iterators, timed inclusively
+        self._chained_stages: List[StageProfile] = []
+
+    @property
+    def entries_scanned(self) -> int:
+        read_stage = self.stages.get("read")
+        return read_stage.entries if read_stage else 0
+
+    def time_entries(self, stage_name: str, entries: Iterable) -> Iterator:
+        """
+        Time a stage of the scan - an iterator over entries taken from
+        the previous stage (or from the handler).
+        """
+        stage = self.stages.setdefault(stage_name, StageProfile())
+        self._chained_stages.append(stage)
+        return _TimedEntries(entries, stage)
+
+    @contextlib.contextmanager
+    def time_stage(self, stage_name: str) -> Iterator[StageProfile]:
+        stage = self.stages.setdefault(stage_name, StageProfile())
+        started = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds += time.perf_counter() - started
+
+    def finish(self, seconds: float):
+        """
+        Turn inclusive times of chained stages into exclusive ones and
+        attribute the rest of the query time to collecting entries.
+        """
+        self.seconds = seconds
+        for earlier_stage, stage in reversed(list(zip(
+                self._chained_stages, self._chained_stages[1:]))):
+            stage.seconds -= earlier_stage.seconds
+        self._chained_stages = []
+        collect_stage = self.stages.setdefault("collect", StageProfile())
+        collect_stage.seconds = max(0.0, seconds - sum(
+            stage.seconds for stage in self.stages.values()
+            if stage is not collect_stage))
+        collect_stage.entries = self.entries_returned
+
+    def to_dict(self) -> Dict:
+        return {"query": self.query,
+                "handler": self.handler_name,
+                "seconds": self.seconds,
+                "stages": {name: self.stages[name].to_dict()
+                           for name in STAGES if name in self.stages},
+                "entries_scanned": self.entries_scanned,
+                "entries_returned": self.entries_returned,
+                "bytes_read": self.bytes_read,
+                "page_faults": self.page_faults,
+                "peak_memory_bytes": self.peak_memory_bytes}
+
+    def explain(self) -> str:
+        """
+        The profile as a human-readable text.
+        """
+        lines = [f"{self.query} on {self.handler_name}: "
+                 f"{self.seconds * 1000:.3f} ms, "
+                 f"{self.entries_scanned} entries scanned, "
+                 f"{self.entries_returned} returned"]
+        for name in STAGES:
+            stage = self.stages.get(name)
+            if stage is not None:
+                share = stage.seconds / self.seconds if self.seconds else 0
+                lines.append(f"  {name:<8} {stage.seconds * 1000:10.3f} ms "
+                             f"{share:6.1%} {stage.entries:>10} entries")
+        for label, value in [("bytes read", self.bytes_read),
+                             ("page faults", self.page_faults),
+                             ("peak memory", self.peak_memory_bytes)]:
+            if value is not None:
+                lines.append(f"  {label}: {value}")
+        return "\n".join(lines)
+
+    def __str__(self) -> str:
+        return self.explain()
+
+
+def _read_bytes_read() -> Optional[Tuple[int, int]]:
+    """
+    Number of bytes read by the current thread with read() calls (only
+    on Linux) - and the number of bytes read to get it, counted by
+    the next reading.
+    """
+    try:
+        with open(_IO_COUNTERS_PATH, "rb") as fh:
+            counters = fh.read()
+        for line in counters.splitlines():
+            if line.startswith(b"rchar:"):
+                return int(line.split()[1]), len(counters)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _read_page_faults() -> Optional[int]:
+    if resource is None:
+        return None
+    # per thread where supported (Linux), otherwise per process
+    usage = resource.getrusage(getattr(resource, "RUSAGE_THREAD",
+                                       resource.RUSAGE_SELF))
+    return usage.ru_minflt + usage.ru_majflt
+
+
+class QueryProfiler:
+    """
+    Profiles queries of the readers it's given to (see ProfilLoggerReader)
+    - the last profile is kept, and passed to on_profile (e.g. to log
+    slow queries) if given.
+    """
+    def __init__(self,
+                 trace_memory: bool = True,
+                 on_profile: Optional[Callable[[QueryProfile], None]] = None):
+        self.trace_memory = trace_memory
+        self.on_profile = on_profile
+        self.last_profile: Optional[QueryProfile] = None
+
+    @contextlib.contextmanager
+    def profile(self, query: str,
+                handler_name: str) -> Iterator[QueryProfile]:
+        """
+        Profile a query run (in the current thread) in the context.
+        """
+        query_profile = QueryProfile(query, handler_name)
+        started_tracing = self.trace_memory \
+            and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+        memory_at_start = tracemalloc.get_traced_memory()[0] \
+            if self.trace_memory else 0
+        bytes_read = _read_bytes_read()
+        page_faults = _read_page_faults()
+        started = time.perf_counter()
+        try:
+            yield query_profile
+        finally:
+            seconds = time.perf_counter() - started
+            if self.trace_memory:
+                query_profile.peak_memory_bytes = \
+                    tracemalloc.get_traced_memory()[1] - memory_at_start
+                if started_tracing:
+                    tracemalloc.stop()
+            bytes_read_at_end = _read_bytes_read()
+            if bytes_read is not None and bytes_read_at_end is not None:
+                query_profile.bytes_read = \
+                    bytes_read_at_end[0] - sum(bytes_read)
+            if page_faults is not None:
+                query_profile.page_faults = \
+                    _read_page_faults() - page_faults
+            query_profile.finish(seconds)
+            self.last_profile = query_profile
+        if self.on_profile is not None:
+            self.on_profile(query_profile)
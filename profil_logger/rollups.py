@@ -0,0 +1,312 @@
+"""
+Rollups - numbers of entries of each level per time bucket (minute, hour
+or day), updated when entries are written, so that entries can be counted
+in O(buckets) time instead of being read.
+
+Buckets are identified by prefixes of the ISO 8601 timestamps of their
+entries (e.g. '2020-01-01T10' for an hour), which are also ordered like
+the buckets. Counts of coarser buckets (e.g. months) are sums of their
+rollup buckets.
+
+File handlers keep rollups in a '<log file>.rollups' sidecar file:
+
+    header:  FILE_MAGIC, <B bucket key length, <QQ device and inode of
+             the log file, 16 bytes of a UUID of the sidecar file
+    batches: <QII log size and checksum (see profil_logger.log_state)
+             after the counted write, number of records
+    records: bucket key, <B level value, <Q number of added entries
+
+A batch of records is appended on every write, and the file is rewritten
+with a single batch (holding a record per bucket and level) when records
+accumulate. Rollups are used only while the log is the same file, with
+the same bytes up to the size of the last batch - rollups of a replaced
+log are rebuilt.
+"""
+import datetime
+import os
+import struct
+import threading
+import uuid
+from collections import Counter
+from typing import BinaryIO, Dict, Iterable, Optional, Tuple
+from profil_logger.log_entry import LogEntry, LogLevelValue
+from profil_logger.log_state import LogState, is_extended
+from profil_logger.timestamps import format_timestamp
+
+FILE_MAGIC = b"PLROLUP2"
+_HEADER = struct.Struct("<8sBQQ16s")
+_BATCH_HEADER = struct.Struct("<QII")
+
+# lengths of timestamp prefixes identifying buckets
+BUCKET_KEY_LENGTHS = {"minute": 16, "hour": 13, "day": 10, "month": 7}
+ROLLUP_RESOLUTIONS = ("minute", "hour", "day")
+
+_BUCKET_DURATIONS = {"minute": datetime.timedelta(minutes=1),
+                     "hour": datetime.timedelta(hours=1),
+                     "day": datetime.timedelta(days=1)}
+_ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+_LEVELS = {level.value: level for level in LogLevelValue}
+
+RollupCounts = Dict[Tuple[str, LogLevelValue], int]
+
+
+def count_entries(entries: Iterable[LogEntry],
+                  resolution: str) -> RollupCounts:
+    """
+    Count entries by their (bucket key, level).
+    """
+    key_length = BUCKET_KEY_LENGTHS[resolution]
+    return Counter((entry.iso_date[:key_length], entry.level)
+                   for entry in entries)
+
+
+def get_bucket_bounds(
+        date: datetime.datetime,
+        resolution: str) -> Tuple[datetime.datetime, datetime.datetime]:
+    """
+    The first and the last moment of the bucket of the date.
+    """
+    start = date.replace(second=0, microsecond=0)
+    if resolution in ("hour", "day", "month"):
+        start = start.replace(minute=0)
+    if resolution in ("day", "month"):
+        start = start.replace(hour=0)
+    if resolution == "month":
+        start = start.replace(day=1)
+        next_start = (start + datetime.timedelta(days=32)).replace(day=1)
+    else:
+        next_start = start + _BUCKET_DURATIONS[resolution]
+    return start, next_start - _ONE_MICROSECOND
+
+
+def covers_whole_buckets(resolution: str,
+                         start_date: Optional[datetime.datetime],
+                         end_date: Optional[datetime.datetime]) -> bool:
+    """
+    True if the period starts and ends on boundaries of buckets (so that
+    it can be counted from rollups exactly).
+    """
+    return (start_date is None
+            or get_bucket_bounds(start_date, resolution)[0] == start_date) \
+        and (end_date is None
+             or get_bucket_bounds(end_date, resolution)[1] == end_date)
+
+
+def get_key_range(
+        rollup_resolution: str,
+        resolution: str,
+        start_date: Optional[datetime.datetime],
+        end_date: Optional[datetime.datetime]) \
+        -> Tuple[Optional[str], Optional[str]]:
+    """
+    Keys of the first and the last rollup bucket of the (coarser or
+    equal) resolution buckets overlapping the period.
+    """
+    key_length = BUCKET_KEY_LENGTHS[rollup_resolution]
+    first_key = last_key = None
+    if start_date:
+        first_key = format_timestamp(
+            get_bucket_bounds(start_date, resolution)[0])[:key_length]
+    if end_date:
+        last_key = format_timestamp(
+            get_bucket_bounds(end_date, resolution)[1])[:key_length]
+    return first_key, last_key
+
+
+def is_finer_or_equal(rollup_resolution: str, resolution: str) -> bool:
+    return BUCKET_KEY_LENGTHS[rollup_resolution] \
+        >= BUCKET_KEY_LENGTHS[resolution]
+
+
+def iter_counts(
+        counts: RollupCounts) -> Iterable[Tuple[str, LogLevelValue, int]]:
+    return ((key, level, count) for (key, level), count in counts.items())
+
+
+def group_counts(
+        counts: Iterable[Tuple[str, LogLevelValue, int]],
+        resolution: str,
+        first_key: Optional[str],
+        last_key: Optional[str]) -> Dict[str, Dict[LogLevelValue, int]]:
+    """
+    Sum (rollup bucket key, level, count) counts of rollup buckets
+    between the keys into buckets of the resolution.
+    """
+    key_length = BUCKET_KEY_LENGTHS[resolution]
+    buckets: Dict[str, Dict[LogLevelValue, int]] = {}
+    for key, level, count in counts:
+        if (first_key is not None and key < first_key) \
+                or (last_key is not None and key > last_key):
+            continue
+        bucket = buckets.setdefault(key[:key_length], {})
+        bucket[level] = bucket.get(level, 0) + count
+    return buckets
+
+
+def sum_buckets(buckets: Dict[str, Dict[LogLevelValue, int]],
+                group_by: str) -> Dict:
+    """
+    Sum bucket counts by levels or by months (see Handler.count_logs()).
+    """
+    counts: Counter = Counter()
+    for key, bucket in buckets.items():
+        if group_by == "level":
+            counts.update(bucket)
+        else:
+            counts[key[:BUCKET_KEY_LENGTHS["month"]]] += sum(bucket.values())
+    return dict(counts)
+
+
+class RollupFile:
+    """
+    Rollups of a log file, stored in a sidecar file. Batches are read
+    once and then only new ones are loaded.
+    """
+    # number of records (in excess of one per bucket and level) which
+    # make the file rewritten
+    compaction_threshold = 4096
+
+    def __init__(self, log_path: str, resolution: str):
+        if resolution not in ROLLUP_RESOLUTIONS:
+            raise ValueError(f"Unknown rollup resolution: {resolution}")
+        self.path = f"{log_path}.rollups"
+        self.resolution = resolution
+        self.key_length = BUCKET_KEY_LENGTHS[resolution]
+        self._record = struct.Struct(f"<{self.key_length}sBQ")
+        self._lock = threading.Lock()
+        self._counts: RollupCounts = {}
+        self._record_count = 0
+        self._log_id: Tuple[int, int] = (0, 0)
+        # state of the log counted by the loaded batches
+        self._log_state: Optional[LogState] = None
+        # header of the loaded sidecar file
+        self._header = b""
+        self._loaded_to = 0
+
+    def load(self, log_fh: BinaryIO) -> Optional[RollupCounts]:
+        """
+        Load new batches and return (a copy of) the counts - or None if
+        there are no rollups of the log file opened for reading (e.g. of
+        a replaced log, or of a rewritten part of it).
+        """
+        with self._lock:
+            try:
+                self._load()
+            except (FileNotFoundError, ValueError, KeyError,
+                    struct.error):
+                # UnicodeDecodeError is a ValueError
+                self._reset()
+                return None
+            if self._log_state is None \
+                    or not is_extended(log_fh, self._log_state):
+                return None
+            return dict(self._counts)
+
+    def _load(self):
+        with open(self.path, "rb") as fh:
+            header = fh.read(_HEADER.size)
+            if header != self._header:
+                # a new (or rewritten) file - possibly with the inode of
+                # the loaded one
+                self._reset()
+                self._read_header(header)
+            fh.seek(self._loaded_to)
+            data = fh.read()
+        record_size = self._record.size
+        counts = self._counts
+        position = 0
+        while position + _BATCH_HEADER.size <= len(data):
+            log_size, log_checksum, record_count = \
+                _BATCH_HEADER.unpack_from(data, position)
+            records_start = position + _BATCH_HEADER.size
+            end = records_start + record_count * record_size
+            if end > len(data):
+                # a batch being written is read next time
+                break
+            for key, level, count in self._record.iter_unpack(
+                    data[records_start:end]):
+                bucket = (key.rstrip(b"\0").decode("ascii"), _LEVELS[level])
+                counts[bucket] = counts.get(bucket, 0) + count
+            self._record_count += record_count
+            self._log_state = LogState(*self._log_id, log_size,
+                                       log_checksum)
+            position = end
+        self._loaded_to += position
+
+    def _read_header(self, header: bytes):
+        magic, key_length, device, inode, _ = _HEADER.unpack(header)
+        if magic != FILE_MAGIC or key_length != self.key_length:
+            raise ValueError("incompatible rollups")
+        self._header = header
+        self._log_id = (device, inode)
+        self._loaded_to = _HEADER.size
+
+    def _reset(self):
+        self._counts, self._header = {}, b""
+        self._record_count = 0
+        self._log_state = None
+        self._loaded_to = 0
+
+    def append(self, counts: RollupCounts, log_state: LogState):
+        """
+        Add counts of written entries, with the state of the log after
+        writing them, to existing rollups (a missing file is left to be
+        rebuilt).
+        """
+        with self._lock:
+            try:
+                with open(self.path, "r+b") as fh:
+                    fh.seek(0, os.SEEK_END)
+                    fh.write(self._encode_batch(counts, log_state))
+                self._load()
+            except (FileNotFoundError, ValueError, KeyError,
+                    struct.error):
+                self._reset()
+                return
+            if self._record_count \
+                    > len(self._counts) + self.compaction_threshold:
+                self._write(self._counts, self._log_state)
+
+    def write(self, counts: RollupCounts, log_state: LogState):
+        """
+        Replace the rollups of the log, counted up to the log state.
+        """
+        with self._lock:
+            self._write(counts, log_state)
+
+    def _write(self, counts: RollupCounts, log_state: LogState):
+        # written under a temporary name, so that readers never see
+        # a partially written file
+        temporary_path = f"{self.path}.tmp"
+        header = _HEADER.pack(FILE_MAGIC, self.key_length, log_state.device,
+                              log_state.inode, uuid.uuid4().bytes)
+        data = header + self._encode_batch(counts, log_state)
+        with open(temporary_path, "wb") as fh:
+            fh.write(data)
+        os.replace(temporary_path, self.path)
+        self._counts = dict(counts)
+        self._header = header
+        self._record_count = len(counts)
+        self._log_id = (log_state.device, log_state.inode)
+        self._log_state = log_state
+        self._loaded_to = len(data)
+
+    def clear(self):
+        """
+        Discard the rollups (and their sidecar file).
+        """
+        with self._lock:
+            self._reset()
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _encode_batch(self, counts: RollupCounts,
+                      log_state: LogState) -> bytes:
+        pack_record = self._record.pack
+        return _BATCH_HEADER.pack(log_state.size, log_state.checksum,
+                                  len(counts)) \
+            + b"".join(pack_record(key.encode("ascii"), level.value, count)
+                       for (key, level), count in counts.items())
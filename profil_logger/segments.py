@@ -0,0 +1,511 @@
+"""
+Columnar segment storage for historical logs.
+
+Entries are written to a "hot" handler (a BinaryHandler by default);
+compact() turns its file into an immutable segment file, which stores
+entries in blocks of separate columns:
+
+    ids         int64  - entry ids in the hot handler
+    timestamps  int64  - microseconds since the epoch
+    levels      uint8  - level values
+    messages    uint32 - references to the block's dictionary of
+                         (unique) messages
+
+Each block has a zone map: its minimum/maximum timestamp, and level and
+month histograms. Scans skip blocks outside of the searched period or
+without entries of the searched levels, and entries are counted from
+the histograms - only blocks crossing the boundaries of the period have
+their timestamps and levels read.
+
+The segment file consists of the FILE_MAGIC signature, blocks, and
+a JSON footer with the zone maps and offsets of the columns, followed by
+the footer length (<Q) and the FILE_MAGIC.
+"""
+import datetime
+import itertools
+import json
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import BinaryIO, Callable, Collection, Dict, Iterator, List, \
+    Optional, Tuple
+from profil_logger.binary_handler import BinaryHandler
+from profil_logger.handlers import Buffer, Handler, map_file
+from profil_logger.log_entry import LogCursor, LogEntry, LogLevelValue
+from profil_logger.timestamps import from_epoch_us, to_epoch_us
+
+FILE_MAGIC = b"PLOGSEG1"
+_FOOTER_LENGTH_SIZE = 8
+
+_LEVELS = {level.value: level for level in LogLevelValue}
+
+# entry ids are (generation << GENERATION_SHIFT) + the hot handler id, so
+# that ids (and cursors) stay the same when entries are compacted
+GENERATION_SHIFT = 40
+_LOCAL_ID_MASK = (1 << GENERATION_SHIFT) - 1
+
+_SEGMENT_FILE_PATTERN = re.compile(r"^segment-(\d+)\.seg$")
+_HOT_FILE_PATTERN = re.compile(r"^hot-(\d+)\.log$")
+
+
+def write_segment(file_path: str,
+                  entries: Iterator[LogEntry],
+                  block_size: int = 65_536) -> int:
+    """
+    Write entries into a new segment file (atomically - it's written
+    under a temporary name first). Returns the number of entries.
+    """
+    temporary_path = f"{file_path}.tmp"
+    with open(temporary_path, "wb") as fh:
+        count = dump_segment(fh, entries, block_size)
+    os.replace(temporary_path, file_path)
+    return count
+
+
+def dump_segment(fh: BinaryIO,
+                 entries: Iterator[LogEntry],
+                 block_size: int = 65_536) -> int:
+    """
+    Write entries as a segment into a binary file opened for writing.
+    Returns the number of entries.
+    """
+    blocks = []
+    fh.write(FILE_MAGIC)
+    block_entries = []
+    for entry in entries:
+        block_entries.append(entry)
+        if len(block_entries) == block_size:
+            blocks.append(_write_block(fh, block_entries))
+            block_entries = []
+    if block_entries:
+        blocks.append(_write_block(fh, block_entries))
+    footer = json.dumps({"blocks": blocks}).encode("utf-8")
+    fh.write(footer)
+    fh.write(len(footer).to_bytes(_FOOTER_LENGTH_SIZE, "little"))
+    fh.write(FILE_MAGIC)
+    return sum(block["count"] for block in blocks)
+
+
+def _write_block(fh, entries: List[LogEntry]) -> Dict:
+    timestamps = array("q", (to_epoch_us(entry.date) for entry in entries))
+    levels = array("B", (entry.level.value for entry in entries))
+    ids = array("q", (entry.entry_id or 0 for entry in entries))
+    dictionary: Dict[str, int] = {}
+    references = array("I", (dictionary.setdefault(
+        entry.message, len(dictionary)) for entry in entries))
+    encoded_messages = [message.encode("utf-8") for message in dictionary]
+    message_lengths = array("I", map(len, encoded_messages))
+
+    columns = {}
+    for name, data in [("ids", ids.tobytes()),
+                       ("timestamps", timestamps.tobytes()),
+                       ("levels", levels.tobytes()),
+                       ("messages", references.tobytes()),
+                       ("dictionary_lengths", message_lengths.tobytes()),
+                       ("dictionary", b"".join(encoded_messages))]:
+        columns[name] = [fh.tell(), len(data)]
+        fh.write(data)
+    months = Counter(entry.date.strftime("%Y-%m") for entry in entries)
+    return {"count": len(entries),
+            "min_timestamp": min(timestamps),
+            "max_timestamp": max(timestamps),
+            "levels": [levels.count(level.value) for level in LogLevelValue],
+            "months": dict(months),
+            "columns": columns}
+
+
+class Segment:
+    """
+    Read access to a segment - a mapped segment file, or any other buffer
+    with its bytes.
+    """
+    def __init__(self, buffer: Buffer):
+        self._buffer = buffer
+        self.blocks = self._read_footer()
+
+    def _read_footer(self) -> List[Dict]:
+        buffer = self._buffer
+        size = len(buffer)
+        if size < 2 * len(FILE_MAGIC) + _FOOTER_LENGTH_SIZE \
+                or buffer[:len(FILE_MAGIC)] != FILE_MAGIC \
+                or buffer[size - len(FILE_MAGIC):] != FILE_MAGIC:
+            raise ValueError("not a segment file")
+        length_end = size - len(FILE_MAGIC)
+        footer_length = int.from_bytes(
+            buffer[length_end - _FOOTER_LENGTH_SIZE:length_end], "little")
+        footer_end = length_end - _FOOTER_LENGTH_SIZE
+        footer = buffer[footer_end - footer_length:footer_end]
+        return json.loads(bytes(footer))["blocks"]
+
+    def read_column(self, block: Dict, name: str, typecode: str) -> array:
+        offset, length = block["columns"][name]
+        column = array(typecode)
+        column.frombytes(self._buffer[offset:offset + length])
+        return column
+
+    def read_dictionary(self, block: Dict) -> List[str]:
+        offset = block["columns"]["dictionary"][0]
+        messages = []
+        for length in self.read_column(block, "dictionary_lengths", "I"):
+            messages.append(str(self._buffer[offset:offset + length],
+                                "utf-8"))
+            offset += length
+        return messages
+
+    def iter_entries(
+            self,
+            newest_first: bool,
+            after: Optional[LogCursor],
+            start_date: Optional[datetime.datetime],
+            end_date: Optional[datetime.datetime],
+            contains: Optional[str],
+            levels: Optional[Collection[LogLevelValue]]) \
+            -> Iterator[LogEntry]:
+        """
+        Read entries matching a scan, skipping blocks by their zone maps.
+        """
+        lower_bound = to_epoch_us(start_date) if start_date else -2 ** 63
+        upper_bound = to_epoch_us(end_date) if end_date else 2 ** 63
+        level_values = None if levels is None \
+            else {level.value for level in levels}
+        blocks = self.blocks[::-1] if newest_first else self.blocks
+        for block in blocks:
+            if not _block_matches(block, lower_bound, upper_bound,
+                                  level_values):
+                continue
+            yield from self._read_block(block, newest_first, after,
+                                        lower_bound, upper_bound, contains,
+                                        level_values)
+
+    def _read_block(
+            self,
+            block: Dict,
+            newest_first: bool,
+            after: Optional[LogCursor],
+            lower_bound: int,
+            upper_bound: int,
+            contains: Optional[str],
+            level_values: Optional[Collection[int]]) -> Iterator[LogEntry]:
+        ids = self.read_column(block, "ids", "q")
+        timestamps = self.read_column(block, "timestamps", "q")
+        levels = self.read_column(block, "levels", "B")
+        references = self.read_column(block, "messages", "I")
+        dictionary = self.read_dictionary(block)
+        rows = range(block["count"] - 1, -1, -1) if newest_first \
+            else range(block["count"])
+        if after:
+            rows = [row for row in rows if (
+                ids[row] < after.entry_id if newest_first
+                else ids[row] > after.entry_id)]
+        if block["min_timestamp"] < lower_bound \
+                or block["max_timestamp"] > upper_bound:
+            rows = [row for row in rows
+                    if lower_bound <= timestamps[row] <= upper_bound]
+        if level_values is not None:
+            rows = [row for row in rows if levels[row] in level_values]
+        if contains:
+            # the text is searched in the dictionary, once per message
+            matching_messages = {index for index, message
+                                 in enumerate(dictionary)
+                                 if contains in message}
+            rows = [row for row in rows
+                    if references[row] in matching_messages]
+        for row in rows:
+            yield LogEntry(from_epoch_us(timestamps[row]),
+                           _LEVELS[levels[row]],
+                           dictionary[references[row]],
+                           ids[row])
+
+    def count_entries(self,
+                      group_by: str,
+                      lower_bound: int,
+                      upper_bound: int,
+                      counts: Counter):
+        """
+        Add the numbers of entries between the bounds (microseconds since
+        the epoch) to counts, by "level" or "month" - from zone maps of
+        the blocks inside the period.
+        """
+        for block in self.blocks:
+            if not _block_matches(block, lower_bound, upper_bound):
+                continue
+            if lower_bound <= block["min_timestamp"] \
+                    and block["max_timestamp"] <= upper_bound:
+                # the whole block is in the period - its zone map has
+                # the counts
+                if group_by == "level":
+                    counts.update({
+                        level: count for level, count
+                        in zip(LogLevelValue, block["levels"])})
+                else:
+                    counts.update(block["months"])
+                continue
+            timestamps = self.read_column(block, "timestamps", "q")
+            if group_by == "level":
+                levels = self.read_column(block, "levels", "B")
+                counts.update(
+                    _LEVELS[level] for timestamp, level
+                    in zip(timestamps, levels)
+                    if lower_bound <= timestamp <= upper_bound)
+            else:
+                counts.update(
+                    from_epoch_us(timestamp).strftime("%Y-%m")
+                    for timestamp in timestamps
+                    if lower_bound <= timestamp <= upper_bound)
+
+
+class SegmentedHandler(Handler):
+    """
+    Manages log entries in a directory of immutable columnar segments
+    (see the module docstring), with a hot handler for new entries.
+    Call compact() (e.g. periodically) to move the entries of the hot
+    handler into a new segment.
+    """
+    def __init__(self,
+                 directory: str,
+                 hot_handler_factory: Callable[[str], Handler] = BinaryHandler,
+                 block_size: int = 65_536):
+        self.directory = directory
+        self.hot_handler_factory = hot_handler_factory
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self._hot_generation = 0
+        self._hot_handler: Optional[Handler] = None
+        super(SegmentedHandler, self).__init__()
+
+    def _create_log_if_non_existent(self):
+        os.makedirs(self.directory, exist_ok=True)
+        segments, hot_files = self._list_generations()
+        # the newest hot file not compacted yet is still written to
+        hot_generations = [generation for generation in hot_files
+                           if generation not in segments]
+        self._open_hot_handler(
+            max(hot_generations) if hot_generations
+            else max(list(segments) + [0]) + 1)
+
+    def _open_hot_handler(self, generation: int):
+        self._hot_generation = generation
+        self._hot_handler = self.hot_handler_factory(
+            self._get_hot_path(generation))
+
+    def _get_hot_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"hot-{generation:06d}.log")
+
+    def _get_segment_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"segment-{generation:06d}.seg")
+
+    def _list_generations(self) -> Tuple[Dict[int, str], Dict[int, str]]:
+        segments = {}
+        hot_files = {}
+        for file_name in os.listdir(self.directory):
+            file_path = os.path.join(self.directory, file_name)
+            for pattern, files in [(_SEGMENT_FILE_PATTERN, segments),
+                                   (_HOT_FILE_PATTERN, hot_files)]:
+                match = pattern.match(file_name)
+                if match:
+                    files[int(match.group(1))] = file_path
+        return segments, hot_files
+
+    def persist_log(self, entry: LogEntry):
+        with self._lock:
+            self._hot_handler.persist_log(entry)
+
+    def persist_logs(self, entries: List[LogEntry]):
+        with self._lock:
+            self._hot_handler.persist_logs(entries)
+
+    def compact(self) -> int:
+        """
+        Move entries of the hot handler (and of hot files left by
+        an interrupted compaction) into segments. Returns the number of
+        compacted entries.
+        """
+        with self._compaction_lock:
+            with self._lock:
+                compacted_generation = self._hot_generation
+                self._open_hot_handler(compacted_generation + 1)
+            segments, hot_files = self._list_generations()
+            compacted = 0
+            for generation in sorted(hot_files):
+                if generation > compacted_generation:
+                    continue
+                if generation not in segments:
+                    compacted += self._compact_hot_file(
+                        generation, hot_files[generation])
+                os.remove(hot_files[generation])
+            return compacted
+
+    def _compact_hot_file(self, generation: int, file_path: str) -> int:
+        entries = self.hot_handler_factory(file_path).iter_logs()
+        first_entry = next(entries, None)
+        if first_entry is None:
+            return 0
+        return write_segment(self._get_segment_path(generation),
+                             itertools.chain([first_entry], entries),
+                             self.block_size)
+
+    def retrieve_all_logs(self) -> List[LogEntry]:
+        return list(self.iter_logs())
+
+    def iter_logs(
+            self,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            contains: Optional[str] = None,
+            levels: Optional[Collection[LogLevelValue]] = None) \
+            -> Iterator[LogEntry]:
+        cursor_generation = after.entry_id >> GENERATION_SHIFT \
+            if after else None
+        for generation, kind, file_path in self._get_sources(newest_first):
+            if cursor_generation is not None and (
+                    generation > cursor_generation if newest_first
+                    else generation < cursor_generation):
+                continue
+            source_after = None
+            if generation == cursor_generation:
+                source_after = LogCursor(after.date,
+                                         after.entry_id & _LOCAL_ID_MASK)
+            if kind == "segment":
+                entries = self._iter_segment(
+                    file_path, newest_first, source_after, start_date,
+                    end_date, contains, levels)
+            else:
+                hot_handler = self._get_hot_handler(file_path)
+                if hot_handler is None:
+                    continue
+                entries = hot_handler.iter_logs(
+                    newest_first=newest_first, after=source_after,
+                    start_date=start_date, end_date=end_date,
+                    contains=contains, levels=levels)
+            id_base = generation << GENERATION_SHIFT
+            for entry in entries:
+                yield LogEntry(entry.date, entry.level, entry.message,
+                               id_base + entry.entry_id)
+
+    def _get_sources(self,
+                     newest_first: bool) -> List[Tuple[int, str, str]]:
+        """
+        (generation, kind, path) of the segments and hot files - segments
+        take precedence over hot files of the same generation, which are
+        removed after compaction.
+        """
+        segments, hot_files = self._list_generations()
+        sources = {generation: (generation, "hot", file_path)
+                   for generation, file_path in hot_files.items()}
+        sources.update((generation, (generation, "segment", file_path))
+                       for generation, file_path in segments.items())
+        return [sources[generation] for generation
+                in sorted(sources, reverse=newest_first)]
+
+    def _get_hot_handler(self, file_path: str) -> Optional[Handler]:
+        if not os.path.exists(file_path):
+            # compacted in the meantime
+            return None
+        with self._lock:
+            if file_path == self._get_hot_path(self._hot_generation):
+                return self._hot_handler
+        return self.hot_handler_factory(file_path)
+
+    def _iter_segment(
+            self,
+            file_path: str,
+            newest_first: bool,
+            after: Optional[LogCursor],
+            start_date: Optional[datetime.datetime],
+            end_date: Optional[datetime.datetime],
+            contains: Optional[str],
+            levels: Optional[Collection[LogLevelValue]]) \
+            -> Iterator[LogEntry]:
+        try:
+            yield from iter_segment(file_path, newest_first, after,
+                                    start_date, end_date, contains, levels)
+        except (FileNotFoundError, ValueError) as error:
+            self.metrics.count_error(error)
+            return
+
+    def count_logs(
+            self,
+            group_by: str,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None) -> Optional[Dict]:
+        lower_bound = to_epoch_us(start_date) if start_date else -2 ** 63
+        upper_bound = to_epoch_us(end_date) if end_date else 2 ** 63
+        counts: Counter = Counter()
+        for _, kind, file_path in self._get_sources(newest_first=False):
+            if kind == "segment":
+                count_segment(file_path, group_by, lower_bound,
+                              upper_bound, counts)
+                continue
+            hot_handler = self._get_hot_handler(file_path)
+            if hot_handler is None:
+                continue
+            hot_counts = hot_handler.count_logs(group_by, start_date,
+                                                end_date)
+            if hot_counts is None:
+                entries = hot_handler.iter_logs(start_date=start_date,
+                                                end_date=end_date)
+                hot_counts = Counter(
+                    entry.level if group_by == "level"
+                    else entry.date.strftime("%Y-%m")
+                    for entry in entries
+                    if lower_bound <= to_epoch_us(entry.date) <= upper_bound)
+            counts.update(hot_counts)
+        if group_by == "level":
+            return {level: counts[level] for level in LogLevelValue
+                    if counts[level]}
+        return dict(sorted(counts.items()))
+
+
+def _block_matches(block: Dict,
+                   lower_bound: int,
+                   upper_bound: int,
+                   level_values: Optional[Collection[int]] = None) -> bool:
+    """
+    Check the zone map of a block for entries possibly matching a scan.
+    """
+    if block["max_timestamp"] < lower_bound \
+            or block["min_timestamp"] > upper_bound:
+        return False
+    return level_values is None or any(
+        block["levels"][level] for level in level_values)
+
+
+def iter_segment(
+        file_path: str,
+        newest_first: bool,
+        after: Optional[LogCursor],
+        start_date: Optional[datetime.datetime],
+        end_date: Optional[datetime.datetime],
+        contains: Optional[str],
+        levels: Optional[Collection[LogLevelValue]]) \
+        -> Iterator[LogEntry]:
+    """
+    Read entries of a segment file matching a scan (see
+    Segment.iter_entries()). Raises FileNotFoundError, or ValueError if
+    the file isn't a segment.
+    """
+    with open(file_path, "rb") as fh, map_file(fh) as buffer:
+        yield from Segment(buffer).iter_entries(
+            newest_first, after, start_date, end_date, contains, levels)
+
+
+def count_segment(file_path: str,
+                  group_by: str,
+                  lower_bound: int,
+                  upper_bound: int,
+                  counts: Counter):
+    """
+    Add the numbers of entries of a segment file between the bounds to
+    counts (see Segment.count_entries()).
+    """
+    try:
+        with open(file_path, "rb") as fh, map_file(fh) as buffer:
+            Segment(buffer).count_entries(group_by, lower_bound,
+                                          upper_bound, counts)
+    except (FileNotFoundError, ValueError):
+        return
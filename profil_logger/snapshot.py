@@ -0,0 +1,162 @@
+"""
+Snapshots of logs in shared memory, read by many processes at once.
+
+One process copies entries of a log into a named shared memory block, in
+the columnar segment format (see profil_logger.segments) - timestamps,
+levels and dictionary-encoded messages in blocks with zone maps. Other
+processes map the block read-only by its name, and query it without
+copying or parsing the whole log - only columns of the blocks a query
+reads are decoded.
+
+The shared memory block consists of the length of the segment (<Q)
+followed by the segment.
+"""
+import datetime
+import mmap
+import os
+import tempfile
+from collections import Counter
+from multiprocessing import shared_memory
+from typing import Collection, Dict, Iterator, List, Optional
+from profil_logger.handlers import Handler
+from profil_logger.log_entry import LogCursor, LogEntry, LogLevelValue
+from profil_logger.segments import Segment, dump_segment
+from profil_logger.timestamps import to_epoch_us
+try:
+    import _posixshmem
+except ImportError:
+    # not available on Windows
+    _posixshmem = None
+
+_LENGTH_SIZE = 8
+_COPIED_CHUNK_SIZE = 1 << 20
+
+
+class SharedSnapshotHandler(Handler):
+    """
+    Read-only snapshot of a log in shared memory (see the module
+    docstring). Given a source handler, the snapshot of its entries is
+    created under the name - other processes attach to it with
+    SharedSnapshotHandler(name). Entry ids are positions of entries in
+    the snapshot.
+
+    Call close() when done reading, and unlink() in the creating process
+    to free the snapshot.
+    """
+    def __init__(self,
+                 name: str,
+                 source: Optional[Handler] = None,
+                 block_size: int = 65_536):
+        self.name = name
+        self._shared_memory: Optional[shared_memory.SharedMemory] = None
+        self._mapping: Optional[mmap.mmap] = None
+        if source is not None:
+            view = self._create(source, block_size)
+        else:
+            view = self._attach()
+        length = int.from_bytes(view[:_LENGTH_SIZE], "little")
+        self._views = [view, view[_LENGTH_SIZE:_LENGTH_SIZE + length]]
+        self._segment: Optional[Segment] = Segment(self._views[-1])
+        super(SharedSnapshotHandler, self).__init__()
+
+    def _create(self, source: Handler, block_size: int) -> memoryview:
+        # the segment is written into a temporary file first, as its size
+        # has to be known to create the shared memory block
+        with tempfile.TemporaryFile() as fh:
+            dump_segment(fh, (
+                LogEntry(entry.date, entry.level, entry.message, position)
+                for position, entry in enumerate(source.iter_logs())),
+                block_size)
+            length = fh.tell()
+            self._shared_memory = shared_memory.SharedMemory(
+                self.name, create=True, size=_LENGTH_SIZE + length)
+            view = self._shared_memory.buf
+            view[:_LENGTH_SIZE] = length.to_bytes(_LENGTH_SIZE, "little")
+            fh.seek(0)
+            position = _LENGTH_SIZE
+            for chunk in iter(lambda: fh.read(_COPIED_CHUNK_SIZE), b""):
+                view[position:position + len(chunk)] = chunk
+                position += len(chunk)
+        return view.toreadonly()
+
+    def _attach(self) -> memoryview:
+        if _posixshmem is None:
+            self._shared_memory = shared_memory.SharedMemory(self.name)
+            return self._shared_memory.buf.toreadonly()
+        # the block is mapped without SharedMemory, which (before Python
+        # 3.13) would unlink it when the attaching process exits
+        fd = _posixshmem.shm_open(f"/{self.name}", os.O_RDONLY)
+        try:
+            self._mapping = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        return memoryview(self._mapping)
+
+    def close(self):
+        """
+        Detach from the shared memory block (entries can't be read
+        anymore).
+        """
+        self._segment = None
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+        if self._shared_memory is not None:
+            self._shared_memory.close()
+
+    def unlink(self):
+        """
+        Free the shared memory block - in the process which created
+        the snapshot, once it isn't needed anymore.
+        """
+        if self._shared_memory is None:
+            raise ValueError("only the creator of a snapshot unlinks it")
+        self._shared_memory.unlink()
+
+    def persist_log(self, entry: LogEntry):
+        raise NotImplementedError("snapshots are read-only")
+
+    def persist_logs(self, entries: List[LogEntry]):
+        raise NotImplementedError("snapshots are read-only")
+
+    def retrieve_all_logs(self) -> List[LogEntry]:
+        return list(self.iter_logs())
+
+    def iter_logs(
+            self,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            contains: Optional[str] = None,
+            levels: Optional[Collection[LogLevelValue]] = None) \
+            -> Iterator[LogEntry]:
+        if self._segment is None:
+            raise ValueError("the snapshot is closed")
+        return self._segment.iter_entries(newest_first, after, start_date,
+                                          end_date, contains, levels)
+
+    def count_logs(
+            self,
+            group_by: str,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None) -> Optional[Dict]:
+        if self._segment is None:
+            raise ValueError("the snapshot is closed")
+        lower_bound = to_epoch_us(start_date) if start_date else -2 ** 63
+        upper_bound = to_epoch_us(end_date) if end_date else 2 ** 63
+        counts: Counter = Counter()
+        self._segment.count_entries(group_by, lower_bound, upper_bound,
+                                    counts)
+        if group_by == "level":
+            return {level: counts[level] for level in LogLevelValue
+                    if counts[level]}
+        return dict(sorted(counts.items()))
+
+    def stats(self) -> Dict:
+        snapshot_bytes = len(self._views[-1]) if self._views else 0
+        return {**super(SharedSnapshotHandler, self).stats(),
+                "snapshot_bytes": snapshot_bytes}
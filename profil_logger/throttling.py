@@ -0,0 +1,115 @@
+"""
+Protection of handlers from floods of entries - e.g. the same error
+logged thousands of times per second during an incident. ProfilLogger
+(see set_sampling_rate(), set_rate_limit() and
+set_duplicate_suppression()) checks each logging call of a throttled
+level with constant-time bookkeeping:
++ sampling - only a given fraction of entries of a level is logged,
++ rate limiting - a token bucket per level admits at most 'rate' entries
+  per second on average, with bursts of up to 'burst' entries,
++ duplicate suppression - a message repeated right after itself (with
+  the same level and arguments) is logged once, followed by a summary
+  "previous message repeated N times" when another message is logged,
+  the logger is flushed, or the burst lasts longer than a window.
+"""
+import random
+import threading
+import time
+from typing import Optional, Tuple
+from profil_logger.log_entry import LogLevelValue
+
+
+REPEATED_MESSAGE = "previous message repeated %d times"
+
+
+class TokenBucket:
+    """
+    Token bucket refilled with 'rate' tokens per second, up to 'burst'
+    tokens. Not locked - concurrent calls can admit a few entries too
+    many, which is preferred to contention on a lock in the hot path.
+    """
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("The rate has to be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    def consume(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class Sampler:
+    """
+    Admits a 'rate' fraction (from 0 to 1) of calls, at random.
+    """
+    def __init__(self, rate: float):
+        if not 0 <= rate <= 1:
+            raise ValueError("The sampling rate has to be between 0 and 1")
+        self.rate = rate
+        self._random = random.random
+
+    def sample(self) -> bool:
+        return self._random() < self.rate
+
+
+class DuplicateSuppressor:
+    """
+    Tracks the last logged message (with its level and arguments) and
+    the number of its suppressed repetitions.
+    """
+    def __init__(self, window: float = 10.0):
+        self.window = window
+        self._last: Optional[Tuple] = None
+        self._repeated = 0
+        self._repeated_since = 0.0
+        self._lock = threading.Lock()
+
+    def check(self, log_level: LogLevelValue, message: str, args: tuple) \
+            -> Tuple[bool, Optional[Tuple[LogLevelValue, int]]]:
+        """
+        Whether the message is new (should be logged), and the level and
+        number of repetitions of the previous message to summarize (if
+        any) before it.
+        """
+        key = (log_level, message, args)
+        with self._lock:
+            if self._last == key:
+                if not self._repeated:
+                    self._repeated_since = time.monotonic()
+                elif time.monotonic() - self._repeated_since \
+                        >= self.window:
+                    summary = (log_level, self._repeated)
+                    self._repeated = 1
+                    self._repeated_since = time.monotonic()
+                    return False, summary
+                self._repeated += 1
+                return False, None
+            summary = self._pop_summary()
+            self._last = key
+            return True, summary
+
+    def flush(self) -> Optional[Tuple[LogLevelValue, int]]:
+        """
+        The summary of the suppressed repetitions of the last message (if
+        any), after which the message is logged again.
+        """
+        with self._lock:
+            summary = self._pop_summary()
+            self._last = None
+            return summary
+
+    def _pop_summary(self) -> Optional[Tuple[LogLevelValue, int]]:
+        if not self._repeated:
+            return None
+        summary = (self._last[0], self._repeated)
+        self._repeated = 0
+        return summary
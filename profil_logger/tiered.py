@@ -0,0 +1,315 @@
+"""
+Tiered storage: new entries are appended to a "hot" file (the cheap
+write path of FileHandler, CSVHandler or JsonLinesHandler), and closed
+hot files are moved into an indexed SQLite "cold" store.
+
+Hot files are numbered by generations, like in SegmentedHandler: entry ids
+are (generation << GENERATION_SHIFT) + the id in the hot file, and are
+kept as row ids in the cold store - each hot file is inserted in a single
+transaction, so the highest id in the cold store tells which generations
+are compacted. Reads take the entries of compacted generations from
+the cold store and of the others from hot files, so entries at
+the boundary of the tiers are read exactly once, also while they're being
+compacted.
+"""
+import contextlib
+import datetime
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Callable, Collection, Dict, Iterator, List, Optional
+from profil_logger.handlers import FileHandler, Handler, SQLiteHandler
+from profil_logger.log_entry import LogCursor, LogEntry, LogLevelValue
+from profil_logger.segments import GENERATION_SHIFT
+
+_LOCAL_ID_MASK = (1 << GENERATION_SHIFT) - 1
+
+_HOT_FILE_PATTERN = re.compile(r"^hot-(\d+)\.log$")
+COLD_STORE_NAME = "cold.sqlite"
+
+# attempts of counting entries without a compaction finishing meanwhile
+_COUNT_ATTEMPTS = 3
+
+
+class TieredHandler(Handler):
+    """
+    Manages log entries in a directory of hot append files and an indexed
+    cold store (see the module docstring). compact() starts a new hot
+    file and moves the previous ones into the cold store - it's called
+    every compaction_interval seconds in a daemon thread, if given (call
+    close() to stop it).
+    """
+    def __init__(self,
+                 directory: str,
+                 hot_handler_factory: Callable[[str], Handler] = FileHandler,
+                 compaction_interval: Optional[float] = None):
+        self.directory = directory
+        self.hot_handler_factory = hot_handler_factory
+        self.compaction_interval = compaction_interval
+        self.cold_handler: Optional[SQLiteHandler] = None
+        self._lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self._hot_generation = 0
+        self._hot_handler: Optional[Handler] = None
+        self._stopped = threading.Event()
+        self._compaction_thread: Optional[threading.Thread] = None
+        super(TieredHandler, self).__init__()
+        if compaction_interval is not None:
+            self._compaction_thread = threading.Thread(
+                target=self._run_compactions, name="tiered-compaction",
+                daemon=True)
+            self._compaction_thread.start()
+
+    def _create_log_if_non_existent(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.cold_handler = SQLiteHandler(
+            os.path.join(self.directory, COLD_STORE_NAME),
+            keep_entry_ids=True)
+        last_compacted = self._get_last_compacted()
+        generations = list(self._list_hot_files())
+        # the newest hot file not compacted yet is still written to
+        hot_generations = [generation for generation in generations
+                           if generation > last_compacted]
+        self._open_hot_handler(
+            max(hot_generations) if hot_generations
+            else max(generations + [last_compacted]) + 1)
+
+    def _open_hot_handler(self, generation: int):
+        self._hot_generation = generation
+        self._hot_handler = self.hot_handler_factory(
+            self._get_hot_path(generation))
+
+    def _get_hot_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"hot-{generation:06d}.log")
+
+    def _list_hot_files(self) -> Dict[int, str]:
+        hot_files = {}
+        for file_name in os.listdir(self.directory):
+            match = _HOT_FILE_PATTERN.match(file_name)
+            if match:
+                hot_files[int(match.group(1))] = os.path.join(
+                    self.directory, file_name)
+        return hot_files
+
+    def _get_last_compacted(self) -> int:
+        """
+        The last generation moved into the cold store.
+        """
+        try:
+            with contextlib.closing(sqlite3.connect(
+                    self.cold_handler.db_path)) as connection:
+                (max_id,) = connection.execute(
+                    f"SELECT max(id) FROM {self.cold_handler.table_name}"
+                ).fetchone()
+        except sqlite3.Error as error:
+            self.metrics.count_error(error)
+            return 0
+        return 0 if max_id is None else max_id >> GENERATION_SHIFT
+
+    def persist_log(self, entry: LogEntry):
+        with self._lock:
+            self._hot_handler.persist_log(entry)
+
+    def persist_logs(self, entries: List[LogEntry]):
+        with self._lock:
+            self._hot_handler.persist_logs(entries)
+
+    def compact(self) -> int:
+        """
+        Start a new hot file and move the entries of the previous ones
+        into the cold store. Returns the number of moved entries.
+        """
+        with self._compaction_lock:
+            with self._lock:
+                compacted_generation = self._hot_generation
+                self._open_hot_handler(compacted_generation + 1)
+            last_compacted = self._get_last_compacted()
+            compacted = 0
+            for generation, file_path in sorted(
+                    self._list_hot_files().items()):
+                if generation > compacted_generation:
+                    continue
+                # files left by an interrupted compaction are only removed
+                if generation > last_compacted:
+                    compacted += self._compact_hot_file(generation,
+                                                        file_path)
+                os.remove(file_path)
+            return compacted
+
+    def _compact_hot_file(self, generation: int, file_path: str) -> int:
+        # a single transaction, so that the generation is compacted whole
+        entries = list(self._renumber(
+            self.hot_handler_factory(file_path).iter_logs(), generation))
+        if entries:
+            self.cold_handler.persist_logs(entries)
+        return len(entries)
+
+    def _run_compactions(self):
+        while not self._stopped.wait(self.compaction_interval):
+            try:
+                self.compact()
+            except (OSError, sqlite3.Error) as error:
+                self.metrics.count_error(error)
+
+    def close(self):
+        """
+        Stop compacting in the background.
+        """
+        if self._compaction_thread is not None:
+            self._stopped.set()
+            self._compaction_thread.join()
+            self._compaction_thread = None
+
+    @staticmethod
+    def _renumber(entries: Iterator[LogEntry],
+                  generation: int) -> Iterator[LogEntry]:
+        id_base = generation << GENERATION_SHIFT
+        for entry in entries:
+            yield LogEntry(entry.date, entry.level, entry.message,
+                           id_base + entry.entry_id)
+
+    def _get_hot_handler(self, file_path: str) -> Optional[Handler]:
+        if not os.path.exists(file_path):
+            # compacted in the meantime
+            return None
+        with self._lock:
+            if file_path == self._get_hot_path(self._hot_generation):
+                return self._hot_handler
+        return self.hot_handler_factory(file_path)
+
+    def retrieve_all_logs(self) -> List[LogEntry]:
+        return list(self.iter_logs())
+
+    def iter_logs(
+            self,
+            newest_first: bool = False,
+            after: Optional[LogCursor] = None,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None,
+            contains: Optional[str] = None,
+            levels: Optional[Collection[LogLevelValue]] = None) \
+            -> Iterator[LogEntry]:
+        last_compacted = self._get_last_compacted()
+        hot_files = {generation: file_path for generation, file_path
+                     in self._list_hot_files().items()
+                     if generation > last_compacted}
+        cursor_generation = after.entry_id >> GENERATION_SHIFT \
+            if after else None
+        # the cold store holds the oldest entries
+        sources = [None, *sorted(hot_files)]
+        if newest_first:
+            sources.reverse()
+        cursor_in_cold = cursor_generation is not None \
+            and cursor_generation <= last_compacted
+        for generation in sources:
+            if generation is None:
+                # read unless the cursor is in a later (hot) generation
+                if after is None or cursor_in_cold or newest_first:
+                    yield from self._iter_cold(
+                        newest_first, after if cursor_in_cold else None,
+                        start_date, end_date, contains, levels,
+                        last_compacted)
+                continue
+            if cursor_generation is not None and (
+                    generation > cursor_generation if newest_first
+                    else generation < cursor_generation):
+                continue
+            source_after = None
+            if generation == cursor_generation:
+                source_after = LogCursor(after.date,
+                                         after.entry_id & _LOCAL_ID_MASK)
+            yield from self._iter_hot(
+                generation, hot_files[generation], newest_first,
+                source_after, start_date, end_date, contains, levels)
+
+    def _iter_cold(self,
+                   newest_first: bool,
+                   after: Optional[LogCursor],
+                   start_date: Optional[datetime.datetime],
+                   end_date: Optional[datetime.datetime],
+                   contains: Optional[str],
+                   levels: Optional[Collection[LogLevelValue]],
+                   last_compacted: int) -> Iterator[LogEntry]:
+        entries = self.cold_handler.iter_logs(
+            newest_first=newest_first, after=after, start_date=start_date,
+            end_date=end_date, contains=contains, levels=levels)
+        for entry in entries:
+            # generations compacted during the read are read from hot files
+            if entry.entry_id >> GENERATION_SHIFT <= last_compacted:
+                yield entry
+
+    def _iter_hot(self,
+                  generation: int,
+                  file_path: str,
+                  newest_first: bool,
+                  after: Optional[LogCursor],
+                  start_date: Optional[datetime.datetime],
+                  end_date: Optional[datetime.datetime],
+                  contains: Optional[str],
+                  levels: Optional[Collection[LogLevelValue]]) \
+            -> Iterator[LogEntry]:
+        hot_handler = self._get_hot_handler(file_path)
+        if hot_handler is not None:
+            yield from self._renumber(hot_handler.iter_logs(
+                newest_first=newest_first, after=after,
+                start_date=start_date, end_date=end_date, contains=contains,
+                levels=levels), generation)
+            return
+        # the file was compacted after the read started - its entries
+        # are taken from the cold store, in the order of the hot file
+        entries = [entry for entry in self.cold_handler.iter_logs(
+            start_date=start_date, end_date=end_date, contains=contains,
+            levels=levels)
+            if entry.entry_id >> GENERATION_SHIFT == generation
+            and (after is None or (
+                entry.entry_id & _LOCAL_ID_MASK < after.entry_id
+                if newest_first
+                else entry.entry_id & _LOCAL_ID_MASK > after.entry_id))]
+        yield from sorted(entries, key=lambda entry: entry.entry_id,
+                          reverse=newest_first)
+
+    def count_logs(
+            self,
+            group_by: str,
+            start_date: Optional[datetime.datetime] = None,
+            end_date: Optional[datetime.datetime] = None) -> Optional[Dict]:
+        for _ in range(_COUNT_ATTEMPTS):
+            last_compacted = self._get_last_compacted()
+            cold_counts = self.cold_handler.count_logs(group_by, start_date,
+                                                       end_date)
+            if cold_counts is None:
+                return None
+            counts = Counter(cold_counts)
+            for generation, file_path in self._list_hot_files().items():
+                if generation <= last_compacted:
+                    continue
+                hot_handler = self._get_hot_handler(file_path)
+                if hot_handler is not None:
+                    counts.update(self._count_hot(hot_handler, group_by,
+                                                  start_date, end_date))
+            # a compaction finishing meanwhile could have moved counted
+            # entries between the tiers
+            if self._get_last_compacted() == last_compacted:
+                break
+        if group_by == "level":
+            return {level: counts[level] for level in LogLevelValue
+                    if counts[level]}
+        return dict(sorted(counts.items()))
+
+    @staticmethod
+    def _count_hot(hot_handler: Handler,
+                   group_by: str,
+                   start_date: Optional[datetime.datetime],
+                   end_date: Optional[datetime.datetime]) -> Dict:
+        hot_counts = hot_handler.count_logs(group_by, start_date, end_date)
+        if hot_counts is not None:
+            return hot_counts
+        return Counter(
+            entry.level if group_by == "level"
+            else entry.date.strftime("%Y-%m")
+            for entry in hot_handler.iter_logs(start_date=start_date,
+                                               end_date=end_date)
+            if (start_date is None or entry.date >= start_date)
+            and (end_date is None or entry.date <= end_date))
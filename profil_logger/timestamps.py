@@ -0,0 +1,49 @@
+"""
+Timestamp codec shared by the logger, log entries and handlers.
+
+Timestamps are stored as ISO 8601 strings in the text formats and SQLite,
+and as integer microseconds since the Unix epoch in the binary formats.
+Log entry dates are naive (local time) datetime objects, so the epoch
+representation is computed without any timezone conversion - aware
+datetimes are converted to UTC first (and read back as naive UTC dates).
+
+Note: the C implementations of datetime.fromisoformat()/isoformat() turned
+out to be faster than caching the date (or the formatted second) in Python
+(see benchmarks/timestamps.py), so the codec delegates to them and avoids
+repeated work instead - LogEntry formats its date only once.
+"""
+import datetime
+from typing import Iterable, List
+
+EPOCH = datetime.datetime(1970, 1, 1)
+_ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+parse_timestamp = datetime.datetime.fromisoformat
+
+
+def parse_timestamps(timestamps: Iterable[str]) -> List[datetime.datetime]:
+    """
+    Parse many ISO 8601 timestamps at once.
+    """
+    return list(map(parse_timestamp, timestamps))
+
+
+def format_timestamp(date: datetime.datetime) -> str:
+    return date.isoformat()
+
+
+def to_epoch_us(date: datetime.datetime) -> int:
+    """
+    Convert a datetime into microseconds since the epoch (aware datetimes
+    are converted to UTC).
+    """
+    if date.tzinfo is not None:
+        date = date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (date - EPOCH) // _ONE_MICROSECOND
+
+
+def from_epoch_us(epoch_us: int) -> datetime.datetime:
+    """
+    Convert microseconds since the epoch into a naive datetime.
+    """
+    return EPOCH + datetime.timedelta(microseconds=epoch_us)
@@ -1,5 +1,9 @@
 import datetime
-from profil_logger import LogEntry
+import itertools
+import time
+from typing import Iterator
+from profil_logger import LogEntry, LogLevelValue
+from profil_logger.handlers import Handler
 import random as rnd
 
 
@@ -61,3 +65,69 @@ def log_entry():
     log_entry = LogEntry.from_dict(log_entry_d)
 
     return log_entry_d, log_entry
+
+
+# templates and level weights of generated production-like logs
+MESSAGE_TEMPLATES = ["request {} handled in {} ms",
+                     "user {} logged in",
+                     "cache miss for key session:{}",
+                     "connection to db-{} timed out after {} ms, retrying",
+                     "disk usage at {}%"]
+LEVEL_WEIGHTS = {LogLevelValue.DEBUG: 25,
+                 LogLevelValue.INFO: 60,
+                 LogLevelValue.WARNING: 10,
+                 LogLevelValue.ERROR: 4,
+                 LogLevelValue.CRITICAL: 1}
+
+
+def generate_log_entries(
+        number_of_entries: int,
+        seed: int = 0,
+        start: datetime.datetime = datetime.datetime(2025, 1, 1)) \
+        -> Iterator[LogEntry]:
+    """
+    Lazily generate a deterministic (for the seed) log: dates increase by
+    a second on average, levels are mostly DEBUG and INFO, and messages
+    are made of a few templates with varying numbers.
+    """
+    random = rnd.Random(seed)
+    levels = list(LEVEL_WEIGHTS)
+    cumulative_weights = list(itertools.accumulate(LEVEL_WEIGHTS.values()))
+    date = start
+    for _ in range(number_of_entries):
+        date += datetime.timedelta(microseconds=random.randrange(2_000_000))
+        level = random.choices(levels, cum_weights=cumulative_weights)[0]
+        message = random.choice(MESSAGE_TEMPLATES).format(
+            random.randrange(10_000), random.randrange(1_000))
+        yield LogEntry(date=date, level=level, msg=message)
+
+
+class RecordingHandler(Handler):
+    """
+    Keeps persisted entries in memory; writes can be made slow or failing.
+    """
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.entries = []
+        self.batches = 0
+        super(RecordingHandler, self).__init__()
+
+    def persist_log(self, entry: LogEntry):
+        self.persist_logs([entry])
+
+    def persist_logs(self, entries):
+        time.sleep(self.delay)
+        if self.fail:
+            raise OSError
+        self.batches += 1
+        self.entries.extend(entries)
+
+    def retrieve_all_logs(self):
+        return list(self.entries)
+
+
+def make_entry(message: str = "message") -> LogEntry:
+    return LogEntry(date=datetime.datetime.now(),
+                    level=LogLevelValue.INFO,
+                    msg=message)
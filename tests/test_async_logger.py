@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import time
+from unittest import IsolatedAsyncioTestCase
+from profil_logger import AsyncHandler, AsyncProfilLogger, LogLevelValue
+from tests.fake_data import RecordingHandler, make_entry
+
+
+class AsyncLogging(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.handler = RecordingHandler()
+        self.profil_logger = AsyncProfilLogger([self.handler])
+
+    async def asyncTearDown(self):
+        await self.profil_logger.aclose()
+
+    async def test_awaiting_entry(self):
+        """
+        Awaiting a logging call should wait until the entry is written.
+        """
+        await self.profil_logger.warning("user %s", "uid")
+
+        self.assertEqual(["user uid"],
+                         [entry.message for entry in self.handler.entries])
+
+    async def test_fire_and_forget(self):
+        for i in range(10):
+            self.profil_logger.info("message %d", i)
+        await self.profil_logger.drain()
+
+        self.assertEqual(10, len(self.handler.entries))
+
+    async def test_disabled_level(self):
+        """
+        Calls of disabled levels should return an awaitable as well.
+        """
+        self.profil_logger.set_log_level(LogLevelValue.ERROR)
+        await self.profil_logger.debug("debug message")
+
+        self.assertFalse(self.handler.entries)
+
+    async def test_multiple_handlers(self):
+        other_handler = RecordingHandler()
+        self.profil_logger.add_handler(other_handler)
+        await self.profil_logger.error("error message")
+
+        self.assertEqual(1, len(self.handler.entries))
+        self.assertEqual(1, len(other_handler.entries))
+
+
+class AsyncHandlerBatching(IsolatedAsyncioTestCase):
+    async def test_not_blocking_loop(self):
+        """
+        Writes should run outside of the event loop thread, in batches.
+        """
+        handler = RecordingHandler(delay=0.2)
+        writing_threads = set()
+        persist_logs = handler.persist_logs
+
+        def recording_persist_logs(entries):
+            writing_threads.add(threading.get_ident())
+            persist_logs(entries)
+
+        handler.persist_logs = recording_persist_logs
+        async_handler = AsyncHandler(handler)
+        started = time.monotonic()
+        futures = [async_handler.submit(make_entry()) for _ in range(5)]
+
+        self.assertLess(time.monotonic() - started, 0.1)
+        await asyncio.gather(*futures)
+        await async_handler.aclose()
+
+        self.assertNotIn(threading.get_ident(), writing_threads)
+        self.assertEqual(5, async_handler.stats()["written"])
+        self.assertEqual(1, handler.batches)
+
+    async def test_failing_handler(self):
+        async_handler = AsyncHandler(RecordingHandler(fail=True))
+        await async_handler.persist_log(make_entry())
+        await async_handler.aclose()
+
+        self.assertEqual(1, async_handler.stats()["failed"])
@@ -0,0 +1,99 @@
+import os
+import tempfile
+from unittest import TestCase
+from benchmarks.load import LoadPlan, generate_messages, \
+    get_handler_spec, parse_level_weights, run_load, run_replay
+from benchmarks.suite import HANDLERS, QUERIES, compare_results, \
+    parse_size, run_handler
+from profil_logger import CSVHandler, LogLevelValue
+from tests.fake_data import generate_log_entries
+
+
+class GeneratedLogs(TestCase):
+    def test_deterministic_entries(self):
+        entries = [entry.to_dict() for entry in generate_log_entries(50)]
+
+        self.assertListEqual(
+            entries, [entry.to_dict() for entry in generate_log_entries(50)])
+        self.assertNotEqual(
+            entries, [entry.to_dict()
+                      for entry in generate_log_entries(50, seed=1)])
+        self.assertListEqual(sorted(entries, key=lambda entry: entry["date"]),
+                             entries)
+
+
+class BenchmarkSuite(TestCase):
+    def test_running_benchmarks(self):
+        spec = next(spec for spec in HANDLERS
+                    if spec.name == "SegmentedHandler")
+        with tempfile.TemporaryDirectory() as directory:
+            results = list(run_handler(spec, directory, 100,
+                                       batch_size=30, latency_samples=10))
+
+        self.assertListEqual(
+            ["write", "persist_log", "compact",
+             *(f"query:{name}" for name in QUERIES)],
+            [result["benchmark"] for result in results])
+        self.assertEqual(10, results[1]["samples"])
+        self.assertTrue(all(result["entries"] == 100
+                            and result["seconds"] >= 0
+                            for result in results))
+
+    def test_comparing_results(self):
+        result = {"benchmark": "write", "handler": "FileHandler",
+                  "entries": 1000, "seconds": 3.0}
+        comparisons = list(compare_results(
+            [result, {**result, "entries": 10}],
+            [{**result, "seconds": 2.0}]))
+
+        self.assertEqual(1, len(comparisons))
+        self.assertEqual(1.5, comparisons[0]["ratio"])
+
+    def test_parsing_sizes(self):
+        self.assertListEqual([10_000, 1_000_000, 500],
+                             [parse_size(size)
+                              for size in ["10k", "1M", "500"]])
+
+
+class LoadGenerator(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_generated_messages(self):
+        plan = LoadPlan(entries=100, message_size=50,
+                        size_distribution="fixed",
+                        level_weights=parse_level_weights("info=1,Error=1"))
+        messages = list(generate_messages(plan, producer=3))
+
+        self.assertEqual("load 3-0 ", messages[0][1][:9])
+        self.assertTrue(all(len(message) == 50 for _, message in messages))
+        self.assertSetEqual({LogLevelValue.INFO, LogLevelValue.ERROR},
+                            {level for level, _ in messages})
+
+    def test_producers(self):
+        plan = LoadPlan(entries=50)
+        for mode in ["threads", "processes", "asyncio"]:
+            with self.subTest(mode=mode):
+                directory = os.path.join(self.directory.name, mode)
+                os.makedirs(directory)
+                result = run_load(get_handler_spec("FileHandler"),
+                                  directory, mode, 3, plan)
+
+                self.assertEqual(150, result["logged"])
+                self.assertEqual(0, result["lost_entries"])
+                self.assertGreater(result["storage_bytes"], 0)
+                self.assertLessEqual(result["p50_us"], result["p99_us"])
+
+    def test_replaying_log(self):
+        source = CSVHandler(os.path.join(self.directory.name, "source.csv"))
+        source.persist_logs(list(generate_log_entries(20)))
+        target_directory = os.path.join(self.directory.name, "target")
+        os.makedirs(target_directory)
+        result = run_replay(get_handler_spec("SQLiteHandler"),
+                            target_directory, source, speed=0)
+
+        self.assertEqual(20, result["logged"])
+        self.assertEqual(0, result["lost_entries"])
@@ -0,0 +1,171 @@
+import datetime
+import os
+import tempfile
+from unittest import TestCase
+from profil_logger import BinaryHandler, LogCursor, LogEntry, LogLevelValue
+from profil_logger.binary_handler import FILE_MAGIC
+
+
+class BinaryLog(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, "log.bin")
+        self.binary_handler = BinaryHandler(self.file_path)
+        self.binary_handler.block_size = 4
+        self.entries = [
+            LogEntry(date=datetime.datetime(2020, 1, 1, 10, i, 0, i),
+                     level=list(LogLevelValue)[i % 5],
+                     msg=f"message {i} zażółć")
+            for i in range(10)]
+        self.messages = [entry.message for entry in self.entries]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_creating_log(self):
+        with open(self.file_path, "rb") as fh:
+            self.assertEqual(FILE_MAGIC, fh.read())
+        self.assertListEqual([], self.binary_handler.retrieve_all_logs())
+
+    def test_persisting_logs(self):
+        """
+        Entries written one by one and in batches should be read back
+        unchanged.
+        """
+        self.binary_handler.persist_log(self.entries[0])
+        self.binary_handler.persist_logs(self.entries[1:])
+        log_entries = self.binary_handler.retrieve_all_logs()
+
+        self.assertListEqual([entry.to_dict() for entry in self.entries],
+                             [entry.to_dict() for entry in log_entries])
+
+    def test_reading_appended_entries(self):
+        """
+        The block index should be extended when the file grows.
+        """
+        self.binary_handler.persist_logs(self.entries[:5])
+        list(self.binary_handler.iter_logs())
+        self.binary_handler.persist_logs(self.entries[5:])
+        received_messages = [entry.message for entry
+                             in self.binary_handler.iter_logs()]
+
+        self.assertListEqual(self.messages, received_messages)
+
+    def test_newest_first(self):
+        self.binary_handler.persist_logs(self.entries)
+        received_messages = [
+            entry.message for entry
+            in self.binary_handler.iter_logs(newest_first=True)]
+
+        self.assertListEqual(self.messages[::-1], received_messages)
+
+    def test_cursor(self):
+        """
+        It should continue reading after the cursor, in both directions.
+        """
+        self.binary_handler.persist_logs(self.entries)
+        entries = list(self.binary_handler.iter_logs())
+        cursor = LogCursor.from_entry(entries[4])
+        forward = [entry.message for entry
+                   in self.binary_handler.iter_logs(after=cursor)]
+        backward = [entry.message for entry in self.binary_handler.iter_logs(
+            newest_first=True, after=cursor)]
+
+        self.assertListEqual(self.messages[5:], forward)
+        self.assertListEqual(self.messages[3::-1], backward)
+
+    def test_hints(self):
+        self.binary_handler.persist_logs(self.entries)
+        by_date = self.binary_handler.iter_logs(
+            start_date=self.entries[3].date, end_date=self.entries[6].date)
+        by_text = self.binary_handler.iter_logs(contains="message 7 ")
+
+        self.assertListEqual(self.messages[3:7],
+                             [entry.message for entry in by_date])
+        self.assertListEqual(["message 7 zażółć"],
+                             [entry.message for entry in by_text])
+
+    def test_aware_dates(self):
+        """
+        Dates with a timezone should be stored in UTC.
+        """
+        self.binary_handler.persist_log(LogEntry(
+            date=datetime.datetime(2020, 1, 1, 12,
+                                   tzinfo=datetime.timezone(
+                                       datetime.timedelta(hours=2))),
+            level=LogLevelValue.INFO, msg="message"))
+        entries = list(self.binary_handler.iter_logs(
+            start_date=datetime.datetime(2020, 1, 1, 10,
+                                         tzinfo=datetime.timezone.utc)))
+
+        self.assertListEqual([datetime.datetime(2020, 1, 1, 10)],
+                             [entry.date for entry in entries])
+
+    def test_incomplete_block(self):
+        """
+        A block being written (or cut off) should be skipped.
+        """
+        self.binary_handler.persist_logs(self.entries[:4])
+        self.binary_handler.persist_logs(self.entries[4:8])
+        with open(self.file_path, "r+b") as fh:
+            fh.truncate(os.path.getsize(self.file_path) - 3)
+        received_messages = [entry.message for entry
+                             in self.binary_handler.iter_logs()]
+
+        self.assertListEqual(self.messages[:4], received_messages)
+
+    def test_not_a_binary_log(self):
+        with open(self.file_path, "w") as fh:
+            fh.write("2020-01-01T10:00:00 INFO message\n")
+
+        self.assertListEqual([], self.binary_handler.retrieve_all_logs())
+
+
+class DictionaryEncoding(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, "log.bin")
+        self.binary_handler = BinaryHandler(self.file_path,
+                                            dictionary_encoded=True)
+        self.binary_handler.block_size = 4
+        self.entries = [
+            LogEntry(date=datetime.datetime(2020, 1, 1, 10, i),
+                     level=list(LogLevelValue)[i % 5],
+                     msg=f"repeated message {i % 2} zażółć")
+            for i in range(10)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_persisting_logs(self):
+        self.binary_handler.persist_log(self.entries[0])
+        self.binary_handler.persist_logs(self.entries[1:])
+        log_entries = self.binary_handler.retrieve_all_logs()
+
+        self.assertListEqual([entry.to_dict() for entry in self.entries],
+                             [entry.to_dict() for entry in log_entries])
+
+    def test_smaller_file(self):
+        plain_file_path = os.path.join(self.directory.name, "plain.bin")
+        BinaryHandler(plain_file_path).persist_logs(self.entries)
+        self.binary_handler.persist_logs(self.entries)
+
+        self.assertLess(os.path.getsize(self.file_path),
+                        os.path.getsize(plain_file_path))
+
+    def test_filtering_referring_records(self):
+        self.binary_handler.persist_logs(self.entries)
+        received_entries = list(self.binary_handler.iter_logs(
+            newest_first=True, contains="message 1",
+            levels=[LogLevelValue.DEBUG, LogLevelValue.INFO]))
+
+        self.assertListEqual([self.entries[5].to_dict(),
+                              self.entries[1].to_dict()],
+                             [entry.to_dict() for entry in received_entries])
+
+    def test_read_messages_shared(self):
+        self.binary_handler.persist_logs(self.entries)
+        received_entries = list(self.binary_handler.iter_logs())
+
+        self.assertIs(received_entries[0].message,
+                      received_entries[8].message)
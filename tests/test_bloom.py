@@ -0,0 +1,183 @@
+import datetime
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from profil_logger import CSVHandler, FileHandler, JsonLinesHandler, \
+    LogEntry, LogLevelValue, ProfilLoggerReader
+from profil_logger.bloom import BloomFilter, get_searched_tokens, \
+    get_tokens
+
+
+class Tokens(TestCase):
+    def test_tokens_of_data(self):
+        """
+        Words and their 4-grams should be taken.
+        """
+        self.assertSetEqual({b"abcd", b"bcde", b"\x00abcde", b"\x00xy",
+                             b"\x00a"},
+                            get_tokens(b"abcde xy-a"))
+
+    def test_searched_tokens(self):
+        """
+        Only words delimited within the searched text should be whole
+        words in the data.
+        """
+        self.assertSetEqual({b"eque", b"ques", b"uest", b"id_1", b"\x00id_1",
+                             b"hand", b"andl"},
+                            get_searched_tokens(b"equest id_1 handl"))
+
+    def test_bloom_filter(self):
+        bloom_filter = BloomFilter(64)
+        bloom_filter.add_all(get_tokens(b"request 7f3a9c handled"))
+        restored_filter = BloomFilter(64, bloom_filter.to_bytes())
+
+        self.assertTrue(restored_filter.might_contain_all(
+            get_searched_tokens(b"st 7f3a9c ha")))
+        self.assertFalse(restored_filter.might_contain_all(
+            get_searched_tokens(b"d41d8cd98f00b204e980")))
+
+
+class SkippingChunks(TestCase):
+    """
+    Searching logs with Bloom filters of small chunks.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.messages = [f"request {i * 7919:08x} handled" for i in range(200)]
+        self.messages[150] = 'request "quoted", \\ text'
+        self.entries = [LogEntry(date=datetime.datetime(2020, 1, 1, 0, 0, i),
+                                 level=LogLevelValue.INFO,
+                                 msg=message)
+                        for i, message in enumerate(self.messages[:60])] + [
+            LogEntry(date=datetime.datetime(2020, 1, 1, 0, 1, i % 60),
+                     level=LogLevelValue.INFO,
+                     msg=message)
+            for i, message in enumerate(self.messages[60:])]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_handler(self, handler_class, file_name):
+        with patch.object(handler_class, "bloom_filter_size", 128):
+            handler = handler_class(
+                os.path.join(self.directory.name, file_name),
+                bloom_filters=True)
+        handler.bloom_chunk_size = 512
+        return handler
+
+    def test_no_false_negatives(self):
+        for handler_class, file_name in [(FileHandler, "log.txt"),
+                                         (CSVHandler, "log.csv"),
+                                         (JsonLinesHandler, "log.jsonl")]:
+            with self.subTest(handler_class.__name__):
+                handler = self.create_handler(handler_class, file_name)
+                for start in range(0, len(self.entries), 10):
+                    handler.persist_logs(self.entries[start:start + 10])
+                reader = ProfilLoggerReader(handler)
+
+                for searched_text in [self.messages[3][8:],
+                                      self.messages[120][5:12],
+                                      self.messages[199],
+                                      '"quoted", \\ te',
+                                      "d00000"]:
+                    expected = [message for message in self.messages
+                                if searched_text in message]
+                    found = [entry.message for entry
+                             in reader.find_by_text(searched_text)]
+                    newest_first = [entry.message for entry in
+                                    reader.find_by_text(searched_text,
+                                                        newest_first=True)]
+                    self.assertListEqual(expected, found)
+                    self.assertListEqual(expected[::-1], newest_first)
+                self.assertGreater(
+                    os.path.getsize(f"{handler.filepath}.bloom"), 128 * 5)
+
+    def test_scanning_matching_chunks(self):
+        handler = self.create_handler(FileHandler, "log.txt")
+        handler.persist_logs(self.entries)
+        file_size = os.path.getsize(handler.filepath)
+        with open(handler.filepath, "rb") as fh:
+            ranges = handler._get_scan_ranges(self.messages[42][8:],
+                                              file_size, fh)
+            scanned_size = sum(end - start for start, end in ranges)
+
+            self.assertLess(scanned_size, file_size / 4)
+            self.assertEqual([(0, file_size)], handler._get_scan_ranges(
+                "abc", file_size, fh))
+
+    def test_replaced_log(self):
+        """
+        Filters of a replaced log file should be discarded.
+        """
+        handler = self.create_handler(FileHandler, "log.txt")
+        handler.persist_logs(self.entries)
+        os.remove(handler.filepath)
+        new_handler = self.create_handler(FileHandler, "log.txt")
+        new_handler.persist_logs(self.entries[::-1])
+        reader = ProfilLoggerReader(new_handler)
+
+        self.assertListEqual(
+            [self.messages[42]],
+            [entry.message for entry
+             in reader.find_by_text(self.messages[42][8:])])
+
+    def test_recreated_log(self):
+        """
+        Filters shouldn't be used for a log deleted and created again -
+        with the same first bytes (a CSV header), and likely the same
+        inode.
+        """
+        handler = self.create_handler(CSVHandler, "log.csv")
+        handler.persist_logs([LogEntry(date=entry.date,
+                                       level=LogLevelValue.INFO,
+                                       msg=f"message {i}")
+                              for i, entry in enumerate(self.entries)])
+        handler.update_bloom_filters()
+        error_entries = [LogEntry(date=entry.date, level=LogLevelValue.ERROR,
+                                  msg=f"xyzzyplugh {i}")
+                         for i, entry in enumerate(self.entries)]
+        os.remove(handler.filepath)
+        # by a handler without filters, which leaves the sidecar file
+        CSVHandler(handler.filepath).persist_logs(error_entries)
+        found_entries = ProfilLoggerReader(handler).find_by_text(
+            "xyzzyplugh")
+        handler.update_bloom_filters()
+        os.remove(handler.filepath)
+        new_handler = self.create_handler(CSVHandler, "log.csv")
+        new_handler.persist_logs(error_entries[:100])
+
+        self.assertEqual(200, len(found_entries))
+        self.assertEqual(100, len(ProfilLoggerReader(
+            new_handler).find_by_text("xyzzyplugh")))
+
+    def test_recreated_sidecar_file(self):
+        """
+        Filters loaded of a deleted log shouldn't be extended with
+        the sidecar file of a new log - likely of the same inode.
+        """
+        handler = self.create_handler(CSVHandler, "log.csv")
+        handler.persist_logs(self.entries)
+        list(ProfilLoggerReader(handler).find_by_text("handled"))
+        os.remove(handler.filepath)
+        new_handler = self.create_handler(CSVHandler, "log.csv")
+        # longer messages - more filters than loaded of the deleted log
+        new_handler.persist_logs([
+            LogEntry(date=entry.date, level=LogLevelValue.ERROR,
+                     msg=f"{entry.message} xyzzyplugh")
+            for entry in self.entries])
+
+        self.assertEqual(200, len(ProfilLoggerReader(handler).find_by_text(
+            "xyzzyplugh")))
+
+    def test_updating_existing_log(self):
+        handler = FileHandler(os.path.join(self.directory.name, "log.txt"))
+        handler.persist_logs(self.entries)
+        bloom_handler = self.create_handler(FileHandler, "log.txt")
+        bloom_handler.update_bloom_filters()
+
+        self.assertTrue(os.path.exists(f"{handler.filepath}.bloom"))
+        self.assertListEqual(
+            [self.messages[42]],
+            [entry.message for entry in ProfilLoggerReader(
+                bloom_handler).find_by_text(self.messages[42][8:])])
@@ -0,0 +1,136 @@
+import datetime
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from profil_logger import CachedHandler, CSVHandler, FileHandler, \
+    JsonHandler, LogCursor, LogEntry, LogLevelValue, ProfilLoggerReader
+
+
+class CachedLog(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.directory.name, "log.txt")
+        self.entries = [
+            LogEntry(date=datetime.datetime(2024, 1 + i // 6, 1 + i, 12),
+                     level=list(LogLevelValue)[i % 3],
+                     msg=f"message {i}")
+            for i in range(12)]
+        self.dicts = [entry.to_dict() for entry in self.entries]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_dicts(self, entries):
+        return [entry.to_dict() for entry in entries]
+
+    def list_segments(self, handler):
+        return sorted(file_name for file_name
+                      in os.listdir(handler.cache_directory)
+                      if file_name.endswith(".seg"))
+
+    def test_reading_cached_entries(self):
+        for handler_class in [FileHandler, CSVHandler, JsonHandler]:
+            with self.subTest(handler_class=handler_class.__name__):
+                source = handler_class(os.path.join(
+                    self.directory.name, handler_class.__name__))
+                source.persist_logs(self.entries)
+                handler = CachedHandler(source)
+                entries = list(handler.iter_logs())
+                logger_reader = ProfilLoggerReader(handler)
+
+                self.assertListEqual(self.dicts, self.get_dicts(entries))
+                self.assertListEqual(
+                    [entry.entry_id for entry in source.iter_logs()],
+                    [entry.entry_id for entry in entries])
+                self.assertListEqual(
+                    self.dicts[:4][::-1], self.get_dicts(handler.iter_logs(
+                        newest_first=True,
+                        after=LogCursor.from_entry(entries[4]))))
+                self.assertListEqual(
+                    ["message 5", "message 9"],
+                    [entry.message for entry in logger_reader.find_by_regex(
+                        "[59]$", start_date=datetime.datetime(2024, 1, 5))])
+                self.assertDictEqual(
+                    {"2024-01": 6, "2024-02": 6},
+                    logger_reader.count_by_month())
+
+    def test_reusing_cache_in_new_handler(self):
+        FileHandler(self.log_path).persist_logs(self.entries)
+        list(CachedHandler(FileHandler(self.log_path)).iter_logs())
+        handler = CachedHandler(FileHandler(self.log_path))
+
+        with patch.object(FileHandler, "iter_logs") as iter_logs:
+            entries = list(handler.iter_logs())
+
+        iter_logs.assert_not_called()
+        self.assertListEqual(self.dicts, self.get_dicts(entries))
+
+    def test_extending_cache_with_appended_entries(self):
+        source = FileHandler(self.log_path)
+        handler = CachedHandler(source, max_segments=2)
+        source.persist_logs(self.entries[:4])
+        list(handler.iter_logs())
+        first_segments = self.list_segments(handler)
+        parsed_entries = []
+        original_iter_logs = FileHandler.iter_logs
+
+        def iter_logs(file_handler, *args, **kwargs):
+            for entry in original_iter_logs(file_handler, *args, **kwargs):
+                parsed_entries.append(entry)
+                yield entry
+
+        handler.persist_logs(self.entries[4:8])
+        with patch.object(FileHandler, "iter_logs", iter_logs):
+            entries = list(handler.iter_logs())
+
+        self.assertListEqual(self.dicts[:8], self.get_dicts(entries))
+        self.assertListEqual(self.dicts[4:8],
+                             self.get_dicts(parsed_entries))
+        self.assertEqual(2, len(self.list_segments(handler)))
+        self.assertTrue(set(first_segments) < set(
+            self.list_segments(handler)))
+        # the third segment is merged with the previous ones
+        handler.persist_logs(self.entries[8:])
+        self.assertListEqual(self.dicts,
+                             self.get_dicts(handler.iter_logs()))
+        self.assertEqual(1, len(self.list_segments(handler)))
+        self.assertDictEqual(
+            {LogLevelValue.DEBUG: 4, LogLevelValue.INFO: 4,
+             LogLevelValue.WARNING: 4}, handler.count_logs("level"))
+
+    def test_rebuilding_cache_of_rewritten_log(self):
+        source = FileHandler(self.log_path)
+        source.persist_logs(self.entries[:6])
+        handler = CachedHandler(source)
+        list(handler.iter_logs())
+        os.remove(self.log_path)
+        FileHandler(self.log_path).persist_logs(self.entries[6:])
+
+        self.assertListEqual(self.dicts[6:],
+                             self.get_dicts(handler.iter_logs()))
+        self.assertEqual(1, len(self.list_segments(handler)))
+        # the same size, but different bytes
+        with open(self.log_path, "r+b") as fh:
+            log = fh.read()
+            fh.seek(0)
+            fh.write(log.replace(b"message", b"massage"))
+        status = os.stat(self.log_path)
+        os.utime(self.log_path, ns=(status.st_atime_ns,
+                                    status.st_mtime_ns + 10 ** 9))
+        self.assertListEqual(
+            [f"massage {i}" for i in range(6, 12)],
+            [entry.message for entry in handler.iter_logs()])
+
+    def test_reading_source_without_cache(self):
+        source = FileHandler(self.log_path)
+        source.persist_logs(self.entries)
+        handler = CachedHandler(source)
+
+        with patch.object(handler, "_save_meta",
+                          side_effect=PermissionError("read-only")):
+            entries = list(handler.iter_logs())
+
+        self.assertListEqual(self.dicts, self.get_dicts(entries))
+        self.assertDictEqual({"PermissionError": 1},
+                             handler.stats()["errors"])
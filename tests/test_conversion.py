@@ -0,0 +1,120 @@
+import datetime
+import io
+import json
+import os
+import sqlite3
+import tempfile
+from unittest import TestCase
+from profil_logger import BinaryHandler, CSVHandler, FileHandler, \
+    JsonHandler, JsonLinesHandler, LogEntry, LogLevelValue, SQLiteHandler, \
+    copy_logs
+from profil_logger.handlers import _iter_json_array
+
+
+class CopyingLogs(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.entries = [
+            LogEntry(date=datetime.datetime(2021, 5, 1, 8, i, 30, 1000 * i),
+                     level=LogLevelValue.WARNING,
+                     msg=f"entry {i}")
+            for i in range(25)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_path(self, file_name: str) -> str:
+        return os.path.join(self.directory.name, file_name)
+
+    def test_converting_to_and_from_binary(self):
+        """
+        Logs of every format should survive being converted into
+        the binary format and back.
+        """
+        expected_entries = [entry.to_dict() for entry in self.entries]
+        for handler_class, file_name in [(FileHandler, "log.txt"),
+                                         (CSVHandler, "log.csv"),
+                                         (JsonHandler, "log.json"),
+                                         (SQLiteHandler, "log.sqlite")]:
+            with self.subTest(handler_class.__name__):
+                source = handler_class(self.get_path(file_name))
+                source.persist_logs(self.entries)
+                binary_handler = BinaryHandler(
+                    self.get_path(f"{file_name}.bin"))
+                target = handler_class(self.get_path(f"copy-{file_name}"))
+
+                copied_count = copy_logs(source, binary_handler, 10)
+                copy_logs(binary_handler, target, 10)
+
+                self.assertEqual(len(self.entries), copied_count)
+                self.assertListEqual(
+                    expected_entries,
+                    [entry.to_dict() for entry in target.retrieve_all_logs()])
+
+    def test_bulk_loading(self):
+        """
+        Bulk loads should append entries to existing logs, like
+        persist_logs(), and keep SQLite indexes.
+        """
+        expected_entries = [entry.to_dict() for entry in self.entries]
+        for handler_class, file_name in [(JsonHandler, "log.json"),
+                                         (SQLiteHandler, "log.sqlite"),
+                                         (CSVHandler, "log.csv")]:
+            with self.subTest(handler_class.__name__):
+                handler = handler_class(self.get_path(file_name))
+                handler.persist_logs(self.entries[:5])
+
+                loaded_count = handler.bulk_load(iter(self.entries[5:]), 7)
+
+                self.assertEqual(20, loaded_count)
+                self.assertListEqual(
+                    expected_entries,
+                    [entry.to_dict() for entry in handler.iter_logs()])
+        with sqlite3.connect(self.get_path("log.sqlite")) as connection:
+            self.assertListEqual(
+                [("log_timestamp_id",)],
+                connection.execute("SELECT name FROM sqlite_master "
+                                   "WHERE type = 'index'").fetchall())
+
+    def test_json_layout(self):
+        """
+        Bulk loaded json logs should be laid out like written at once.
+        """
+        loaded_handler = JsonHandler(self.get_path("loaded.json"))
+        written_handler = JsonHandler(self.get_path("written.json"))
+        loaded_handler.bulk_load(self.entries, 10)
+        written_handler.persist_logs(self.entries)
+
+        with open(self.get_path("loaded.json")) as loaded_fh, \
+                open(self.get_path("written.json")) as written_fh:
+            self.assertEqual(written_fh.read(), loaded_fh.read())
+
+    def test_reporting_progress(self):
+        source = SQLiteHandler(self.get_path("log.sqlite"))
+        source.persist_logs(self.entries * 100)
+        reports = []
+
+        copied_count = copy_logs(
+            source, JsonLinesHandler(self.get_path("log.jsonl")),
+            progress=lambda count, seconds: reports.append(count),
+            progress_interval=0)
+
+        self.assertEqual(2500, copied_count)
+        self.assertListEqual([1024, 2048], reports)
+
+
+class ParsingJsonArrays(TestCase):
+    def test_parsing_in_chunks(self):
+        items = [{"message": "[x], {y}" * i, "i": i} for i in range(20)]
+        text = json.dumps(items, indent=4)
+        for chunk_size in [1, 7, 1 << 16]:
+            with self.subTest(chunk_size=chunk_size):
+                self.assertListEqual(items, list(_iter_json_array(
+                    io.StringIO(text), chunk_size)))
+        self.assertListEqual([], list(_iter_json_array(io.StringIO(" [ ]"))))
+
+    def test_invalid_arrays(self):
+        for text in ["", "{}", "[{}", "[{} {}]", "[{},]"]:
+            with self.subTest(text=text):
+                with self.assertRaises(json.JSONDecodeError):
+                    list(_iter_json_array(io.StringIO(text), 2))
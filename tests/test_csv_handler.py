@@ -1,6 +1,9 @@
+import datetime
+import os
+import tempfile
 from unittest import TestCase
 from unittest.mock import MagicMock, mock_open, patch
-from profil_logger import CSVHandler
+from profil_logger import CSVHandler, LogCursor, LogEntry, LogLevelValue
 from tests.fake_data import fake_log_entry
 
 
@@ -138,3 +141,66 @@ class LogRetrieval(TestCase):
 
         self.assertFalse(log_entries)
 
+
+class IteratingLogs(TestCase):
+    """
+    Streaming entries from a csv file, also backwards.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, "log.csv")
+        self.csv_handler = CSVHandler(self.file_path)
+        self.csv_handler.read_block_size = 16
+        self.messages = ["plain message",
+                         'multi-line\n"quoted",\nmessage',
+                         "message, with a comma",
+                         "last message"]
+        for i, message in enumerate(self.messages):
+            self.csv_handler.persist_log(LogEntry(
+                date=datetime.datetime(2020, 1, 1, 10, i),
+                level=LogLevelValue.ERROR,
+                msg=message))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_forward(self):
+        """
+        It should skip the header and read multi-line records.
+        """
+        received_messages = [entry.message for entry
+                             in self.csv_handler.iter_logs()]
+
+        self.assertListEqual(self.messages, received_messages)
+
+    def test_newest_first(self):
+        received_messages = [entry.message for entry in
+                             self.csv_handler.iter_logs(newest_first=True)]
+
+        self.assertListEqual(self.messages[::-1], received_messages)
+
+    def test_cursor(self):
+        entries = list(self.csv_handler.iter_logs(newest_first=True))
+        cursor = LogCursor.from_entry(entries[1])
+        received_messages = [entry.message for entry in
+                             self.csv_handler.iter_logs(newest_first=True,
+                                                        after=cursor)]
+
+        self.assertListEqual(self.messages[1::-1], received_messages)
+
+    def test_crlf_in_message(self):
+        """
+        Line breaks inside a message should be read as written, in both
+        directions.
+        """
+        message = "first line\r\nsecond line"
+        self.csv_handler.persist_log(LogEntry(
+            date=datetime.datetime(2020, 1, 1, 11), level=LogLevelValue.INFO,
+            msg=message))
+
+        self.assertEqual(message,
+                         list(self.csv_handler.iter_logs())[-1].message)
+        self.assertEqual(message,
+                         self.csv_handler.retrieve_all_logs()[-1].message)
+        self.assertEqual(message, next(self.csv_handler.iter_logs(
+            newest_first=True)).message)
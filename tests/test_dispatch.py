@@ -0,0 +1,171 @@
+import gc
+import threading
+import time
+import weakref
+from unittest import TestCase
+from unittest.mock import MagicMock
+from profil_logger import ConcurrentDispatcher, ProfilLogger
+from profil_logger.dispatch import CircuitBreaker, HandlerWorker
+from tests.fake_data import RecordingHandler, make_entry
+
+
+class ConcurrentFanOut(TestCase):
+    def setUp(self):
+        self.dispatcher = ConcurrentDispatcher(timeout=0.05,
+                                               failure_threshold=2,
+                                               reset_timeout=60)
+
+    def tearDown(self):
+        self.dispatcher.close()
+
+    def test_writing_to_all_handlers(self):
+        handlers = [RecordingHandler(), RecordingHandler()]
+        profil_logger = ProfilLogger(handlers, dispatcher=self.dispatcher)
+        for i in range(100):
+            profil_logger.info("message %d", i)
+
+        self.assertTrue(profil_logger.flush(timeout=5))
+        for handler in handlers:
+            self.assertListEqual([f"message {i}" for i in range(100)],
+                                 [entry.message for entry in handler.entries])
+
+    def test_slow_handler_isolation(self):
+        """
+        A slow handler shouldn't delay the caller nor the other handlers.
+        """
+        slow_handler = RecordingHandler(delay=0.5)
+        fast_handler = RecordingHandler()
+        started = time.monotonic()
+        self.dispatcher.dispatch(make_entry(), [slow_handler, fast_handler])
+        self.dispatcher._workers[fast_handler].flush(timeout=5)
+
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(1, len(fast_handler.entries))
+        self.assertFalse(slow_handler.entries)
+
+    def test_circuit_breaker(self):
+        """
+        A persistently failing handler should be shed.
+        """
+        failing_handler = RecordingHandler(fail=True)
+        for _ in range(2):
+            self.dispatcher.dispatch(make_entry(), [failing_handler])
+            self.dispatcher.flush(timeout=5)
+        self.dispatcher.dispatch(make_entry(), [failing_handler])
+
+        stats = self.dispatcher.stats()[failing_handler]
+        self.assertEqual("open", stats["circuit"])
+        self.assertEqual(2, stats["failed"])
+        self.assertEqual(1, stats["shed"])
+
+    def test_single_trial_write(self):
+        """
+        Only a single entry should be written while the circuit is
+        half-open - the rest after the trial succeeded.
+        """
+        handler = RecordingHandler(fail=True)
+        worker = HandlerWorker(handler, circuit_breaker=CircuitBreaker(
+            failure_threshold=1, reset_timeout=0))
+        batch = [(time.monotonic(), make_entry(f"message {i}"))
+                 for i in range(3)]
+        worker._write(batch)
+        handler.fail = False
+        worker._write(batch)
+        worker.close()
+
+        self.assertEqual(2, handler.batches)
+        self.assertEqual(3, len(handler.entries))
+        self.assertEqual("closed", worker.stats()["circuit"])
+
+    def test_dispatching_after_close(self):
+        """
+        Entries dispatched after close() should be written in the calling
+        thread, without raising errors of handlers.
+        """
+        handler = RecordingHandler()
+        failing_handler = RecordingHandler(fail=True)
+        self.dispatcher.dispatch(make_entry("message 1"), [handler])
+        self.dispatcher.close()
+        self.dispatcher.dispatch(make_entry("message 2"),
+                                 [failing_handler, handler])
+
+        self.assertListEqual(["message 1", "message 2"],
+                             [entry.message for entry in handler.entries])
+        self.assertEqual(1, failing_handler.metrics.failed_writes)
+        self.assertFalse(self.dispatcher.stats())
+
+    def test_dispatching_while_closing(self):
+        """
+        An entry dispatched while close() writes the queued entries should
+        be written after them.
+        """
+        handler = RecordingHandler(delay=0.2)
+        self.dispatcher.dispatch(make_entry("message 1"), [handler])
+        closing = threading.Thread(target=self.dispatcher.close)
+        closing.start()
+        time.sleep(0.05)
+        self.dispatcher.dispatch(make_entry("message 2"), [handler])
+        closing.join()
+
+        self.assertListEqual(["message 1", "message 2"],
+                             [entry.message for entry in handler.entries])
+
+    def test_releasing_closed_dispatcher(self):
+        dispatcher = ConcurrentDispatcher()
+        dispatcher.close()
+        dispatcher_reference = weakref.ref(dispatcher)
+        del dispatcher
+        gc.collect()
+
+        self.assertIsNone(dispatcher_reference())
+
+    def test_batching_and_lag(self):
+        handler = RecordingHandler()
+        event = threading.Event()
+        handler.persist_logs = MagicMock(
+            side_effect=lambda entries: event.wait(5))
+        for _ in range(3):
+            self.dispatcher.dispatch(make_entry(), [handler])
+        event.set()
+        self.dispatcher.flush(timeout=5)
+
+        stats = self.dispatcher.stats()[handler]
+        self.assertEqual(3, stats["written"])
+        self.assertEqual(0, stats["queued"])
+        self.assertGreaterEqual(stats["lag_seconds"], 0)
+        self.assertLessEqual(handler.persist_logs.call_count, 2)
+
+
+class CircuitBreakerStates(TestCase):
+    def test_half_open(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=1,
+                                         reset_timeout=0)
+        circuit_breaker.record_failure()
+        self.assertEqual(CircuitBreaker.HALF_OPEN, circuit_breaker.state)
+
+        circuit_breaker.record_success()
+        self.assertEqual(CircuitBreaker.CLOSED, circuit_breaker.state)
+
+    def test_trial_write(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=1,
+                                         reset_timeout=0)
+        circuit_breaker.record_failure()
+
+        self.assertTrue(circuit_breaker.acquire_write())
+        # entries are accepted, but wait for the result of the trial
+        self.assertTrue(circuit_breaker.allows())
+        self.assertFalse(circuit_breaker.acquire_write())
+        circuit_breaker.record_failure()
+        self.assertTrue(circuit_breaker.acquire_write())
+        circuit_breaker.record_success()
+        self.assertTrue(circuit_breaker.acquire_write())
+        self.assertTrue(circuit_breaker.acquire_write())
+
+    def test_open(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=2,
+                                         reset_timeout=60)
+        circuit_breaker.record_failure()
+        self.assertTrue(circuit_breaker.allows())
+
+        circuit_breaker.record_failure()
+        self.assertFalse(circuit_breaker.allows())
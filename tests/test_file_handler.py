@@ -1,6 +1,9 @@
+import datetime
+import os
+import tempfile
 from unittest import TestCase
 from unittest.mock import mock_open, patch
-from profil_logger import FileHandler, LogEntry
+from profil_logger import FileHandler, LogCursor, LogEntry, LogLevelValue
 from tests.fake_data import log_entry
 
 
@@ -63,6 +66,21 @@ class PersistingLogs(TestCase):
         file_handle.write.assert_called_with(call_argument)
 
 
+class PersistingLogBatches(TestCase):
+    def test_single_write(self):
+        """
+        Should append a batch of entries with a single write.
+        """
+        _, entry = log_entry()
+        mock_file_open = mock_open()
+        with patch("builtins.open", mock_file_open):
+            file_handler = FileHandler("/file/to/open.txt")
+            file_handler.persist_logs([entry, entry])
+
+        line = f"{entry['date']} {entry['level']} {entry['message']}\n"
+        mock_file_open().write.assert_called_with(line * 2)
+
+
 class RetrieveLogs(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -81,7 +99,7 @@ class RetrieveLogs(TestCase):
                          f"{cls.log_entry_2['level']} "
                          f"{cls.log_entry_2['message']}")
         cls.file_path = "/path/to/a/file.txt"
-        cls.mock_file_open = mock_open(read_data=cls.read_data)
+        cls.mock_file_open = mock_open(read_data=cls.read_data.encode())
 
     def setUp(self):
         with patch("builtins.open", self.mock_file_open):
@@ -90,9 +108,9 @@ class RetrieveLogs(TestCase):
 
     def test_opening_file(self):
         """
-        Should open a file for reading.
+        Should open a file for reading (in binary mode, to map it).
         """
-        self.mock_file_open.assert_called_with(self.file_path, "r")
+        self.mock_file_open.assert_called_with(self.file_path, "rb")
 
     def test_fetching_entries(self):
         """
@@ -109,10 +127,115 @@ class RetrieveLogs(TestCase):
         Should return empty list if the input file contains malformed data.
         """
         read_data = "malformed line" + self.read_data
-        mock_file_open = mock_open(read_data=read_data)
+        mock_file_open = mock_open(read_data=read_data.encode())
 
         with patch("builtins.open", mock_file_open):
             file_handler = FileHandler(self.file_path)
             log_entries = file_handler.retrieve_all_logs()
 
         self.assertFalse(log_entries)
+
+
+class IteratingLogs(TestCase):
+    """
+    Streaming entries from a log file, also backwards.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, "log.txt")
+        self.file_handler = FileHandler(self.file_path)
+        # a small block size makes lines span block boundaries
+        self.file_handler.read_block_size = 16
+        self.messages = [f"message number {i}" for i in range(10)]
+        for i, message in enumerate(self.messages):
+            self.file_handler.persist_log(LogEntry(
+                date=datetime.datetime(2020, 1, 1, 10, i),
+                level=LogLevelValue.INFO,
+                msg=message))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_forward(self):
+        received_messages = [entry.message for entry
+                             in self.file_handler.iter_logs()]
+
+        self.assertListEqual(self.messages, received_messages)
+
+    def test_newest_first(self):
+        received_messages = [entry.message for entry in
+                             self.file_handler.iter_logs(newest_first=True)]
+
+        self.assertListEqual(self.messages[::-1], received_messages)
+
+    def test_cursor(self):
+        """
+        It should continue reading after the cursor, in both directions.
+        """
+        entries = list(self.file_handler.iter_logs())
+        cursor = LogCursor.from_entry(entries[4])
+        forward = [entry.message for entry
+                   in self.file_handler.iter_logs(after=cursor)]
+        backward = [entry.message for entry in self.file_handler.iter_logs(
+            newest_first=True, after=cursor)]
+
+        self.assertListEqual(self.messages[5:], forward)
+        self.assertListEqual(self.messages[3::-1], backward)
+
+    def test_text_hint(self):
+        """
+        Only lines whose messages contain the text should be returned.
+        """
+        forward = [entry.message for entry
+                   in self.file_handler.iter_logs(contains="number 3")]
+        backward = [entry.message for entry in self.file_handler.iter_logs(
+            newest_first=True, contains="message")]
+        # the text is in the dates, not in the messages
+        dates_only = list(self.file_handler.iter_logs(contains="2020"))
+
+        self.assertListEqual(["message number 3"], forward)
+        self.assertListEqual(self.messages[::-1], backward)
+        self.assertListEqual([], dates_only)
+
+    def test_text_hint_with_cursor(self):
+        entries = list(self.file_handler.iter_logs())
+        cursor = LogCursor.from_entry(entries[4])
+        forward = [entry.message for entry in self.file_handler.iter_logs(
+            after=cursor, contains="number")]
+        backward = [entry.message for entry in self.file_handler.iter_logs(
+            newest_first=True, after=cursor, contains="number")]
+
+        self.assertListEqual(self.messages[5:], forward)
+        self.assertListEqual(self.messages[3::-1], backward)
+
+    def test_date_hints(self):
+        entries = self.file_handler.iter_logs(
+            start_date=datetime.datetime(2020, 1, 1, 10, 2),
+            end_date=datetime.datetime(2020, 1, 1, 10, 4))
+        received_messages = [entry.message for entry in entries]
+
+        self.assertListEqual(self.messages[2:5], received_messages)
+
+    def test_levels_hint(self):
+        info_entries = self.file_handler.iter_logs(
+            levels=[LogLevelValue.INFO], contains="number 5")
+        error_entries = self.file_handler.iter_logs(
+            levels=[LogLevelValue.ERROR])
+
+        self.assertListEqual(["message number 5"],
+                             [entry.message for entry in info_entries])
+        self.assertListEqual([], list(error_entries))
+
+    def test_skipping_malformed_lines(self):
+        with open(self.file_path, "a") as fh:
+            fh.write("malformed line\n\n")
+        received_messages = [entry.message for entry in
+                             self.file_handler.iter_logs(newest_first=True)]
+
+        self.assertListEqual(self.messages[::-1], received_messages)
+
+    def test_empty_file(self):
+        open(self.file_path, "w").close()
+
+        self.assertListEqual([], list(self.file_handler.iter_logs()))
+        self.assertListEqual([], self.file_handler.retrieve_all_logs())
@@ -1,7 +1,7 @@
 import json
 from unittest import TestCase
 from unittest.mock import MagicMock, mock_open, patch
-from profil_logger import JsonHandler
+from profil_logger import JsonHandler, LogCursor
 from tests.fake_data import fake_log_entry, log_entry
 
 
@@ -133,3 +133,17 @@ class LogsRetrieval(TestCase):
             entries = json_handler.retrieve_all_logs()
 
         self.assertFalse(entries)
+
+    def test_iterating_newest_first(self, *args):
+        """
+        Should iterate from the last entry of the array, past the cursor.
+        """
+        with patch("json.load", return_value=self.log_entries_d):
+            json_handler = JsonHandler(self.file_path)
+            newest_entry = next(json_handler.iter_logs(newest_first=True))
+            entries = list(json_handler.iter_logs(
+                newest_first=True, after=LogCursor.from_entry(newest_entry)))
+
+        self.assertEqual(str(self.log_entries[-1]), str(newest_entry))
+        self.assertListEqual([str(entry) for entry in self.log_entries[:-1]],
+                             [str(entry) for entry in entries])
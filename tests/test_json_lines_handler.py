@@ -0,0 +1,54 @@
+import datetime
+import os
+import tempfile
+from unittest import TestCase
+from profil_logger import JsonLinesHandler, LogCursor, LogEntry, LogLevelValue
+
+
+class JsonLinesLog(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, "log.jsonl")
+        self.handler = JsonLinesHandler(self.file_path)
+        self.messages = ["plain message", 'multi-line\n"quoted" message',
+                         "zażółć gęślą jaźń", "last message"]
+        self.handler.persist_log(LogEntry(
+            date=datetime.datetime(2020, 1, 1, 10),
+            level=LogLevelValue.INFO, msg=self.messages[0]))
+        self.handler.persist_logs([
+            LogEntry(date=datetime.datetime(2020, 1, 1, 11, i),
+                     level=LogLevelValue.ERROR, msg=message)
+            for i, message in enumerate(self.messages[1:])])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_line_per_entry(self):
+        with open(self.file_path, encoding="utf-8") as fh:
+            lines = fh.readlines()
+
+        self.assertEqual(4, len(lines))
+        self.assertEqual('{"date": "2020-01-01T10:00:00", "level": "INFO", '
+                         '"message": "plain message"}\n', lines[0])
+
+    def test_reading(self):
+        received_messages = [entry.message for entry
+                             in self.handler.retrieve_all_logs()]
+        newest_first = [entry.message for entry
+                        in self.handler.iter_logs(newest_first=True)]
+
+        self.assertListEqual(self.messages, received_messages)
+        self.assertListEqual(self.messages[::-1], newest_first)
+
+    def test_cursor(self):
+        cursor = LogCursor.from_entry(list(self.handler.iter_logs())[1])
+        received_messages = [entry.message for entry
+                             in self.handler.iter_logs(after=cursor)]
+
+        self.assertListEqual(self.messages[2:], received_messages)
+
+    def test_skipping_malformed_lines(self):
+        with open(self.file_path, "a") as fh:
+            fh.write('[1, 2]\n{"date": "2020-01-01"\n')
+
+        self.assertEqual(4, len(self.handler.retrieve_all_logs()))
@@ -1,6 +1,7 @@
 import datetime
 from unittest import TestCase
-from profil_logger.log_entry import LogEntry, LogLevelValue
+from profil_logger.log_entry import LogEntry, LogLevelValue, \
+    MessageInterner
 
 
 # docstrings are ommited in cases where the test name
@@ -112,3 +113,41 @@ class LogEntryFromDict(TestCase):
     def test_date(self):
         self.assertEqual(self.log_entry_from_dict["date"],
                          self.date.isoformat())
+
+
+class LogEntryItems(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.date = datetime.datetime(1987, 3, 9, 11, 10, 10, 15)
+        cls.log_entry = LogEntry(date=cls.date,
+                                 level=LogLevelValue.INFO,
+                                 msg="message")
+
+    def test_items(self):
+        self.assertEqual(self.date.isoformat(), self.log_entry["date"])
+        self.assertEqual("INFO", self.log_entry["level"])
+        self.assertEqual("message", self.log_entry["message"])
+
+    def test_unknown_key(self):
+        self.assertRaises(KeyError, lambda: self.log_entry["msg"])
+
+    def test_date_formatted_once(self):
+        self.assertIs(self.log_entry["date"], self.log_entry["date"])
+
+
+class Interning(TestCase):
+    def test_sharing_messages(self):
+        messages = MessageInterner()
+        message = messages.intern("".join(["repeated ", "message"]))
+
+        self.assertIs(message,
+                      messages.intern("".join(["repeated ", "message"])))
+
+    def test_clearing_full_cache(self):
+        messages = MessageInterner(max_size=2)
+        first_message = messages.intern("".join(["message ", "1"]))
+        messages.intern("message 2")
+        messages.intern("message 3")
+
+        self.assertIsNot(first_message,
+                         messages.intern("".join(["message ", "1"])))
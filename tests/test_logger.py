@@ -121,3 +121,150 @@ class LoggingMessages(TestCase):
             with patch.object(JsonHandler, "persist_log",
                               self.mock_json_persist_log):
                 _callable()
+
+
+@patch("builtins.open")
+class LazyLogging(TestCase):
+    @patch("builtins.open")
+    def setUp(self, *args):
+        self.mock_persist_log = MagicMock()
+        self.profil_logger = ProfilLogger([FileHandler("/path/to/file.txt")])
+
+    def test_message_arguments(self, *args):
+        """
+        It should merge printf-style arguments into the logged message.
+        """
+        with patch.object(FileHandler, "persist_log", self.mock_persist_log):
+            self.profil_logger.info("user %s did %s", "uid", "action")
+
+        logged_entry = self.mock_persist_log.call_args[0][0]
+        self.assertEqual("user uid did action", logged_entry.message)
+
+    def test_mismatched_arguments(self, *args):
+        """
+        It shouldn't fail if arguments don't match the message.
+        """
+        with patch.object(FileHandler, "persist_log", self.mock_persist_log):
+            self.profil_logger.info("user %s did %s", "uid")
+
+        logged_entry = self.mock_persist_log.call_args[0][0]
+        self.assertIn("user %s did %s", logged_entry.message)
+
+    def test_filtered_out_arguments(self, *args):
+        """
+        It shouldn't format arguments of entries which aren't logged.
+        """
+        argument = MagicMock()
+        self.profil_logger.set_log_level(LogLevelValue.ERROR)
+        with patch.object(FileHandler, "persist_log", self.mock_persist_log):
+            self.profil_logger.warning("%s", argument)
+
+        argument.__str__.assert_not_called()
+        self.mock_persist_log.assert_not_called()
+
+    def test_formatting_on_reading(self, *args):
+        """
+        Arguments should be merged into the message by the handler reading
+        it, not by the logging call.
+        """
+        argument = MagicMock()
+        argument.__str__.return_value = "argument"
+        with patch.object(FileHandler, "persist_log", self.mock_persist_log):
+            self.profil_logger.error("%s", argument)
+        argument.__str__.assert_not_called()
+
+        logged_entry = self.mock_persist_log.call_args[0][0]
+        self.assertEqual("argument", logged_entry.message)
+
+    def test_is_enabled_for(self, *args):
+        self.profil_logger.set_log_level(LogLevelValue.WARNING)
+
+        self.assertFalse(self.profil_logger.is_enabled_for(
+            LogLevelValue.INFO))
+        self.assertTrue(self.profil_logger.is_enabled_for(
+            LogLevelValue.WARNING))
+
+    def test_rebinding_level_methods(self, *args):
+        """
+        Methods of disabled levels should be replaced with no-ops and
+        restored after lowering the level.
+        """
+        self.profil_logger.set_log_level(LogLevelValue.ERROR)
+        self.assertIn("warning", vars(self.profil_logger))
+        self.assertNotIn("error", vars(self.profil_logger))
+
+        self.profil_logger.set_log_level(LogLevelValue.DEBUG)
+        self.assertNotIn("warning", vars(self.profil_logger))
+
+
+@patch("builtins.open")
+class HandlerRouting(TestCase):
+    @patch("builtins.open")
+    def setUp(self, *args):
+        self.file_handler = FileHandler("/path/to/file.txt")
+        self.json_handler = JsonHandler("/path/to/file.json")
+        self.profil_logger = ProfilLogger([self.file_handler,
+                                           self.json_handler])
+        self.file_handler.persist_log = MagicMock()
+        self.json_handler.persist_log = MagicMock()
+
+    def test_handler_level(self, *args):
+        """
+        It should write entries below the handler's level only to
+        the other handlers.
+        """
+        self.profil_logger.set_handler_level(self.json_handler,
+                                             LogLevelValue.WARNING)
+        self.profil_logger.info("info message")
+        self.profil_logger.error("error message")
+
+        self.assertEqual(2, self.file_handler.persist_log.call_count)
+        self.assertEqual(1, self.json_handler.persist_log.call_count)
+        self.assertEqual(
+            "error message",
+            self.json_handler.persist_log.call_args[0][0].message)
+
+    def test_handler_filter(self, *args):
+        self.profil_logger.set_handler_filter(
+            self.file_handler, lambda entry: "audit" in entry.message)
+        self.profil_logger.info("audit message")
+        self.profil_logger.info("other message")
+
+        self.assertEqual(1, self.file_handler.persist_log.call_count)
+        self.assertEqual(2, self.json_handler.persist_log.call_count)
+
+    def test_no_handlers_for_level(self, *args):
+        """
+        A level accepted by no handler should be disabled.
+        """
+        for log_handler in (self.file_handler, self.json_handler):
+            self.profil_logger.set_handler_level(log_handler,
+                                                 LogLevelValue.ERROR)
+
+        self.assertFalse(self.profil_logger.is_enabled_for(
+            LogLevelValue.WARNING))
+        self.assertIn("warning", vars(self.profil_logger))
+
+    def test_adding_removing_handlers(self, *args):
+        self.profil_logger.remove_handler(self.json_handler)
+        self.profil_logger.add_handler(self.json_handler,
+                                       log_level=LogLevelValue.CRITICAL)
+        self.profil_logger.error("error message")
+
+        self.file_handler.persist_log.assert_called_once()
+        self.json_handler.persist_log.assert_not_called()
+
+    def test_changing_handler_list(self, *args):
+        """
+        Handlers appended to (or removed from) the log_handlers list
+        should be routed to.
+        """
+        profil_logger = ProfilLogger([])
+        profil_logger.log_handlers.append(self.file_handler)
+        profil_logger.log_handlers += [self.json_handler]
+        profil_logger.error("error message")
+        del profil_logger.log_handlers[0]
+        profil_logger.error("error message")
+
+        self.file_handler.persist_log.assert_called_once()
+        self.assertEqual(2, self.json_handler.persist_log.call_count)
@@ -1,7 +1,10 @@
+import asyncio
 import datetime
-from unittest import TestCase
+import threading
+import time
+from unittest import IsolatedAsyncioTestCase, TestCase
 from unittest.mock import MagicMock, patch
-from profil_logger import FileHandler, LogEntry, LogLevelValue, \
+from profil_logger import FileHandler, LogCursor, LogEntry, LogLevelValue, \
     ProfilLoggerReader
 
 
@@ -52,10 +55,10 @@ class TestData:
 # using multiple inheritance and writing more boiler plate code.
 
 def setUpTestData(self, *args):
-    self.mock_retrieve_all_logs = MagicMock(
-        return_value=TestData.log_entries)
+    self.mock_iter_logs = MagicMock(
+        side_effect=lambda **kwargs: iter(TestData.log_entries))
     self.handler = FileHandler(TestData.log_file_path)
-    self.handler.retrieve_all_logs = self.mock_retrieve_all_logs
+    self.handler.iter_logs = self.mock_iter_logs
     self.logger_reader = ProfilLoggerReader(self.handler)
 
 
@@ -76,7 +79,7 @@ class TextSearch(TestCase):
                             for entry in (TestData.log_entries[0],
                                           TestData.log_entries[1],)}
 
-        self.mock_retrieve_all_logs.assert_called_once()
+        self.mock_iter_logs.assert_called_once()
         self.assertEqual(expected_number_of_entries, len(found_entries))
         self.assertSetEqual(expected_entries, received_entries)
 
@@ -94,7 +97,7 @@ class TextSearch(TestCase):
             searched_text, start_date=start_date, end_date=end_date)
         expected_entries = [TestData.log_entries[2]]
 
-        self.mock_retrieve_all_logs.assert_called_once()
+        self.mock_iter_logs.assert_called_once()
         self.assertEqual(expected_number_of_entries, len(found_entries))
         self.assertListEqual(expected_entries, found_entries)
 
@@ -134,10 +137,10 @@ class RegexSearch(TestCase):
 
     def test_calling_handler(self):
         """
-        It should call the handler.retrieve_all_logs() method.
+        It should call the handler.iter_logs() method.
         """
         self.logger_reader.find_by_regex(self.searched_expression)
-        self.mock_retrieve_all_logs.assert_called_once()
+        self.mock_iter_logs.assert_called_once()
 
     def test_no_dates(self):
         """
@@ -231,7 +234,7 @@ class GroupingByLevel(TestCase):
         It should call a handler to obtain log entries.
         """
         self.logger_reader.groupby_level()
-        self.mock_retrieve_all_logs.assert_called_once()
+        self.mock_iter_logs.assert_called_once()
 
     def test_no_dates(self):
         """
@@ -299,10 +302,10 @@ class GroupingByMonth(TestCase):
 
     @patch("builtins.open")
     def setUp(self, *args):
-        self.mock_retrieve_all_logs = MagicMock(
-            return_value=self.log_entries)
+        self.mock_iter_logs = MagicMock(
+            side_effect=lambda **kwargs: iter(self.log_entries))
         self.handler = FileHandler(TestData.log_file_path)
-        self.handler.retrieve_all_logs = self.mock_retrieve_all_logs
+        self.handler.iter_logs = self.mock_iter_logs
         self.logger_reader = ProfilLoggerReader(self.handler)
 
     def test_calling_handler(self):
@@ -310,7 +313,7 @@ class GroupingByMonth(TestCase):
         It should call a handler to obtain log entries.
         """
         self.logger_reader.groupby_month()
-        self.mock_retrieve_all_logs.assert_called_once()
+        self.mock_iter_logs.assert_called_once()
 
     def test_no_dates(self):
         """
@@ -358,3 +361,166 @@ class GroupingByMonth(TestCase):
             end_date=end_date)
 
         self.assertDictEqual(expected_output, received_output)
+
+
+class Pagination(TestCase):
+    setUp = patch("builtins.open")(setUpTestData)
+
+    def test_limit(self):
+        found_entries = self.logger_reader.find_by_text("MTV", limit=1)
+
+        self.assertListEqual([TestData.log_entries[0]], found_entries)
+
+    def test_offset(self):
+        found_entries = self.logger_reader.find_by_regex(
+            "[A-Z]{3}", limit=1, offset=1)
+
+        self.assertListEqual([TestData.log_entries[1]], found_entries)
+
+    def test_early_termination(self):
+        """
+        It should stop reading entries as soon as the page is complete.
+        """
+        consumed = []
+        closed = []
+
+        def iter_logs(**kwargs):
+            try:
+                for entry in TestData.log_entries:
+                    consumed.append(entry)
+                    yield entry
+            finally:
+                closed.append(True)
+
+        self.handler.iter_logs = iter_logs
+        self.logger_reader.groupby_level(limit=2)
+
+        self.assertEqual(2, len(consumed))
+        # the handler's iterator is closed (releasing its file)
+        self.assertListEqual([True], closed)
+
+    def test_newest_first_and_cursor(self):
+        """
+        It should pass the reading direction and the cursor to the handler.
+        """
+        cursor = LogCursor.from_entry(TestData.log_entries[3])
+        self.logger_reader.groupby_month(newest_first=True, after=cursor)
+
+        call_kwargs = self.mock_iter_logs.call_args.kwargs
+        self.assertTrue(call_kwargs["newest_first"])
+        self.assertEqual(cursor, call_kwargs["after"])
+
+
+class LevelsAndCounting(TestCase):
+    setUp = patch("builtins.open")(setUpTestData)
+
+    def test_find_by_level(self):
+        """
+        It should pass the levels to the handler and filter entries by them.
+        """
+        levels = [LogLevelValue.CRITICAL, LogLevelValue.ERROR]
+        found_entries = self.logger_reader.find_by_level(levels)
+
+        self.assertListEqual([TestData.log_entries[1],
+                              TestData.log_entries[3],
+                              TestData.log_entries[4]], found_entries)
+        self.assertEqual(levels,
+                         self.mock_iter_logs.call_args.kwargs["levels"])
+
+    def test_counting_by_level(self):
+        """
+        Without the handler counting entries, they should be counted
+        by the reader.
+        """
+        counts = self.logger_reader.count_by_level(
+            start_date=datetime.datetime(1995, 1, 1))
+
+        self.assertDictEqual({LogLevelValue.DEBUG: 1,
+                              LogLevelValue.ERROR: 1,
+                              LogLevelValue.CRITICAL: 2}, counts)
+
+    def test_counting_by_month(self):
+        counts = self.logger_reader.count_by_month(
+            end_date=datetime.datetime(2004, 1, 1))
+
+        self.assertDictEqual({"1994-10": 1, "1996-12": 1, "2003-10": 1},
+                             counts)
+
+    def test_counting_by_handler(self):
+        """
+        Counts returned by the handler should be used instead of reading
+        entries.
+        """
+        self.handler.count_logs = MagicMock(
+            return_value={LogLevelValue.INFO: 7})
+        counts = self.logger_reader.count_by_level()
+
+        self.assertDictEqual({LogLevelValue.INFO: 7}, counts)
+        self.handler.count_logs.assert_called_once_with("level", None, None)
+        self.mock_iter_logs.assert_not_called()
+
+
+class AsyncQueries(IsolatedAsyncioTestCase):
+    setUp = patch("builtins.open")(setUpTestData)
+
+    async def test_streaming_text_search(self):
+        self.logger_reader.async_chunk_size = 1
+        found_entries = [entry async for entry
+                         in self.logger_reader.aiter_find_by_text("MTV")]
+
+        self.assertListEqual(TestData.log_entries[:2], found_entries)
+
+    async def test_streaming_regex_search(self):
+        found_entries = [entry async for entry in
+                         self.logger_reader.aiter_find_by_regex(
+                             r"\,\s\w{5}\s", limit=1)]
+
+        self.assertListEqual([TestData.log_entries[2]], found_entries)
+
+    async def test_invalid_regex(self):
+        found_entries = [entry async for entry
+                         in self.logger_reader.aiter_find_by_regex(r"[]")]
+
+        self.assertFalse(found_entries)
+
+    async def test_grouping(self):
+        received_output = await self.logger_reader.agroupby_level()
+
+        self.assertDictEqual(self.logger_reader.groupby_level(),
+                             received_output)
+        self.assertDictEqual(self.logger_reader.groupby_month(),
+                             await self.logger_reader.agroupby_month())
+
+    async def test_cancellation(self):
+        """
+        The scan should stop once the consumer stops iterating.
+        """
+        consumed = []
+        closed = threading.Event()
+
+        def iter_logs(**kwargs):
+            try:
+                for i in range(10_000):
+                    consumed.append(i)
+                    yield TestData.log_entries[0]
+            finally:
+                closed.set()
+
+        self.handler.iter_logs = iter_logs
+        self.logger_reader.async_chunk_size = 10
+        entries = self.logger_reader.aiter_find_by_text("MTV")
+        async for _ in entries:
+            break
+        await entries.aclose()
+
+        self.assertTrue(await asyncio.to_thread(closed.wait, 5))
+        self.assertLess(len(consumed), 10_000)
+
+    async def test_timeout(self):
+        def iter_logs(**kwargs):
+            time.sleep(0.5)
+            yield from TestData.log_entries
+
+        self.handler.iter_logs = iter_logs
+        with self.assertRaises(TimeoutError):
+            await self.logger_reader.agroupby_month(timeout=0.05)
@@ -0,0 +1,91 @@
+import datetime
+import os
+import tempfile
+from unittest import TestCase
+from profil_logger import FileHandler, LogCursor, LogEntry, LogLevelValue, \
+    MemoryHandler, ProfilLogger, ProfilLoggerReader
+
+
+def get_entries(count, level=LogLevelValue.DEBUG):
+    return [LogEntry(date=datetime.datetime(2024, 1, 1 + i),
+                     level=level, msg=f"message {i}")
+            for i in range(count)]
+
+
+class MemoryBuffer(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.target = FileHandler(os.path.join(self.directory.name,
+                                               "log.txt"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_messages(self, entries):
+        return [entry.message for entry in entries]
+
+    def test_overwriting_oldest_entries(self):
+        handler = MemoryHandler(capacity=3)
+        handler.persist_logs(get_entries(2))
+        handler.persist_logs(get_entries(5)[2:])
+        entries = handler.retrieve_all_logs()
+
+        self.assertListEqual(["message 2", "message 3", "message 4"],
+                             self.get_messages(entries))
+        self.assertListEqual([2, 3, 4],
+                             [entry.entry_id for entry in entries])
+        self.assertListEqual(
+            ["message 4", "message 3", "message 2"],
+            self.get_messages(handler.iter_logs(newest_first=True)))
+        self.assertEqual(2, handler.stats()["overwritten"])
+
+    def test_limiting_bytes(self):
+        handler = MemoryHandler(capacity=10, max_bytes=20)
+        handler.persist_logs(get_entries(4))
+        self.assertListEqual(["message 2", "message 3"],
+                             self.get_messages(handler.iter_logs()))
+
+        handler.persist_log(LogEntry(date=datetime.datetime(2024, 2, 1),
+                                     level=LogLevelValue.INFO,
+                                     msg="a message longer than 20 bytes"))
+        stats = handler.stats()
+        self.assertListEqual(["a message longer than 20 bytes"],
+                             self.get_messages(handler.iter_logs()))
+        self.assertEqual(1, stats["buffered"])
+        self.assertEqual(30, stats["buffered_bytes"])
+        self.assertEqual(4, stats["overwritten"])
+
+    def test_flushing_on_error(self):
+        handler = MemoryHandler(capacity=10, target=self.target)
+        logger = ProfilLogger([handler])
+        logger.debug("first")
+        logger.warning("second")
+
+        self.assertListEqual([], self.target.retrieve_all_logs())
+        logger.error("third")
+        self.assertListEqual(
+            ["first", "second", "third"],
+            self.get_messages(self.target.retrieve_all_logs()))
+        self.assertListEqual([], handler.retrieve_all_logs())
+
+        logger.info("fourth")
+        self.assertEqual(1, handler.flush())
+        self.assertEqual(0, handler.flush())
+        self.assertEqual(4, len(self.target.retrieve_all_logs()))
+
+    def test_reading_with_cursor(self):
+        handler = MemoryHandler(capacity=3)
+        handler.persist_logs(get_entries(5))
+        after = LogCursor(datetime.datetime(2024, 1, 4), 3)
+
+        self.assertListEqual(["message 4"], self.get_messages(
+            handler.iter_logs(after=after)))
+        self.assertListEqual(["message 2"], self.get_messages(
+            handler.iter_logs(newest_first=True, after=after)))
+        self.assertListEqual(
+            ["message 3", "message 4"],
+            self.get_messages(ProfilLoggerReader(handler).find_by_text(
+                "message", start_date=datetime.datetime(2024, 1, 4))))
+
+    def test_invalid_capacity(self):
+        self.assertRaises(ValueError, MemoryHandler, capacity=0)
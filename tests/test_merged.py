@@ -0,0 +1,94 @@
+import datetime
+import os
+import tempfile
+from unittest import TestCase
+from profil_logger import CSVHandler, JsonLinesHandler, LogCursor, \
+    LogEntry, LogLevelValue, MergedHandler, ProfilLoggerReader, SQLiteHandler
+
+
+def make_entry(day, hour, msg):
+    return LogEntry(date=datetime.datetime(2024, 1, day, hour),
+                    level=LogLevelValue.ERROR if hour % 2
+                    else LogLevelValue.INFO,
+                    msg=msg)
+
+
+class MergedLogs(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.handlers = [
+            CSVHandler(self.get_path("worker-1.csv")),
+            JsonLinesHandler(self.get_path("worker-2.jsonl")),
+            SQLiteHandler(self.get_path("worker-3.sqlite"))]
+        # entries of the workers interleave
+        for index, log_handler in enumerate(self.handlers):
+            log_handler.persist_logs(
+                [make_entry(day, index + 3 * hour, f"worker {index + 1}")
+                 for day in range(1, 4) for hour in range(3)])
+        self.dates = sorted(datetime.datetime(2024, 1, day, hour)
+                            for day in range(1, 4) for hour in range(9))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_path(self, file_name):
+        return os.path.join(self.directory.name, file_name)
+
+    def test_merging_by_dates(self):
+        for parallel in [False, True]:
+            with self.subTest(parallel=parallel):
+                handler = MergedHandler(self.handlers, parallel=parallel,
+                                        batch_size=2)
+                entries = list(handler.iter_logs())
+
+                self.assertListEqual(self.dates,
+                                     [entry.date for entry in entries])
+                self.assertListEqual(
+                    self.dates[::-1],
+                    [entry.date for entry in
+                     handler.iter_logs(newest_first=True)])
+                self.assertEqual(len(entries), len(
+                    {entry.entry_id for entry in entries}))
+
+    def test_reading_merged_logs(self):
+        logger_reader = ProfilLoggerReader(self.handlers)
+        found_entries = logger_reader.find_by_text(
+            "worker 2", start_date=datetime.datetime(2024, 1, 2),
+            end_date=datetime.datetime(2024, 1, 2, 23))
+
+        self.assertListEqual(
+            [datetime.datetime(2024, 1, 2, hour) for hour in [1, 4, 7]],
+            [entry.date for entry in found_entries])
+        self.assertDictEqual(
+            {LogLevelValue.INFO: 15, LogLevelValue.ERROR: 12},
+            logger_reader.count_by_level())
+
+    def test_paginating(self):
+        logger_reader = ProfilLoggerReader(
+            MergedHandler(self.handlers, parallel=True))
+        pages = []
+        after = None
+        for _ in range(3):
+            page = logger_reader.find_by_text("worker", limit=10,
+                                              after=after)
+            pages.extend(entry.date for entry in page)
+            after = LogCursor.from_entry(page[-1])
+
+        self.assertListEqual(self.dates, pages)
+
+    def test_counting_from_sources(self):
+        sqlite_handlers = []
+        for index in range(2):
+            sqlite_handler = SQLiteHandler(
+                self.get_path(f"counted-{index}.sqlite"))
+            sqlite_handler.persist_logs([make_entry(1, 1, "counted")])
+            sqlite_handlers.append(sqlite_handler)
+
+        self.assertDictEqual(
+            {LogLevelValue.ERROR: 2},
+            MergedHandler(sqlite_handlers).count_logs("level"))
+        # CSV entries have to be counted by reading them
+        self.assertIsNone(MergedHandler(self.handlers).count_logs("level"))
+        self.assertRaises(NotImplementedError,
+                          MergedHandler(sqlite_handlers).persist_log,
+                          make_entry(1, 1, "counted"))
@@ -0,0 +1,119 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+from profil_logger import ConcurrentDispatcher, FileHandler, JsonHandler, \
+    JsonLinesHandler, LogLevelValue, ProfilLogger
+from profil_logger.metrics import Histogram, JsonLinesExporter, \
+    PeriodicExporter
+from tests.fake_data import RecordingHandler, make_entry
+
+
+class Histograms(TestCase):
+    def test_quantiles(self):
+        histogram = Histogram(bounds=[1, 2, 4, 8])
+        for value in [0.5] * 90 + [3] * 9 + [100]:
+            histogram.observe(value)
+
+        self.assertEqual(1, histogram.quantile(0.5))
+        self.assertEqual(4, histogram.quantile(0.99))
+        self.assertEqual(100, histogram.quantile(1))
+        self.assertListEqual([(1, 90), (4, 9), (float("inf"), 1)],
+                             histogram.stats()["buckets"])
+
+    def test_empty_histogram(self):
+        self.assertIsNone(Histogram().quantile(0.5))
+
+
+class LoggerMetrics(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, "log.txt")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_counting_entries(self):
+        handler = RecordingHandler()
+        profil_logger = ProfilLogger([handler])
+        profil_logger.set_log_level(LogLevelValue.INFO)
+        profil_logger.set_handler_filter(
+            handler, lambda entry: "skipped" not in entry.message)
+        profil_logger.debug("debug")
+        profil_logger.info("info")
+        profil_logger.info("skipped")
+        profil_logger.error("error")
+        stats = profil_logger.stats()
+
+        self.assertEqual(1, stats["logged"][LogLevelValue.INFO])
+        self.assertEqual(1, stats["logged"][LogLevelValue.ERROR])
+        self.assertEqual(1, stats["filtered"][LogLevelValue.DEBUG])
+        self.assertEqual(1, stats["filtered"][LogLevelValue.INFO])
+        handler_stats = stats["handlers"][handler]
+        self.assertEqual(2, handler_stats["writes"])
+        self.assertEqual(2, handler_stats["entries_written"])
+        self.assertEqual(2, handler_stats["write_seconds"]["count"])
+
+    def test_bytes_written(self):
+        handler = FileHandler(self.file_path)
+        profil_logger = ProfilLogger([handler])
+        profil_logger.info("zażółć gęślą jaźń")
+        handler.persist_logs([make_entry(), make_entry()])
+
+        self.assertEqual(os.path.getsize(self.file_path),
+                         handler.stats()["bytes_written"])
+
+    def test_concurrent_writes(self):
+        dispatcher = ConcurrentDispatcher()
+        failing_handler = RecordingHandler(fail=True)
+        profil_logger = ProfilLogger([failing_handler],
+                                     dispatcher=dispatcher)
+        profil_logger.info("message")
+        profil_logger.flush(timeout=5)
+        dispatcher.close()
+
+        self.assertEqual(1, failing_handler.stats()["failed_writes"])
+        self.assertEqual(0, failing_handler.stats()["writes"])
+
+    def test_swallowed_errors(self):
+        json_handler = JsonHandler(os.path.join(self.directory.name,
+                                                "log.json"))
+        with open(json_handler.filepath, "w") as fh:
+            fh.write("[{")
+        json_lines_handler = JsonLinesHandler(
+            os.path.join(self.directory.name, "log.jsonl"))
+        with open(json_lines_handler.filepath, "w") as fh:
+            fh.write("{}\nnot json\n")
+
+        self.assertListEqual([], json_handler.retrieve_all_logs())
+        self.assertListEqual([], json_lines_handler.retrieve_all_logs())
+        self.assertDictEqual({"JSONDecodeError": 1},
+                             json_handler.stats()["errors"])
+        self.assertDictEqual({"KeyError": 1, "JSONDecodeError": 1},
+                             json_lines_handler.stats()["errors"])
+
+
+class Exporting(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.export_path = os.path.join(self.directory.name, "metrics.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_exporting_snapshots(self):
+        handler = FileHandler(os.path.join(self.directory.name, "log.txt"))
+        profil_logger = ProfilLogger([handler])
+        exporter = PeriodicExporter(profil_logger.stats,
+                                    [JsonLinesExporter(self.export_path)],
+                                    interval=60)
+        profil_logger.warning("message")
+        exporter.close()
+
+        with open(self.export_path) as fh:
+            snapshots = [json.loads(line) for line in fh]
+        self.assertEqual(1, len(snapshots))
+        self.assertEqual(1, snapshots[0]["logged"]["WARNING"])
+        self.assertEqual(
+            1, snapshots[0]["handlers"][f"FileHandler({handler.filepath})"]
+            ["entries_written"])
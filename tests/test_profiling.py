@@ -0,0 +1,74 @@
+import datetime
+import os
+import tempfile
+from unittest import TestCase
+from profil_logger import CSVHandler, LogEntry, LogLevelValue, \
+    ProfilLoggerReader, SQLiteHandler
+from profil_logger.profiling import QueryProfiler
+
+
+def get_entries():
+    return [LogEntry(date=datetime.datetime(2020, 1, day),
+                     level=LogLevelValue.INFO if day % 2
+                     else LogLevelValue.ERROR,
+                     msg=f"message {day}")
+            for day in range(1, 21)]
+
+
+class QueryProfiling(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.handler = CSVHandler(os.path.join(self.directory.name,
+                                               "log.csv"))
+        self.handler.persist_logs(get_entries())
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_profiling_stages(self):
+        profiles = []
+        logger_reader = ProfilLoggerReader(
+            self.handler, profiler=QueryProfiler(on_profile=profiles.append))
+        found_entries = logger_reader.find_by_text(
+            "message 1", start_date=datetime.datetime(2020, 1, 5),
+            limit=3)
+        profile = logger_reader.last_profile
+
+        self.assertListEqual([profile], profiles)
+        self.assertListEqual(["message 10", "message 11", "message 12"],
+                             [entry.message for entry in found_entries])
+        self.assertEqual("find_by_text", profile.query)
+        self.assertEqual("CSVHandler", profile.handler_name)
+        # entries are read until the third match
+        self.assertEqual(12, profile.entries_scanned)
+        self.assertEqual(8, profile.stages["filter"].entries)
+        self.assertEqual(3, profile.stages["match"].entries)
+        self.assertEqual(3, profile.entries_returned)
+        self.assertAlmostEqual(profile.seconds, sum(
+            stage.seconds for stage in profile.stages.values()))
+        self.assertGreater(profile.peak_memory_bytes, 0)
+        self.assertIn("find_by_text on CSVHandler", profile.explain())
+
+    def test_explaining_query(self):
+        logger_reader = ProfilLoggerReader(self.handler)
+        groups, profile = logger_reader.explain(
+            "groupby_level", end_date=datetime.datetime(2020, 1, 4))
+
+        self.assertIsNone(logger_reader.last_profile)
+        self.assertEqual(4, profile.entries_returned)
+        self.assertEqual(20, profile.entries_scanned)
+        self.assertListEqual([LogLevelValue.INFO, LogLevelValue.ERROR],
+                             list(groups))
+        self.assertRaises(ValueError, logger_reader.explain, "explain")
+
+    def test_counting_by_handler(self):
+        sqlite_handler = SQLiteHandler(
+            os.path.join(self.directory.name, "log.sqlite"))
+        sqlite_handler.persist_logs(get_entries())
+        counts, profile = ProfilLoggerReader(sqlite_handler).explain(
+            "count_by_level")
+
+        self.assertDictEqual({LogLevelValue.INFO: 10,
+                              LogLevelValue.ERROR: 10}, counts)
+        self.assertEqual(0, profile.entries_scanned)
+        self.assertListEqual(["count", "collect"], list(profile.stages))
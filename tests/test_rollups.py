@@ -0,0 +1,262 @@
+import datetime
+import os
+import sqlite3
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from profil_logger import BinaryHandler, CSVHandler, FileHandler, \
+    JsonHandler, JsonLinesHandler, LogEntry, LogLevelValue, \
+    ProfilLoggerReader, SQLiteHandler
+from profil_logger.rollups import RollupFile, covers_whole_buckets, \
+    get_bucket_bounds
+
+
+def get_entries():
+    return [LogEntry(date=datetime.datetime(2020, month, day, hour, minute),
+                     level=level, msg="message")
+            for month, day, hour, minute, level in [
+                (1, 1, 10, 0, LogLevelValue.INFO),
+                (1, 1, 10, 59, LogLevelValue.ERROR),
+                (1, 1, 11, 30, LogLevelValue.INFO),
+                (1, 31, 23, 59, LogLevelValue.DEBUG),
+                (2, 1, 0, 0, LogLevelValue.INFO)]]
+
+
+class Buckets(TestCase):
+    def test_bucket_bounds(self):
+        date = datetime.datetime(2020, 2, 10, 11, 30, 15, 7)
+
+        self.assertTupleEqual(
+            (datetime.datetime(2020, 2, 10, 11),
+             datetime.datetime(2020, 2, 10, 11, 59, 59, 999999)),
+            get_bucket_bounds(date, "hour"))
+        self.assertTupleEqual(
+            (datetime.datetime(2020, 2, 1),
+             datetime.datetime(2020, 2, 29, 23, 59, 59, 999999)),
+            get_bucket_bounds(date, "month"))
+
+    def test_whole_buckets(self):
+        self.assertTrue(covers_whole_buckets(
+            "hour", datetime.datetime(2020, 1, 1, 10),
+            datetime.datetime(2020, 1, 1, 10, 59, 59, 999999)))
+        self.assertTrue(covers_whole_buckets("minute", None, None))
+        self.assertFalse(covers_whole_buckets(
+            "hour", None, datetime.datetime(2020, 1, 1, 11)))
+
+
+class FileRollups(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, "log")
+        self.entries = get_entries()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_counting_from_rollups(self):
+        """
+        Entries should be counted without reading them.
+        """
+        for handler_class in [FileHandler, CSVHandler, JsonLinesHandler,
+                              JsonHandler, BinaryHandler]:
+            with self.subTest(handler_class=handler_class.__name__):
+                file_path = f"{self.file_path}.{handler_class.__name__}"
+                handler = handler_class(file_path, rollups="hour")
+                handler.persist_log(self.entries[0])
+                handler.persist_logs(self.entries[1:])
+                logger_reader = ProfilLoggerReader(handler)
+
+                with patch.object(handler, "iter_logs") as mock_iter_logs:
+                    level_counts = logger_reader.count_by_level()
+                    month_counts = logger_reader.count_by_month(
+                        end_date=datetime.datetime(2020, 1, 31, 23, 59, 59,
+                                                   999999))
+                    buckets = logger_reader.count_by_bucket("day")
+                mock_iter_logs.assert_not_called()
+
+                self.assertDictEqual({LogLevelValue.DEBUG: 1,
+                                      LogLevelValue.INFO: 3,
+                                      LogLevelValue.ERROR: 1}, level_counts)
+                self.assertDictEqual({"2020-01": 4}, month_counts)
+                self.assertDictEqual(
+                    {"2020-01-01": {LogLevelValue.INFO: 2,
+                                    LogLevelValue.ERROR: 1},
+                     "2020-01-31": {LogLevelValue.DEBUG: 1},
+                     "2020-02-01": {LogLevelValue.INFO: 1}}, buckets)
+
+    def test_counting_partial_buckets(self):
+        """
+        Periods not covering whole buckets should be counted by reading
+        entries.
+        """
+        handler = FileHandler(self.file_path, rollups="hour")
+        handler.persist_logs(self.entries)
+
+        self.assertIsNone(handler.count_logs(
+            "level", start_date=datetime.datetime(2020, 1, 1, 10, 30)))
+        self.assertDictEqual(
+            {LogLevelValue.ERROR: 1, LogLevelValue.INFO: 1},
+            ProfilLoggerReader(handler).count_by_level(
+                start_date=datetime.datetime(2020, 1, 1, 10, 30),
+                end_date=datetime.datetime(2020, 1, 2)))
+
+    def test_buckets_overlapping_period(self):
+        """
+        Rollups and reading entries should count the same (whole) buckets.
+        """
+        handler = FileHandler(self.file_path, rollups="minute")
+        handler.persist_logs(self.entries)
+        start_date = datetime.datetime(2020, 1, 1, 10, 30)
+        end_date = datetime.datetime(2020, 1, 31, 12)
+        buckets = ProfilLoggerReader(handler).count_by_bucket(
+            "hour", start_date, end_date)
+        counted_buckets = ProfilLoggerReader(
+            FileHandler(self.file_path)).count_by_bucket(
+            "hour", start_date, end_date)
+
+        self.assertDictEqual({"2020-01-01T10": {LogLevelValue.INFO: 1,
+                                                LogLevelValue.ERROR: 1},
+                              "2020-01-01T11": {LogLevelValue.INFO: 1}},
+                             buckets)
+        self.assertDictEqual(buckets, counted_buckets)
+
+    def test_rollups_of_existing_log(self):
+        """
+        Rollups should be built of entries written before they were
+        enabled.
+        """
+        FileHandler(self.file_path).persist_logs(self.entries[:4])
+        handler = FileHandler(self.file_path, rollups="day")
+        handler.persist_log(self.entries[4])
+
+        self.assertDictEqual({"2020-01": 4, "2020-02": 1},
+                             handler.count_logs("month"))
+
+    def test_replaced_log(self):
+        handler = FileHandler(self.file_path, rollups="day")
+        handler.persist_logs(self.entries)
+        os.remove(self.file_path)
+        FileHandler(self.file_path).persist_logs(self.entries[3:])
+
+        self.assertIsNone(handler.count_logs("level"))
+        self.assertDictEqual(
+            {LogLevelValue.DEBUG: 1, LogLevelValue.INFO: 1},
+            ProfilLoggerReader(handler).count_by_level())
+
+    def test_recreated_log(self):
+        """
+        Rollups shouldn't be used for a log deleted and created again -
+        with the same first bytes (e.g. a CSV header), and likely the same
+        inode.
+        """
+        for handler_class in [CSVHandler, JsonHandler, BinaryHandler]:
+            with self.subTest(handler_class=handler_class.__name__):
+                file_path = f"{self.file_path}.{handler_class.__name__}"
+                handler = handler_class(file_path, rollups="hour")
+                handler.persist_logs(self.entries)
+                os.remove(file_path)
+                # by a handler without rollups, which leaves the sidecar
+                handler_class(file_path).persist_logs(self.entries[3:])
+                level_counts = handler.count_logs("level")
+                handler.persist_log(self.entries[0])
+
+                self.assertIsNone(level_counts)
+                self.assertDictEqual({LogLevelValue.DEBUG: 1,
+                                      LogLevelValue.INFO: 2},
+                                     handler.count_logs("level"))
+
+    def test_compaction(self):
+        """
+        Records appended on writes should be merged when they accumulate.
+        """
+        handler = FileHandler(self.file_path, rollups="day")
+        with patch.object(RollupFile, "compaction_threshold", 4):
+            for _ in range(10):
+                handler.persist_logs(self.entries)
+        reading_handler = FileHandler(self.file_path, rollups="day")
+
+        self.assertLess(os.path.getsize(f"{self.file_path}.rollups"), 250)
+        self.assertDictEqual({LogLevelValue.DEBUG: 10,
+                              LogLevelValue.INFO: 30,
+                              LogLevelValue.ERROR: 10},
+                             reading_handler.count_logs("level"))
+
+    def test_bulk_loading_json_log(self):
+        """
+        Rollups should count all the entries of a JSON log rewritten by
+        bulk_load(), and be kept up to date afterwards.
+        """
+        handler = JsonHandler(self.file_path, rollups="hour")
+        handler.bulk_load((entry for _ in range(1000)
+                           for entry in self.entries), batch_size=1000)
+        handler.persist_log(self.entries[0])
+        logger_reader = ProfilLoggerReader(JsonHandler(self.file_path,
+                                                       rollups="hour"))
+
+        with patch.object(JsonHandler, "iter_logs") as mock_iter_logs:
+            level_counts = logger_reader.count_by_level()
+        mock_iter_logs.assert_not_called()
+        self.assertDictEqual({LogLevelValue.DEBUG: 1000,
+                              LogLevelValue.INFO: 3001,
+                              LogLevelValue.ERROR: 1000}, level_counts)
+
+    def test_unknown_resolution(self):
+        self.assertRaises(ValueError, FileHandler, self.file_path,
+                          rollups="second")
+        self.assertRaises(ValueError,
+                          ProfilLoggerReader(FileHandler(self.file_path))
+                          .count_by_bucket, "second")
+
+
+class SQLiteRollups(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.directory.name, "log.sqlite")
+        self.entries = get_entries()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_counting_from_rollups(self):
+        sqlite_handler = SQLiteHandler(self.database_path, rollups="hour")
+        sqlite_handler.persist_log(self.entries[0])
+        sqlite_handler.persist_logs(self.entries[1:])
+        logger_reader = ProfilLoggerReader(sqlite_handler)
+
+        self.statements = []
+        with patch.object(sqlite_handler, "_get_conn",
+                          self.get_traced_connection):
+            month_counts = logger_reader.count_by_month(
+                start_date=datetime.datetime(2020, 1, 1, 11))
+            buckets = logger_reader.count_by_bucket(
+                "month", end_date=datetime.datetime(2020, 1, 1))
+
+        self.assertDictEqual({"2020-01": 2, "2020-02": 1}, month_counts)
+        self.assertDictEqual({"2020-01": {LogLevelValue.DEBUG: 1,
+                                          LogLevelValue.INFO: 2,
+                                          LogLevelValue.ERROR: 1}}, buckets)
+        self.assertTrue(all("log_hour_rollups" in statement
+                            for statement in self.statements))
+
+    def get_traced_connection(self):
+        connection = sqlite3.connect(self.database_path)
+        connection.set_trace_callback(self.statements.append)
+        return connection
+
+    def test_rollups_of_existing_table(self):
+        SQLiteHandler(self.database_path).persist_logs(self.entries)
+        sqlite_handler = SQLiteHandler(self.database_path, rollups="day")
+
+        self.assertDictEqual({LogLevelValue.DEBUG: 1,
+                              LogLevelValue.INFO: 3,
+                              LogLevelValue.ERROR: 1},
+                             sqlite_handler.count_logs("level"))
+
+    def test_dropping_partitions(self):
+        sqlite_handler = SQLiteHandler(self.database_path,
+                                       partition_by="month", rollups="day")
+        sqlite_handler.persist_logs(self.entries)
+        sqlite_handler.drop_partitions_before(datetime.datetime(2020, 2, 1))
+
+        self.assertDictEqual({"2020-02": 1},
+                             sqlite_handler.count_logs("month"))
@@ -0,0 +1,139 @@
+import datetime
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from profil_logger import FileHandler, LogCursor, LogEntry, LogLevelValue, \
+    ProfilLoggerReader, SegmentedHandler
+from profil_logger.segments import Segment
+
+
+class SegmentedLog(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.segments_path = os.path.join(self.directory.name, "segments")
+        self.handler = SegmentedHandler(self.segments_path, block_size=4)
+        # January and February entries, the same messages repeated
+        self.entries = [
+            LogEntry(date=datetime.datetime(2024, 1 + i // 6, 1 + i, 12),
+                     level=list(LogLevelValue)[i % 3],
+                     msg=f"message {i % 4}")
+            for i in range(12)]
+        self.dicts = [entry.to_dict() for entry in self.entries]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_dicts(self, entries):
+        return [entry.to_dict() for entry in entries]
+
+    def test_compaction(self):
+        """
+        Entries should be read the same before and after compaction, also
+        from several segments and the hot handler at once.
+        """
+        self.handler.persist_logs(self.entries[:5])
+        before_compaction = self.get_dicts(self.handler.iter_logs())
+        compacted_count = self.handler.compact()
+        self.handler.persist_logs(self.entries[5:10])
+        self.handler.compact()
+        self.handler.persist_logs(self.entries[10:])
+
+        self.assertEqual(5, compacted_count)
+        self.assertListEqual(self.dicts[:5], before_compaction)
+        self.assertListEqual(self.dicts,
+                             self.get_dicts(self.handler.iter_logs()))
+        self.assertListEqual(
+            self.dicts[::-1],
+            self.get_dicts(self.handler.iter_logs(newest_first=True)))
+        self.assertListEqual(
+            ["hot-000003.log", "segment-000001.seg", "segment-000002.seg"],
+            sorted(os.listdir(self.segments_path)))
+
+    def test_reopening(self):
+        self.handler.persist_logs(self.entries[:6])
+        self.handler.compact()
+        self.handler.persist_logs(self.entries[6:])
+        reopened_handler = SegmentedHandler(self.segments_path)
+
+        self.assertListEqual(self.dicts, self.get_dicts(
+            reopened_handler.retrieve_all_logs()))
+
+    def test_cursor_after_compaction(self):
+        """
+        Cursors of hot entries should stay valid after they're compacted.
+        """
+        self.handler.persist_logs(self.entries)
+        cursor = LogCursor.from_entry(list(self.handler.iter_logs())[6])
+        self.handler.compact()
+
+        self.assertListEqual(self.dicts[7:], self.get_dicts(
+            self.handler.iter_logs(after=cursor)))
+        self.assertListEqual(self.dicts[5::-1], self.get_dicts(
+            self.handler.iter_logs(newest_first=True, after=cursor)))
+
+    def test_hints(self):
+        self.handler.persist_logs(self.entries)
+        self.handler.compact()
+        by_date = self.handler.iter_logs(
+            start_date=self.entries[3].date, end_date=self.entries[8].date)
+        by_level = self.handler.iter_logs(levels=[LogLevelValue.WARNING])
+        by_text = self.handler.iter_logs(contains="message 3")
+
+        self.assertListEqual(self.dicts[3:9], self.get_dicts(by_date))
+        self.assertListEqual(self.dicts[2::3], self.get_dicts(by_level))
+        self.assertListEqual(self.dicts[3::4], self.get_dicts(by_text))
+
+    def test_pruning_blocks(self):
+        """
+        Blocks outside of the period shouldn't be read.
+        """
+        self.handler.persist_logs(self.entries)
+        self.handler.compact()
+        with patch.object(Segment, "read_column",
+                          autospec=True,
+                          side_effect=Segment.read_column) as read_column:
+            list(self.handler.iter_logs(start_date=self.entries[9].date))
+
+        read_blocks = {id(call.args[1]) for call
+                       in read_column.call_args_list}
+        self.assertEqual(1, len(read_blocks))
+
+    def test_counting(self):
+        """
+        Entries should be counted from zone maps of the blocks within
+        the period, and the hot handler.
+        """
+        self.handler.persist_logs(self.entries[:8])
+        self.handler.compact()
+        self.handler.persist_logs(self.entries[8:])
+        reader = ProfilLoggerReader(self.handler)
+
+        with patch.object(Segment, "read_column",
+                          autospec=True,
+                          side_effect=Segment.read_column) as read_column:
+            level_counts = reader.count_by_level()
+            month_counts = reader.count_by_month()
+        self.assertEqual(0, read_column.call_count)
+        self.assertDictEqual({LogLevelValue.DEBUG: 4,
+                              LogLevelValue.INFO: 4,
+                              LogLevelValue.WARNING: 4}, level_counts)
+        self.assertDictEqual({"2024-01": 6, "2024-02": 6}, month_counts)
+        # the period starts inside the second block
+        self.assertDictEqual(
+            {"2024-01": 1, "2024-02": 6},
+            reader.count_by_month(start_date=self.entries[5].date))
+
+    def test_text_hot_handler(self):
+        """
+        Any handler writing to a file can be the hot handler.
+        """
+        handler = SegmentedHandler(
+            os.path.join(self.directory.name, "text"),
+            hot_handler_factory=FileHandler)
+        handler.persist_logs(self.entries[:6])
+        handler.compact()
+        handler.persist_logs(self.entries[6:])
+
+        self.assertListEqual(self.dicts,
+                             self.get_dicts(handler.iter_logs()))
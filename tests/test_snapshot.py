@@ -0,0 +1,86 @@
+import datetime
+import multiprocessing
+import os
+import tempfile
+from unittest import TestCase
+from profil_logger import CSVHandler, LogCursor, LogEntry, LogLevelValue, \
+    ProfilLoggerReader, SharedSnapshotHandler
+
+
+def count_in_worker(name, results):
+    snapshot = SharedSnapshotHandler(name)
+    logger_reader = ProfilLoggerReader(snapshot)
+    results.put((logger_reader.count_by_level(),
+                 [entry.message for entry
+                  in logger_reader.find_by_text("message 1")]))
+    snapshot.close()
+
+
+class SharedSnapshot(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = CSVHandler(os.path.join(self.directory.name,
+                                              "log.csv"))
+        self.entries = [
+            LogEntry(date=datetime.datetime(2024, 1 + i // 6, 1 + i, 12),
+                     level=list(LogLevelValue)[i % 3],
+                     msg=f"message {i}")
+            for i in range(12)]
+        self.source.persist_logs(self.entries)
+        self.name = f"profil-logger-test-{os.getpid()}"
+        self.snapshot = SharedSnapshotHandler(self.name, source=self.source,
+                                              block_size=5)
+
+    def tearDown(self):
+        self.snapshot.close()
+        self.snapshot.unlink()
+        self.directory.cleanup()
+
+    def test_reading_attached_snapshot(self):
+        attached_snapshot = SharedSnapshotHandler(self.name)
+        logger_reader = ProfilLoggerReader(attached_snapshot)
+        entries = list(attached_snapshot.iter_logs())
+        page = logger_reader.find_by_text("message", limit=3,
+                                          newest_first=True)
+
+        self.assertListEqual([entry.to_dict() for entry in self.entries],
+                             [entry.to_dict() for entry in entries])
+        self.assertListEqual(list(range(12)),
+                             [entry.entry_id for entry in entries])
+        self.assertListEqual(
+            ["message 8", "message 7", "message 6"],
+            [entry.message for entry in logger_reader.find_by_text(
+                "message", limit=3, newest_first=True,
+                after=LogCursor.from_entry(page[-1]))])
+        self.assertListEqual(
+            ["message 5", "message 9"],
+            [entry.message for entry in logger_reader.find_by_regex(
+                "[59]$", start_date=datetime.datetime(2024, 1, 5))])
+        self.assertDictEqual({"2024-01": 6, "2024-02": 6},
+                             logger_reader.count_by_month())
+        self.assertRaises(NotImplementedError, attached_snapshot.persist_log,
+                          self.entries[0])
+        self.assertRaises(ValueError, attached_snapshot.unlink)
+        attached_snapshot.close()
+        self.assertRaises(ValueError, attached_snapshot.iter_logs)
+        # the creator still reads the snapshot
+        self.assertEqual(12, len(self.snapshot.retrieve_all_logs()))
+
+    def test_reading_snapshot_in_other_processes(self):
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        workers = [context.Process(target=count_in_worker,
+                                   args=(self.name, results))
+                   for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        worker_results = [results.get(timeout=30) for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        for counts, messages in worker_results:
+            self.assertDictEqual(
+                {LogLevelValue.DEBUG: 4, LogLevelValue.INFO: 4,
+                 LogLevelValue.WARNING: 4}, counts)
+            self.assertListEqual(["message 1", "message 10", "message 11"],
+                                 messages)
@@ -1,9 +1,12 @@
 import datetime
+import itertools
+import os
 import sqlite3
+import tempfile
 from typing import List, Tuple
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
-from profil_logger import LogEntry, LogLevelValue, SQLiteHandler
+from profil_logger import LogCursor, LogEntry, LogLevelValue, SQLiteHandler
 from tests.fake_data import fake_log_entry
 
 
@@ -56,6 +59,17 @@ class LogHandler(TestCase):
         mock_cursor.execute.assert_any_call(
             self.add_row_sql, self.add_row_parameter)
 
+    def test_persisting_logs(self, sqlite_connect):
+        """
+        It should insert a batch of entries with a single executemany().
+        """
+        mock_cursor = get_mock_db_cursor(sqlite_connect)
+        sqlite_handler = SQLiteHandler(self.database_path, self.table_name)
+        sqlite_handler.persist_logs([self.log_entry, self.log_entry])
+
+        mock_cursor.executemany.assert_called_once_with(
+            self.add_row_sql, [self.add_row_parameter] * 2)
+
 
 class LogRetrieval(TestCase):
     @classmethod
@@ -137,6 +151,46 @@ class LogRetrieval(TestCase):
         return connect_mock
 
 
+class IteratingLogs(TestCase):
+    """
+    Streaming entries from a database (not mocked) with keyset pagination.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.sqlite_handler = SQLiteHandler(
+            os.path.join(self.directory.name, "log.sqlite"))
+        self.dates = [datetime.datetime(2020, 1, day) for day in (3, 1, 2)]
+        for date in self.dates:
+            self.sqlite_handler.persist_log(LogEntry(
+                date=date, level=LogLevelValue.INFO, msg="message"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_newest_first(self):
+        received_dates = [entry.date for entry in
+                          self.sqlite_handler.iter_logs(newest_first=True)]
+
+        self.assertListEqual(sorted(self.dates, reverse=True), received_dates)
+
+    def test_cursor(self):
+        newest_entry = next(self.sqlite_handler.iter_logs(newest_first=True))
+        cursor = LogCursor.from_entry(newest_entry)
+        received_dates = [entry.date for entry in
+                          self.sqlite_handler.iter_logs(newest_first=True,
+                                                        after=cursor)]
+
+        self.assertListEqual(sorted(self.dates, reverse=True)[1:],
+                             received_dates)
+
+    def test_date_boundaries(self):
+        received_dates = [entry.date for entry in
+                          self.sqlite_handler.iter_logs(
+                              start_date=datetime.datetime(2020, 1, 2))]
+
+        self.assertListEqual(sorted(self.dates)[1:], received_dates)
+
+
 def get_mock_db_cursor(connect_mock):
     mock_cursor = MagicMock()
     mock_connection = MagicMock()
@@ -158,3 +212,222 @@ def get_fake_entries(number_of_entries: range):
                      fake_entry[0]["level"],
                      fake_entry[0]["message"],)]
     return entries
+
+
+class CountingLogs(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.sqlite_handler = SQLiteHandler(
+            os.path.join(self.directory.name, "log.sqlite"))
+        self.sqlite_handler.persist_logs([
+            LogEntry(date=datetime.datetime(2020, month, 1),
+                     level=level, msg="message")
+            for month, level in [(1, LogLevelValue.INFO),
+                                 (1, LogLevelValue.ERROR),
+                                 (2, LogLevelValue.INFO),
+                                 (3, LogLevelValue.DEBUG)]])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_counting_by_level(self):
+        counts = self.sqlite_handler.count_logs(
+            "level", end_date=datetime.datetime(2020, 2, 1))
+
+        self.assertDictEqual({LogLevelValue.INFO: 2, LogLevelValue.ERROR: 1},
+                             counts)
+
+    def test_counting_by_month(self):
+        counts = self.sqlite_handler.count_logs(
+            "month", start_date=datetime.datetime(2020, 2, 1))
+
+        self.assertDictEqual({"2020-02": 1, "2020-03": 1}, counts)
+
+    def test_levels_hint(self):
+        entries = self.sqlite_handler.iter_logs(
+            levels=[LogLevelValue.DEBUG, LogLevelValue.ERROR])
+
+        self.assertListEqual([LogLevelValue.ERROR, LogLevelValue.DEBUG],
+                             [entry.level for entry in entries])
+
+
+class DictionaryEncoding(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.directory.name, "log.sqlite")
+        self.sqlite_handler = SQLiteHandler(self.database_path,
+                                            dictionary_encoded=True)
+        self.entries = [
+            LogEntry(date=datetime.datetime(2020, 1, 1, 10, i),
+                     level=LogLevelValue.WARNING,
+                     msg=f"message {i % 2}")
+            for i in range(6)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_messages_stored_once(self):
+        self.sqlite_handler.persist_log(self.entries[0])
+        self.sqlite_handler.persist_logs(self.entries[1:])
+        connection = sqlite3.connect(self.database_path)
+        messages = connection.execute(
+            "SELECT message FROM log_messages").fetchall()
+        connection.close()
+
+        self.assertCountEqual([("message 0",), ("message 1",)], messages)
+
+    def test_reading_entries(self):
+        self.sqlite_handler.persist_logs(self.entries)
+        received_entries = list(self.sqlite_handler.iter_logs(
+            newest_first=True,
+            start_date=datetime.datetime(2020, 1, 1, 10, 2)))
+
+        self.assertListEqual(
+            [entry.to_dict() for entry in self.entries[:1:-1]],
+            [entry.to_dict() for entry in received_entries])
+        self.assertListEqual(
+            [entry.to_dict() for entry in self.entries],
+            [entry.to_dict()
+             for entry in self.sqlite_handler.retrieve_all_logs()])
+
+    def test_read_messages_shared(self):
+        self.sqlite_handler.persist_logs(self.entries)
+        received_entries = list(self.sqlite_handler.iter_logs())
+
+        self.assertIs(received_entries[0].message,
+                      received_entries[2].message)
+
+    def test_existing_table_layout_kept(self):
+        SQLiteHandler(self.database_path, "plain_log").persist_logs(
+            self.entries)
+        sqlite_handler = SQLiteHandler(self.database_path, "plain_log",
+                                       dictionary_encoded=True)
+
+        self.assertFalse(sqlite_handler.dictionary_encoded)
+        self.assertEqual(len(self.entries),
+                         len(sqlite_handler.retrieve_all_logs()))
+
+
+class PartitionedTables(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.directory.name, "log.sqlite")
+        self.sqlite_handler = SQLiteHandler(self.database_path,
+                                            partition_by="month")
+        self.entries = [
+            LogEntry(date=datetime.datetime(2020, month, day, 10),
+                     level=level, msg=f"message {month}-{day}")
+            for month, day, level in [(1, 1, LogLevelValue.INFO),
+                                      (1, 31, LogLevelValue.ERROR),
+                                      (2, 15, LogLevelValue.INFO),
+                                      (3, 1, LogLevelValue.DEBUG)]]
+        self.sqlite_handler.persist_log(self.entries[0])
+        self.sqlite_handler.persist_logs(self.entries[1:])
+        self.statements: List[str] = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_tables(self) -> List[str]:
+        connection = sqlite3.connect(self.database_path)
+        tables = connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "ORDER BY name").fetchall()
+        connection.close()
+        return [name for (name,) in tables]
+
+    def get_traced_connection(self):
+        connection = sqlite3.connect(self.database_path)
+        connection.set_trace_callback(self.statements.append)
+        return connection
+
+    def test_partition_tables(self):
+        self.assertListEqual(["log_2020_01", "log_2020_02", "log_2020_03"],
+                             self.get_tables())
+
+    def test_reading_partitions(self):
+        self.assertListEqual(
+            [entry.to_dict() for entry in self.entries],
+            [entry.to_dict() for entry in self.sqlite_handler.iter_logs()])
+        self.assertListEqual(
+            [entry.to_dict() for entry in self.entries[::-1]],
+            [entry.to_dict() for entry
+             in self.sqlite_handler.iter_logs(newest_first=True)])
+        self.assertListEqual(
+            [entry.to_dict() for entry in self.entries],
+            [entry.to_dict()
+             for entry in self.sqlite_handler.retrieve_all_logs()])
+
+    def test_pagination(self):
+        first_page = list(itertools.islice(
+            self.sqlite_handler.iter_logs(), 2))
+        next_page = self.sqlite_handler.iter_logs(
+            after=LogCursor.from_entry(first_page[-1]))
+
+        self.assertListEqual(["message 2-15", "message 3-1"],
+                             [entry.message for entry in next_page])
+
+    def test_partition_pruning(self):
+        """
+        Only partitions overlapping the searched period should be read.
+        """
+        with patch.object(self.sqlite_handler, "_get_conn",
+                          self.get_traced_connection):
+            entries = list(self.sqlite_handler.iter_logs(
+                start_date=datetime.datetime(2020, 2, 1),
+                end_date=datetime.datetime(2020, 2, 28)))
+        selects = [statement for statement in self.statements
+                   if statement.startswith("SELECT id")]
+
+        self.assertListEqual(["message 2-15"],
+                             [entry.message for entry in entries])
+        self.assertEqual(1, len(selects))
+        self.assertIn("log_2020_02", selects[0])
+
+    def test_counting_partitions(self):
+        self.assertDictEqual(
+            {"2020-01": 2, "2020-02": 1},
+            self.sqlite_handler.count_logs(
+                "month", end_date=datetime.datetime(2020, 2, 28)))
+        self.assertDictEqual(
+            {LogLevelValue.INFO: 2, LogLevelValue.ERROR: 1,
+             LogLevelValue.DEBUG: 1},
+            self.sqlite_handler.count_logs("level"))
+
+    def test_dropping_partitions(self):
+        dropped = self.sqlite_handler.drop_partitions_before(
+            datetime.datetime(2020, 2, 10))
+
+        self.assertListEqual(["log_2020_01"], dropped)
+        self.assertListEqual(["log_2020_02", "log_2020_03"],
+                             self.get_tables())
+        self.assertListEqual(
+            ["message 2-15", "message 3-1"],
+            [entry.message for entry in self.sqlite_handler.iter_logs()])
+
+    def test_writing_into_dropped_partition(self):
+        self.sqlite_handler.drop_partitions_before(
+            datetime.datetime(2020, 2, 10))
+        self.sqlite_handler.persist_log(self.entries[0])
+
+        self.assertIn("log_2020_01", self.get_tables())
+        self.assertListEqual(
+            ["message 1-1", "message 2-15", "message 3-1"],
+            [entry.message for entry in self.sqlite_handler.iter_logs()])
+
+    def test_daily_dictionary_encoded_partitions(self):
+        sqlite_handler = SQLiteHandler(self.database_path, "daily_log",
+                                       dictionary_encoded=True,
+                                       partition_by="day")
+        sqlite_handler.persist_logs(self.entries[:2])
+        sqlite_handler.drop_partitions_before(datetime.datetime(2020, 1, 2))
+
+        self.assertIn("daily_log_2020_01_31_messages", self.get_tables())
+        self.assertNotIn("daily_log_2020_01_01_messages", self.get_tables())
+        self.assertListEqual(
+            ["message 1-31"],
+            [entry.message for entry in sqlite_handler.iter_logs()])
+
+    def test_unknown_partitioning(self):
+        self.assertRaises(ValueError, SQLiteHandler, self.database_path,
+                          partition_by="year")
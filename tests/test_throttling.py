@@ -0,0 +1,95 @@
+from unittest import TestCase
+from unittest.mock import patch
+from profil_logger import LogLevelValue, ProfilLogger
+from profil_logger.throttling import DuplicateSuppressor, TokenBucket
+from tests.fake_data import RecordingHandler
+
+
+class Throttling(TestCase):
+    def setUp(self):
+        self.handler = RecordingHandler()
+        self.profil_logger = ProfilLogger([self.handler])
+
+    def get_messages(self):
+        return [entry.message for entry in self.handler.entries]
+
+    def test_suppressing_duplicates(self):
+        self.profil_logger.set_duplicate_suppression(True)
+        for _ in range(5):
+            self.profil_logger.error("disk %s full", "/dev/sda")
+        self.profil_logger.error("disk %s full", "/dev/sdb")
+        self.profil_logger.info("recovered")
+        self.profil_logger.info("recovered")
+        self.profil_logger.flush()
+
+        self.assertListEqual(["disk /dev/sda full",
+                              "previous message repeated 4 times",
+                              "disk /dev/sdb full",
+                              "recovered",
+                              "previous message repeated 1 times"],
+                             self.get_messages())
+        self.assertEqual(LogLevelValue.ERROR, self.handler.entries[1].level)
+        stats = self.profil_logger.stats()
+        self.assertEqual(4, stats["suppressed"][LogLevelValue.ERROR])
+        self.assertEqual(1, stats["suppressed"][LogLevelValue.INFO])
+
+    @patch("profil_logger.throttling.time.monotonic")
+    def test_summarizing_long_bursts(self, mock_monotonic):
+        suppressor = DuplicateSuppressor(window=10.0)
+        mock_monotonic.return_value = 0.0
+        self.assertTupleEqual((True, None), suppressor.check(
+            LogLevelValue.ERROR, "failed", ()))
+        for _ in range(3):
+            self.assertTupleEqual((False, None), suppressor.check(
+                LogLevelValue.ERROR, "failed", ()))
+        mock_monotonic.return_value = 10.0
+
+        self.assertTupleEqual(
+            (False, (LogLevelValue.ERROR, 3)),
+            suppressor.check(LogLevelValue.ERROR, "failed", ()))
+        self.assertTupleEqual((LogLevelValue.ERROR, 1), suppressor.flush())
+        self.assertIsNone(suppressor.flush())
+
+    @patch("profil_logger.throttling.time.monotonic")
+    def test_token_bucket(self, mock_monotonic):
+        mock_monotonic.return_value = 0.0
+        bucket = TokenBucket(rate=2, burst=3)
+
+        self.assertListEqual([True, True, True, False],
+                             [bucket.consume() for _ in range(4)])
+        mock_monotonic.return_value = 1.0
+        self.assertListEqual([True, True, False],
+                             [bucket.consume() for _ in range(3)])
+        self.assertRaises(ValueError, TokenBucket, rate=0)
+
+    @patch("profil_logger.throttling.time.monotonic", return_value=0.0)
+    def test_rate_limit(self, *args):
+        self.profil_logger.set_rate_limit(LogLevelValue.WARNING, rate=1,
+                                          burst=2)
+        for i in range(5):
+            self.profil_logger.warning("warning %d", i)
+            self.profil_logger.info("info %d", i)
+
+        self.assertEqual(2, len([entry for entry in self.handler.entries
+                                 if entry.level == LogLevelValue.WARNING]))
+        self.assertEqual(5, len([entry for entry in self.handler.entries
+                                 if entry.level == LogLevelValue.INFO]))
+        self.assertEqual(3, self.profil_logger.stats()["rate_limited"][
+            LogLevelValue.WARNING])
+
+        self.profil_logger.set_rate_limit(LogLevelValue.WARNING, None)
+        self.profil_logger.warning("not limited")
+        self.assertEqual("not limited", self.get_messages()[-1])
+
+    def test_sampling(self):
+        self.profil_logger.set_sampling_rate(LogLevelValue.DEBUG, 0)
+        self.profil_logger.set_sampling_rate(LogLevelValue.INFO, 1)
+        for _ in range(10):
+            self.profil_logger.debug("debug")
+            self.profil_logger.info("info")
+
+        self.assertListEqual(["info"] * 10, self.get_messages())
+        self.assertEqual(10, self.profil_logger.stats()["sampled_out"][
+            LogLevelValue.DEBUG])
+        self.assertRaises(ValueError, self.profil_logger.set_sampling_rate,
+                          LogLevelValue.DEBUG, 1.5)
@@ -0,0 +1,135 @@
+import datetime
+import os
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import patch
+from profil_logger import CSVHandler, LogCursor, LogEntry, LogLevelValue, \
+    ProfilLoggerReader, TieredHandler
+from profil_logger.segments import GENERATION_SHIFT
+
+
+class TieredLog(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.tiered_path = os.path.join(self.directory.name, "tiered")
+        self.handler = TieredHandler(self.tiered_path)
+        self.entries = [
+            LogEntry(date=datetime.datetime(2024, 1 + i // 6, 1 + i, 12),
+                     level=list(LogLevelValue)[i % 3],
+                     msg=f"message {i}")
+            for i in range(12)]
+        self.dicts = [entry.to_dict() for entry in self.entries]
+
+    def tearDown(self):
+        self.handler.close()
+        self.directory.cleanup()
+
+    def get_dicts(self, entries):
+        return [entry.to_dict() for entry in entries]
+
+    def test_reading_both_tiers(self):
+        self.handler.persist_logs(self.entries[:4])
+        compacted_count = self.handler.compact()
+        self.handler.persist_logs(self.entries[4:8])
+        self.handler.compact()
+        self.handler.persist_logs(self.entries[8:])
+
+        self.assertEqual(4, compacted_count)
+        self.assertListEqual(self.dicts,
+                             self.get_dicts(self.handler.iter_logs()))
+        self.assertListEqual(
+            self.dicts[::-1],
+            self.get_dicts(self.handler.iter_logs(newest_first=True)))
+        self.assertListEqual(["cold.sqlite", "hot-000003.log"],
+                             sorted(os.listdir(self.tiered_path)))
+        logger_reader = ProfilLoggerReader(self.handler)
+        self.assertListEqual(
+            ["message 5", "message 9"],
+            [entry.message for entry in logger_reader.find_by_regex(
+                "[59]$", start_date=datetime.datetime(2024, 1, 5))])
+        self.assertDictEqual(
+            {LogLevelValue.DEBUG: 4, LogLevelValue.INFO: 4,
+             LogLevelValue.WARNING: 4}, logger_reader.count_by_level())
+
+    def test_paginating_across_tiers(self):
+        self.handler.persist_logs(self.entries[:5])
+        logger_reader = ProfilLoggerReader(self.handler)
+        pages = [logger_reader.find_by_text("message", limit=3)]
+        # entries of the page are compacted before the next page is read
+        self.handler.compact()
+        self.handler.persist_logs(self.entries[5:])
+        while pages[-1]:
+            after = LogCursor.from_entry(pages[-1][-1])
+            pages.append(logger_reader.find_by_text("message", limit=3,
+                                                    after=after))
+        newest_page = logger_reader.find_by_text("message", limit=8,
+                                                 newest_first=True)
+
+        self.assertListEqual(self.dicts, [entry.to_dict() for page in pages
+                                          for entry in page])
+        self.assertListEqual(
+            self.dicts[:4][::-1], self.get_dicts(logger_reader.find_by_text(
+                "message", newest_first=True,
+                after=LogCursor.from_entry(newest_page[-1]))))
+
+    def test_interrupted_compaction(self):
+        """
+        Entries of a hot file already moved into the cold store (but not
+        removed) should be read once, and not moved again.
+        """
+        self.handler.persist_logs(self.entries[:6])
+        hot_path = os.path.join(self.tiered_path, "hot-000001.log")
+        with open(hot_path, "rb") as fh:
+            hot_file = fh.read()
+        self.handler.compact()
+        with open(hot_path, "wb") as fh:
+            fh.write(hot_file)
+        reopened_handler = TieredHandler(self.tiered_path)
+
+        self.assertListEqual(self.dicts[:6], self.get_dicts(
+            reopened_handler.iter_logs()))
+        self.assertEqual(0, reopened_handler.compact())
+        self.assertListEqual(self.dicts[:6], self.get_dicts(
+            reopened_handler.iter_logs()))
+        self.assertDictEqual(
+            {LogLevelValue.DEBUG: 2, LogLevelValue.INFO: 2,
+             LogLevelValue.WARNING: 2},
+            reopened_handler.count_logs("level"))
+
+    def test_hot_file_compacted_while_read(self):
+        """
+        Entries of a hot file compacted after a read listed the files
+        should be read from the cold store.
+        """
+        self.handler.persist_logs(self.entries)
+        hot_files = self.handler._list_hot_files()
+        self.handler.compact()
+        with patch.object(self.handler, "_list_hot_files",
+                          return_value=hot_files), \
+                patch.object(self.handler, "_get_last_compacted",
+                             return_value=0):
+            entries = list(self.handler.iter_logs())
+            newest_entries = list(self.handler.iter_logs(
+                newest_first=True, after=LogCursor.from_entry(entries[8])))
+
+        self.assertListEqual(self.dicts, self.get_dicts(entries))
+        self.assertListEqual(self.dicts[:8][::-1],
+                             self.get_dicts(newest_entries))
+        self.assertEqual(1, entries[0].entry_id >> GENERATION_SHIFT)
+
+    def test_background_compaction(self):
+        handler = TieredHandler(os.path.join(self.directory.name, "csv"),
+                                hot_handler_factory=CSVHandler,
+                                compaction_interval=0.01)
+        handler.persist_logs(self.entries)
+        deadline = time.monotonic() + 5
+        while handler.cold_handler.retrieve_all_logs() == [] \
+                and time.monotonic() < deadline:
+            time.sleep(0.01)
+        handler.close()
+
+        self.assertListEqual(self.dicts,
+                             self.get_dicts(handler.iter_logs()))
+        self.assertListEqual(self.dicts, self.get_dicts(
+            handler.cold_handler.retrieve_all_logs()))
@@ -0,0 +1,38 @@
+import datetime
+from unittest import TestCase
+from profil_logger.timestamps import format_timestamp, from_epoch_us, \
+    parse_timestamps, to_epoch_us
+
+
+class EpochConversion(TestCase):
+    def test_round_trip(self):
+        date = datetime.datetime(2025, 6, 22, 19, 20, 14, 521587)
+
+        self.assertEqual(date, from_epoch_us(to_epoch_us(date)))
+
+    def test_epoch(self):
+        self.assertEqual(0, to_epoch_us(datetime.datetime(1970, 1, 1)))
+
+    def test_dates_before_epoch(self):
+        date = datetime.datetime(1955, 3, 9, 11, 10, 10, 1)
+
+        self.assertEqual(date, from_epoch_us(to_epoch_us(date)))
+
+    def test_aware_dates(self):
+        date = datetime.datetime(
+            2025, 6, 22, 21, 20, 14, 521587,
+            tzinfo=datetime.timezone(datetime.timedelta(hours=2)))
+
+        self.assertEqual(datetime.datetime(2025, 6, 22, 19, 20, 14, 521587),
+                         from_epoch_us(to_epoch_us(date)))
+        self.assertEqual(0, to_epoch_us(datetime.datetime(
+            1970, 1, 1, tzinfo=datetime.timezone.utc)))
+
+
+class ParsingFormatting(TestCase):
+    def test_parsing_many(self):
+        dates = [datetime.datetime(2025, 6, 22, 19, 20, 14, 521587),
+                 datetime.datetime(2025, 6, 22, 19, 20, 15)]
+        timestamps = [format_timestamp(date) for date in dates]
+
+        self.assertListEqual(dates, parse_timestamps(timestamps))